@@ -53,9 +53,12 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 
     # What does your project relate to?
@@ -79,7 +82,7 @@ setup(
     ],
 
     #the required python version
-    python_requires='>=3',
+    python_requires='>=3.8',
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
@@ -87,7 +90,11 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
         'dev': ['check-manifest'],
-        'test': ['coverage'],
+        'test': ['coverage', 'pytest'],
+        'async': ['pyserial-asyncio'],
+        # Image.Resampling is new in Pillow 9.1, numpy.random.default_rng in NumPy 1.17
+        'images': ['Pillow>=9.1', 'numpy>=1.17'],
+        'emulator': ['Pillow>=9.1', 'numpy>=1.17'],
     },
 
     # If there are data files included in your packages that need to be
@@ -111,6 +118,8 @@ setup(
         ],
         'console_scripts': [
               'sixleds-cli = sixleds.sixleds_cli:main',
+              'sixledsd = sixleds.sixleds_daemon:main',
+              'sixleds-sim = sixleds.sixleds_simulator:main',
         ],
     },
 )
@@ -2,7 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import os, sys, serial, logging
-from time import sleep, localtime, strftime
+from collections import deque
+from functools import reduce
+from operator import xor
+import hashlib
+import json
+
+from .sixleds_graphic import encodegraphic, COLORS as GRAPHIC_COLORS
+from .sixleds_magic import compilemessage, TTABLE, PAGE_OVERHEAD
+from .sixleds_emulator import duration
+from time import sleep, localtime, strftime, monotonic
 from datetime import datetime
 import _pickle as pickle
 import platform
@@ -18,12 +27,35 @@ __website__   = 'https://github.com/schorschii/sixleds'
 
 __all__ = [__author__, __license__, __version__]
 
+# results of sixleds.readresponse()
+RESPONSE_ACK     = 'ACK'
+RESPONSE_NACK    = 'NACK'
+RESPONSE_TIMEOUT = 'TIMEOUT'
+RESPONSE_GARBAGE = 'GARBAGE'
+# not sent, the page has errors (see opage.compiled)
+RESPONSE_INVALID = 'INVALID'
+# not sent by a transmitter (see sixleds_transmit): a newer packet for the same
+# page replaced it, its deadline was over or it was cancelled
+RESPONSE_SUPERSEDED = 'SUPERSEDED'
+RESPONSE_EXPIRED    = 'EXPIRED'
+RESPONSE_CANCELLED  = 'CANCELLED'
+
+# sendmany() lets the replies catch up after this many windows of packets
+DRAIN = 4
+
+# serial line settings of a display, see sixleds.configure()
+SERIAL_DEFAULTS = {'baudrate': 9600, 'rtscts': False, 'timeout': 1.0, 'writetimeout': None}
+# tried by sixleds.probebaud(), fastest first
+BAUDRATES = (115200, 57600, 38400, 19200, 9600)
+
 
 class dt(datetime):
     ''' Datetime Subclass
     A datetime object with a special output for the display schedule
     '''
 
+    __slots__ = ()
+
     def sched(self):
         """Output the date in the format for the display.
 
@@ -36,6 +68,20 @@ class dt(datetime):
         return self.strftime("%y%m%d%H%M")
 
 
+class wirepacket(bytes):
+    ''' Packet Bytes
+    The packet of a page or schedule with its checksum, which is computed
+    from the checksum cached by the item (see opage.encoded), so sending or
+    resending it does not go through the bytes again (see sixleds.chsum)
+    '''
+
+    def __new__(cls, prefix, item):
+        data = item.encoded()
+        packet = super(wirepacket, cls).__new__(cls, prefix + data)
+        packet.parity = reduce(xor, prefix, item.parity)
+        return packet
+
+
 class oschedule():
     """An object to hold and modify a schedule definition
 
@@ -44,9 +90,8 @@ class oschedule():
     on the display
     """
 
-    active = True
-    changed = True
-    PP = ''
+    # no per-object dict, a controller may hold the schedules of many displays
+    __slots__ = ('st', 'en', 'PP', 'active', 'changed', 'wire', 'parity')
 
     def __init__(self, PP='', start='00', end='99'):
         """ Create a scedule
@@ -67,10 +112,24 @@ class oschedule():
         ------
         :obj: `oschedule`
         """
+        self.active = True
+        self.changed = True
+        self.wire = None
+        self.parity = 0
         self.st = self.date(start)
         self.en = self.date(end)
         self.PP = PP
 
+    def __setstate__(self, state):
+        # objects pickled by older versions have a dict instead of slots
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **state[1])
+        self.__init__(state.get('PP', ''), state.get('st', '00'), state.get('en', '99'))
+        for key, value in state.items():
+            setattr(self, key, value)
+        # encoded again with its checksum
+        self.wire = None
+
     def date(self, date=''):
         """Returns a dt object of the date enterd in display format
 
@@ -187,6 +246,9 @@ class oschedule():
         """
         r = self.changed
         self.changed = changed
+        if changed:
+            # the packet has to be encoded again
+            self.wire = None
         return r
 
     def packet(self):
@@ -201,58 +263,30 @@ class oschedule():
         """
         return self.st.sched() + self.en.sched() + self.PP
 
+    def encoded(self):
+        """Returns the packet as bytes, cached until the schedule is modified
+
+        The XOR of the bytes is cached in parity, see wirepacket.
+
+        Return
+        ------
+        bytes:
+            the packet as sent to the display
+        """
+        if self.wire is None:
+            self.wire = self.packet().encode('latin-1')
+            self.parity = reduce(xor, self.wire, 0)
+        return self.wire
 
 class opage():
     """A page for a line which can be displayed
 
     """
-    MM = ''
-    FX = ''
-    MX = ''
-    WX = ''
-    FY = ''
-    changed = True
-    ttable ={
-        ord('€'): '<U00>', ord('↑'): '<U01>', ord('↓'): '<U02>', ord('˥'): '<U03>',
-        ord('˦'): '<U04>', ord('˨'): '<U05>', ord('˩'): '<U06>', ord('└'): '<U07>',
-        ord('┴'): '<U08>', ord('├'): '<U09>', ord('┬'): '<U0A>', ord('─'): '<U0B>',
-        ord('┼'): '<U0C>', ord('┘'): '<U0D>', ord('┌'): '<U0E>', ord('█'): '<U0F>',
-
-        ord('▄'): '<U10>', ord('▌'): '<U11>', ord('▐'): '<U12>', ord('▀'): '<U13>',
-        ord('α'): '<U14>', ord('β'): '<U15>', ord('Γ'): '<U16>', ord('ä'): '<U17>',
-        ord('Σ'): '<U18>', ord('σ'): '<U19>', ord('μ'): '<U1A>', ord('τ'): '<U1B>',
-        ord('Φ'): '<U1C>', ord('≈'): '<U1D>', ord('Ω'): '<U1E>', ord('δ'): '<U1F>',
-
-        ord('∞'): '<U20>', ord('λ'): '<U21>', ord('¢'): '<U22>', ord('£'): '<U23>',
-        ord('♉'): '<U24>', ord('¥'): '<U25>', ord('→'): '<U26>', ord('←'): '<U27>',
-        ord('¿'): '<U28>', ord('©'): '<U29>', ord('ª'): '<U2A>', ord('≥'): '<U2B>',
-        ord('Ɛ'): '<U2C>', ord('∩'): '<U2D>', ord('®'): '<U2E>', ord('�'): '<U2F>',
-
-        ord('š'): '<U30>', ord('±'): '<U31>', ord('²'): '<U32>', ord('³'): '<U33>',
-        ord('ž'): '<U34>', ord('Ÿ'): '<U35>', ord('¶'): '<U36>', ord('ɶ'): '<U37>',
-        ord('Š'): '<U38>', ord('¹'): '<U39>', ord('⁰'): '<U3A>', ord('≤'): '<U3B>',
-        ord('¼'): '<U3C>', ord('½'): '<U3D>', ord('¤'): '<U3E>', ord('¿'): '<U3F>',
-
-        ord('À'): '<U40>', ord('Á'): '<U41>', ord('Â'): '<U42>', ord('Ã'): '<U43>',
-        ord('Ä'): '<U44>', ord('Å'): '<U45>', ord('Æ'): '<U46>', ord('Ç'): '<U47>',
-        ord('È'): '<U48>', ord('É'): '<U49>', ord('Ê'): '<U4A>', ord('Ë'): '<U4B>',
-        ord('Ì'): '<U4C>', ord('Í'): '<U4D>', ord('Î'): '<U4E>', ord('Ï'): '<U4F>',
-
-        ord('Ð'): '<U50>', ord('Ñ'): '<U51>', ord('Ò'): '<U52>', ord('Ó'): '<U53>',
-        ord('Ô'): '<U54>', ord('Õ'): '<U55>', ord('Ö'): '<U56>', ord('Ž'): '<U57>',
-        ord('Ø'): '<U58>', ord('Ù'): '<U59>', ord('Ú'): '<U5A>', ord('Û'): '<U5B>',
-        ord('Ü'): '<U5C>', ord('Ý'): '<U5D>', ord('Þ'): '<U5E>', ord('ß'): '<U5F>',
-
-        ord('à'): '<U60>', ord('á'): '<U61>', ord('â'): '<U62>', ord('ã'): '<U63>',
-        ord('ä'): '<U64>', ord('å'): '<U65>', ord('æ'): '<U66>', ord('ç'): '<U67>',
-        ord('è'): '<U68>', ord('é'): '<U69>', ord('ê'): '<U6A>', ord('ë'): '<U6B>',
-        ord('ì'): '<U6C>', ord('í'): '<U6D>', ord('î'): '<U6E>', ord('ï'): '<U6F>',
-
-        ord('ð'): '<U70>', ord('ñ'): '<U71>', ord('ò'): '<U72>', ord('ó'): '<U73>',
-        ord('ô'): '<U74>', ord('õ'): '<U75>', ord('ö'): '<U76>', ord('…'): '<U77>',
-        ord('ø'): '<U78>', ord('ù'): '<U79>', ord('ú'): '<U7A>', ord('û'): '<U7B>',
-        ord('ü'): '<U7C>', ord('ý'): '<U7D>', ord('þ'): '<U7E>', ord('ÿ'): '<U7F>',
-    }
+    # no per-object dict, a controller may hold the pages of many displays
+    __slots__ = ('MM', 'FX', 'MX', 'WX', 'FY', 'changed', 'wire', 'parity', 'code')
+
+    # chars which are sent as european chars <Uxx>
+    ttable = TTABLE
 
     def __init__(self, MM, FX='E', MX='Q', WX='A', FY='E'):
         """Create a page for a line
@@ -276,6 +310,15 @@ class opage():
         ------
         :obj: `opage`
         """
+        self.MM = ''
+        self.FX = ''
+        self.MX = ''
+        self.WX = ''
+        self.FY = ''
+        self.changed = True
+        self.wire = None
+        self.parity = 0
+        self.code = None
         self.leadin(FX)
         self.display(MX)
         self.wait(WX)
@@ -283,6 +326,15 @@ class opage():
         self.message(MM)
         self.modified()
 
+    def __setstate__(self, state):
+        # objects pickled by older versions have a dict instead of slots
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **state[1])
+        self.__init__('')
+        for key, value in state.items():
+            setattr(self, key, value)
+        # encoded again with its checksum
+        self.wire = None
 
     def leadin(self, FX=''):
         """Set the leadin animation for the page
@@ -395,6 +447,9 @@ class opage():
         """
         r = self.changed
         self.changed = changed
+        if changed:
+            # the packet has to be encoded again
+            self.wire = None
         return r
 
     def packet(self):
@@ -407,23 +462,242 @@ class opage():
         string:
             formatted packet string
         """
-        return '<F' + self.FX + '><M' + self.MX + '><W' + self.WX + '><F' + self.FY + '>' + self.MM.translate(self.ttable)
+        return '<F' + self.FX + '><M' + self.MX + '><W' + self.WX + '><F' + self.FY + '>' + self.compiled().text
+
+    def compiled(self):
+        """Returns the compiled message, cached until the message changes
+
+        Return
+        ------
+        :obj: 'sixleds_magic.compiledmessage'
+            the tokens, errors (with positions) and the optimized text of the message
+        """
+        if self.code is None or self.code.source != self.MM:
+            self.code = compilemessage(self.MM)
+        return self.code
+
+    @property
+    def saved(self):
+        """Number of bytes saved by leaving out magic strings which change nothing (see sixleds_magic.optimize)"""
+        return self.compiled().saved
+
+    def wirelength(self):
+        """Returns the number of bytes of the frame which sends the page, without encoding it"""
+        return PAGE_OVERHEAD + self.compiled().length
+
+    def estimate_duration(self, width=80):
+        """Returns the seconds the page occupies the display
+
+        The leading effect, wait time and lagging effect at the speed of the
+        display method, the scroll effects depend on the width of the message
+        (see sixleds_emulator.duration). Results are cached per message and
+        settings.
+
+        Parameters
+        ------
+        width: int, default=80
+            Number of LED columns of the display
+
+        Return
+        ------
+        float:
+            the estimated duration in seconds
+        """
+        return duration(self.MM, self.FX, self.MX, self.WX, self.FY, width)
+
+    def encoded(self):
+        """Returns the packet as bytes, cached until the page is modified
+
+        The XOR of the bytes is cached in parity, see wirepacket.
+
+        Return
+        ------
+        bytes:
+            the packet as sent to the display
+        """
+        if self.wire is None:
+            self.wire = self.packet().encode('latin-1')
+            self.parity = reduce(xor, self.wire, 0)
+        return self.wire
+
+
+class confstore():
+    """The on-disk config of a display
+
+    The config is kept in a JSON snapshot plus an append-only journal next to
+    it ('<path>.journal'). Single page or schedule changes are appended to the
+    journal, the snapshot is only rewritten when the journal grows too long.
+    The snapshot is replaced atomically, so a crash never loses the config;
+    an incomplete last journal entry is ignored on load.
+    """
+
+    VERSION = 1
+    # number of journal entries before the snapshot is rewritten
+    COMPACT = 200
+
+    def __init__(self, path):
+        """Create the store
+
+        Parameters
+        ------
+        path: string
+            The snapshot file, the journal is saved as path + '.journal'
+        """
+        self.path = path
+        self.journal = path + '.journal'
+        self.entries = 0
+
+    def load(self):
+        """Load the snapshot and replay the journal
+
+        Configs which were saved with pickle by older versions are converted.
+
+        Return
+        ------
+        dict
+            with the keys 'lines', 'schedules', 'defaultPage', 'shadow' and
+            optionally 'serial', 'spares' and 'shown', None if there is no config
+        """
+        state = None
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            if data[:1] == b'{':
+                state = json.loads(data)
+                if state.get('version', 0) > self.VERSION:
+                    raise ValueError('Config version %d is not supported' % state['version'])
+            else:
+                state = self.legacy(data)
+
+        self.entries = 0
+        if os.path.isfile(self.journal):
+            if state is None:
+                state = {'lines': {'1': {}}, 'schedules': {}, 'defaultPage': 'A', 'shadow': {}}
+            offset = 0
+            with open(self.journal, 'rb+') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # cut off the entry of an interrupted write, so new entries are readable
+                        logging.warning('Ignoring incomplete journal entry in ' + self.journal)
+                        f.truncate(offset)
+                        break
+                    self.apply(state, entry)
+                    self.entries += 1
+                    offset += len(line)
+        return state
+
+    def legacy(self, data):
+        """Convert a pickled (lines, schedules, defaultPage[, shadow]) tuple"""
+        conf = pickle.loads(data)
+        return {
+            'lines': {linenum: {pagenum: self.dumpitem(page) for pagenum, page in line.items()} for linenum, line in conf[0].items()},
+            'schedules': {schednum: self.dumpitem(sched) for schednum, sched in conf[1].items()},
+            'defaultPage': conf[2],
+            'shadow': conf[3] if len(conf) > 3 else {},
+        }
+
+    def apply(self, state, entry):
+        """Apply one journal entry to a loaded state"""
+        kind = entry[0]
+        if kind == 'item':
+            name, data = entry[1], entry[2]
+            if name.startswith('L'):
+                linenum, pagenum = name[1:].split('P', 1)
+                state['lines'].setdefault(linenum, {})[pagenum] = data
+            elif name.startswith('T'):
+                state['schedules'][name[1:]] = data
+        elif kind == 'shadow':
+            if entry[2] is None:
+                state['shadow'].pop(entry[1], None)
+            else:
+                state['shadow'][entry[1]] = entry[2]
+        elif kind == 'default':
+            state['defaultPage'] = entry[1]
+        elif kind == 'serial':
+            state['serial'] = entry[1]
+        elif kind == 'buffers':
+            state['spares'], state['shown'] = entry[1], entry[2]
+
+    def save(self, state):
+        """Write a new snapshot and clear the journal
+
+        Parameters
+        ------
+        state: dict
+            see load
+        """
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = dict(state, version=self.VERSION)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # the snapshot contains everything, the journal is not needed anymore
+        if os.path.isfile(self.journal):
+            os.remove(self.journal)
+        self.entries = 0
+
+    def record(self, entries):
+        """Append entries to the journal
+
+        Parameters
+        ------
+        entries: list
+            ['item', name, data], ['shadow', name, hash or None], ['default', page],
+            ['serial', settings] or ['buffers', spares, shown] lists
+
+        Return
+        ------
+        bool
+            True if the snapshot should be rewritten (see COMPACT)
+        """
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += len(entries)
+        return self.entries >= self.COMPACT
+
+    @staticmethod
+    def dumpitem(item):
+        """Returns the JSON representation of a page or schedule"""
+        if isinstance(item, oschedule):
+            return {'PP': item.PP, 'st': item.st.sched(), 'en': item.en.sched(), 'active': item.active}
+        return {'MM': item.MM, 'FX': item.FX, 'MX': item.MX, 'WX': item.WX, 'FY': item.FY}
+
+    @staticmethod
+    def loaditem(data):
+        """Create a page or schedule from its JSON representation"""
+        if 'PP' in data:
+            item = oschedule(data['PP'], data['st'], data['en'])
+            item.active = data['active']
+        else:
+            item = opage(data['MM'], data['FX'], data['MX'], data['WX'], data['FY'])
+        item.modified(False)
+        return item
 
 
 class sixleds():
     """A Class to store the lcd setting for the display in the space."""
 
-    lines = {'1':{}}
-    schedules = {}
-    defaultPage = 'A'
 
-
-    def __init__(self, dev='/dev/ttyUSB0', conf='/var/lib/sixleds/config', device=0x01):
+    def __init__(self, dev='/dev/ttyUSB0', conf='/var/lib/sixleds/config', device=0x01, timeout=None, baudrate=None, rtscts=None, writetimeout=None):
         ''' Create the connection to the display
 
         Set up serial connections.
         reload the config saved
 
+        The serial settings which are not given are taken from the config of
+        the device, or SERIAL_DEFAULTS if none are saved. Given settings are
+        saved for the next time (see configure).
+
         Paramaters
         ------
         dev: string, default='/dev/ttyUSB0'
@@ -434,20 +708,35 @@ class sixleds():
             NOTE! unsire the directory exists and is +wr by service user and group.
         device: byte, default=0x01
             The device identifier
+        timeout: float, default=None
+            Seconds to wait for the response of the display (see response), 1.0 by default
+        baudrate: int, default=None
+            Baud rate of the serial line, 9600 by default (see probebaud)
+        rtscts: bool, default=None
+            Use RTS/CTS hardware flow control, off by default
+        writetimeout: float, default=None
+            Seconds a write may block (e.g. while CTS is not set), 0 for no limit (the default)
 
         Return
         ------
         :obj: 'sixleds'
             The sixleds Object
         '''
-        self.device=device
+        self.initstate(device)
+        requested = {'baudrate': baudrate, 'rtscts': rtscts, 'timeout': timeout, 'writetimeout': writetimeout}
+        self.serialsettings = dict(SERIAL_DEFAULTS)
+        self.serialsettings.update((key, value) for key, value in requested.items() if value is not None)
+        self.serialsettings['writetimeout'] = self.serialsettings['writetimeout'] or None
+        self.timeout=self.serialsettings['timeout']
         try:
             self.ser = serial.Serial(
                 port=dev,
-                baudrate=9600,
+                baudrate=self.serialsettings['baudrate'],
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS
+                bytesize=serial.EIGHTBITS,
+                rtscts=self.serialsettings['rtscts'],
+                write_timeout=self.serialsettings['writetimeout']
             )
         except serial.SerialException as e:
             traceback.print_exc()
@@ -456,8 +745,29 @@ class sixleds():
             self.ser = None
 
         if self.connected():
-            self.config = os.path.expanduser(conf + '-%02x.conf' % self.device)
-            self.confget()
+            # the saved settings apply unless others were requested
+            self.serialsettings = dict(SERIAL_DEFAULTS)
+            self.openconfig(conf)
+            self.configure(**requested)
+
+    def initstate(self, device):
+        '''Set up the empty pages, schedules and display state, shared with AsyncSixleds'''
+        self.device=device
+        self.rxbuf=''
+        # every display has its own pages and schedules
+        self.lines={'1':{}}
+        self.schedules={}
+        self.defaultPage='A'
+        # name -> hash of the packet the display acknowledged last (see pushchanges)
+        self.shadow={}
+        # page -> spare page, page -> page slot it is shown from (see doublebuffer)
+        self.spares={}
+        self.shown={}
+
+    def openconfig(self, conf):
+        '''Load the config of the device, conf + '-<device>.conf' (see confget)'''
+        self.config = os.path.expanduser(conf + '-%02x.conf' % self.device)
+        self.confget()
 
     def connected(self):
         '''Is the display connected
@@ -469,26 +779,116 @@ class sixleds():
 
     def confput(self):
         '''Save the current config to disk'''
-        if not os.path.isdir(os.path.dirname(self.config)):
-            os.makedirs(os.path.dirname(self.config), exist_ok=True)
-        if os.path.isfile(self.config):
-            # Clear file
-            os.remove(self.config)
         try:
-            with open(self.config, "wb") as f:
-                pickle.dump((self.lines,self.schedules,self.defaultPage), f)
-        except IOError as e:
+            self.store.save(self.confstate())
+        except (IOError, OSError) as e:
             logging.warning("Failed to save config: I/O error({0}): {1}".format(e.errno, e.strerror))
 
+    def confrecord(self, entries):
+        '''Save single changes to disk (see confstore.record)'''
+        try:
+            if self.store.record(entries):
+                self.store.save(self.confstate())
+        except (IOError, OSError) as e:
+            logging.warning("Failed to save config: I/O error({0}): {1}".format(e.errno, e.strerror))
+
+    def confstate(self):
+        '''Returns the config as stored by confstore'''
+        return {
+            'lines': {linenum: {pagenum: confstore.dumpitem(page) for pagenum, page in line.items()} for linenum, line in self.lines.items()},
+            'schedules': {schednum: confstore.dumpitem(sched) for schednum, sched in self.schedules.items()},
+            'defaultPage': self.defaultPage,
+            'shadow': self.shadow,
+            'serial': self.serialsettings,
+            'spares': self.spares,
+            'shown': self.shown,
+        }
+
     def confget(self):
         '''Retrieve the config from the disk'''
         logging.info( "Using Config File: " + self.config )
-        if os.path.isfile(self.config):
-            try:
-                with open(self.config, "rb") as f:
-                    self.lines,self.schedules,self.defaultPage = pickle.load(f)
-            except:
-                pass
+        self.store = confstore(self.config)
+        try:
+            state = self.store.load()
+        except Exception as e:
+            logging.warning("Failed to load config " + self.config + ": " + repr(e))
+            return
+        if state is None:
+            return
+        self.lines = {linenum: {pagenum: confstore.loaditem(page) for pagenum, page in line.items()} for linenum, line in state['lines'].items()}
+        self.schedules = {schednum: confstore.loaditem(sched) for schednum, sched in state['schedules'].items()}
+        self.defaultPage = state['defaultPage']
+        self.shadow = state['shadow']
+        if 'serial' in state:
+            self.serialsettings = dict(SERIAL_DEFAULTS, **state['serial'])
+        self.spares = state.get('spares', {})
+        self.shown = state.get('shown', {})
+
+    def configure(self, baudrate=None, rtscts=None, timeout=None, writetimeout=None):
+        '''Change the serial settings and save them in the config of the device
+
+        Paramaters
+        ------
+        baudrate, rtscts, timeout, writetimeout:
+            see __init__, None keeps the current setting
+
+        Return
+        ------
+        dict
+            the current settings, see SERIAL_DEFAULTS
+        '''
+        settings = dict(self.serialsettings)
+        requested = {'baudrate': baudrate, 'rtscts': rtscts, 'timeout': timeout, 'writetimeout': writetimeout}
+        settings.update((key, value) for key, value in requested.items() if value is not None)
+        settings['writetimeout'] = settings['writetimeout'] or None
+
+        self.timeout = settings['timeout']
+        if self.ser.baudrate != settings['baudrate']:
+            self.ser.baudrate = settings['baudrate']
+        if self.ser.rtscts != settings['rtscts']:
+            self.ser.rtscts = settings['rtscts']
+        if self.ser.write_timeout != settings['writetimeout']:
+            self.ser.write_timeout = settings['writetimeout']
+
+        if settings != self.serialsettings:
+            logging.info('Serial settings: ' + repr(settings))
+            self.serialsettings = settings
+            self.confrecord([['serial', settings]])
+        return settings
+
+    def probebaud(self, rates=BAUDRATES, timeout=0.3):
+        '''Find the fastest baud rate the display acknowledges and save it (see configure)
+
+        The clock is set to the local time at every rate (see setclock), the
+        pages the display shows do not change.
+
+        Paramaters
+        ------
+        rates: list, default=BAUDRATES
+            The baud rates to try, fastest first
+        timeout: float, default=0.3
+            Seconds to wait for the reply at every rate
+
+        Return
+        ------
+        int:
+            the baud rate, None if the display did not reply at any rate
+            (the previous setting is kept)
+        '''
+        if self.device == 0:
+            logging.info('There is no reply using ID 0, can not probe the baud rate')
+            return None
+        for rate in rates:
+            self.ser.baudrate = rate
+            self.flushresponse()
+            self.write(strftime("<SC>%y0%w%m%d%H%M%S", localtime()))
+            if self.readresponse(timeout=timeout) == RESPONSE_ACK:
+                logging.info('Baud rate %d - OK' % rate)
+                self.configure(baudrate=rate)
+                return rate
+            logging.info('Baud rate %d - No Reply' % rate)
+        self.ser.baudrate = self.serialsettings['baudrate']
+        return None
 
     def isopen(self):
         '''Check if serial interface is open
@@ -511,18 +911,20 @@ class sixleds():
 
         Paramaters
         ------
-        packet: string
-            the packed to generate the checksum for.
+        packet: string or bytes
+            the packed to generate the checksum for, the checksum of a
+            wirepacket is not computed again
 
         Return
         ------
         string
             A hex value of the checksum for the packet
         '''
-        cs = 0
-        for c in packet:
-            cs ^= ord(c)
-        return format(cs, 'x').zfill(2).upper()
+        if isinstance(packet, wirepacket):
+            return '%02X' % packet.parity
+        if isinstance(packet, str):
+            packet = packet.encode('latin-1')
+        return '%02X' % reduce(xor, packet, 0)
 
     def updateline(self, page, message, line='1', FX='E', MX='Q', WX='A', FY='E'):
         '''Update the page and message on a line or create one
@@ -583,91 +985,375 @@ class sixleds():
         if(line in self.lines and page in self.lines[line]):
             return self.lines[line][page]
 
-    def show(self):
-        """Show the Configuration"""
+    def show(self, file=None):
+        """Show the Configuration
+
+        Pages and schedules which differ from the display are marked with 'M'.
+
+        Parameters
+        ------
+        file: file object, default=None
+            Where to print the config, sys.stdout if None
+        """
+        packets = {name: packet for name, packet, item, message in self.allpackets()}
         for linenum, line in  sorted(self.lines.items()):
-            print('### LINE ' + linenum + ' ###')
+            print('### LINE ' + linenum + ' ###', file=file)
             for pagenum, page in line.items():
-                m = 'M ' if page.changed else '  '
-                print(m + '(' + pagenum + ') ' + page.packet())
-        print('### SCHEDULES ###')
+                m = 'M ' if self.differs('L' + linenum + 'P' + self.slot(pagenum), packets) else '  '
+                saved = ' (%d bytes saved)' % page.saved if page.saved else ''
+                slot = ' [shown from ' + self.slot(pagenum) + ', spare ' + self.spares[pagenum] + ']' if pagenum in self.spares else ''
+                print(m + '(' + pagenum + ') ' + page.packet() + saved + slot, file=file)
+        print('### SCHEDULES ###', file=file)
         for schednum, sched in sorted(self.schedules.items()):
             a = 'A ' if sched.active else 'N '
-            m = 'M ' if sched.changed else '  '
-            print( m + a + '(' + schednum + ') ' + sched.packet())
+            m = 'M ' if self.differs('T' + schednum, packets) else '  '
+            print( m + a + '(' + schednum + ') ' + sched.packet(), file=file)
+
+    def packethash(self, packet):
+        '''Returns the hash of a packet which is stored in the shadow'''
+        if isinstance(packet, str):
+            packet = packet.encode('latin-1')
+        return hashlib.sha1(packet).hexdigest()
+
+    def differs(self, name, packets):
+        '''Check if the display did not acknowledge the current packet for a page or schedule
 
-    def pushchanges(self, reset=False):
+        Paramaters
+        ------
+        name: string
+            The packet name, e.g. 'L1PA' or 'TA'
+        packets: dict
+            name -> current packet
+        '''
+        return self.shadow.get(name) != self.packethash(packets[name])
+
+    def pushchanges(self, reset=False, window=1, retries=1, progress=None, swap=None):
         """ Push the changes to the display
 
+        Parameters
+        ------
+        reset: bool, default=False
+            Delete all contents on the display and send everything
+        window: int, default=1
+            Number of packets sent ahead before waiting for the reply (see sendmany)
+        retries: int, default=1
+            How often packets which were not acknowledged are resent
+        progress: callable, default=None
+            Called after every reply, see sendmany. Packets which were not
+            sent because of a cancel stay modified and are sent next time.
+        swap: bool, default=None
+            Do not turn the display off during the push, but switch to pages
+            written in the background (see swapchanges), by default if a
+            spare page is set (see doublebuffer)
+
         Return
         ------
-        bool
-            True on success, False on failue
+        dict
+            packet name (e.g. 'L1PA', 'TA') -> RESPONSE_* result
         """
-        changes = 0
-        changed = 0
+        changes = self.collectchanges(reset)
+        if not changes and not reset:
+            logging.info('Nothing to push')
+            return {}
 
         # reset display if requested
-        if reset: self.send('<D*>')
+        if reset: self.deleteall()
+
+        if swap or (swap is None and self.spares):
+            return self.swapchanges(changes, window, retries, progress)
 
         # begin update (turn the display off)
         self.send("<BE>")
         sleep(0.1)
 
-        # update pages
+        # pages with errors in their message are not sent
+        invalid = self.invalidchanges(changes)
+        report = self.sendmany([(name, packet) for name, packet, item, message in changes if name not in invalid], window, retries, progress)
+        report.update(invalid)
+
+        # end update
+        sleep(0.1)
+        self.send("<BF>")
+
+        self.pushresult(report, changes)
+        return report
+
+    def allpackets(self):
+        """Returns the packets of all pages and schedules
+
+        Return
+        ------
+        list
+            (name, packet, page or schedule, message for logging) tuples
+        """
+        packets = []
         for linenum, line in  self.lines.items():
             for pagenum, page in sorted(line.items()):
-                if page.modified(False) or reset:
-                    changes += 1
-                    if self.send('<L' + linenum + '><P' + pagenum + '>' + page.packet()):
-                        logging.info("page " + pagenum + " OK - " + page.MM)
-                        changed += 1
-                    else:
-                        logging.info("Page " + pagenum + " Failed - " + page.MM)
-                else:
-                    logging.info("Page " + pagenum + " Not Changed - " + page.MM)
-
-        # update schedules
+                packets.append(self.pagepacket(linenum, pagenum, self.slot(pagenum)))
         for schednum, sched in self.schedules.items():
-            if sched.modified(False) or reset:
-                changes += 1
-                if sched.active:
-                    if self.send('<T' + schednum + '>' + sched.packet()):
-                        logging.info("Sched " + schednum + " OK - " + sched.PP)
-                        changed += 1
-                    else:
-                        logging.info("Schedule " + schednum + " Failed - " + sched.PP)
+            if sched.active:
+                PP = ''.join(self.slot(pagenum) for pagenum in sched.PP)
+                if PP == sched.PP:
+                    packet = wirepacket(b'<T%s>' % schednum.encode(), sched)
                 else:
-                    if self.send("<DT" + schednum  + ">"):
-                        logging.info("Sched " + schednum + " OK - Deletion")
-                        changed += 1
-                    else:
-                        logging.info("Schedule " + schednum + " Failed - Deletion")
+                    packet = b'<T%s>' % schednum.encode() + (sched.st.sched() + sched.en.sched() + PP).encode('latin-1')
+                packets.append(('T' + schednum, packet, sched, sched.PP))
             else:
-                logging.info("Schedule " + schednum + " Not Changed - " + sched.PP)
+                packets.append(('T' + schednum, b'<DT%s>' % schednum.encode(), sched, 'Deletion'))
+        return packets
 
-        # end update
-        sleep(0.1)
-        self.send("<BF>")
+    def pagepacket(self, linenum, pagenum, slot):
+        '''Returns the change which writes a page to a page slot, see allpackets'''
+        page = self.lines[linenum][pagenum]
+        return ('L' + linenum + 'P' + slot, wirepacket(b'<L%s><P%s>' % (linenum.encode(), slot.encode()), page), page, page.MM)
 
-        # check result
-        if changes != changed:
+    def slot(self, page):
+        '''Returns the page slot the display shows a page from (see doublebuffer)'''
+        return self.shown.get(page, page)
+
+    def doublebuffer(self, page, spare=None):
+        """Update a page through a spare page, without turning off the display
+
+        The page is shown from one of two page slots, pushchanges writes new
+        content to the other one while the old content keeps running and then
+        switches over with the schedules which contain the page and <RP> if it
+        is the default run page (see swapchanges). The spare page must not be
+        used otherwise.
+
+        Parameters
+        ------
+        page: string
+            The page (A..Z)
+        spare: string, default=None
+            The spare page, None to stop double buffering (the page keeps the
+            slot it is shown from)
+
+        Return
+        ------
+        bool:
+            false if the spare page is in use
+        """
+        if spare is None:
+            if self.spares.pop(page, None) is not None:
+                self.confrecord([['buffers', self.spares, self.shown]])
+            return True
+        used = set(pagenum for line in self.lines.values() for pagenum in line)
+        used.update(slot for other, slot in self.shown.items() if other != page)
+        used.update(other for key, other in self.spares.items() if key != page)
+        if spare == page or len(spare) != 1 or spare not in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' or spare in used:
+            logging.warning('Page ' + spare + ' can not be the spare page of ' + page)
+            return False
+        self.spares[page] = spare
+        self.confrecord([['buffers', self.spares, self.shown]])
+        return True
+
+    def backbuffer(self, changes):
+        """Redirect the changed pages which have a spare page to the slot which is not shown
+
+        All lines of such a page are written, the display switches to all of them.
+
+        Parameters
+        ------
+        changes: list
+            as returned by collectchanges
+
+        Return
+        ------
+        tuple
+            (the page changes, page -> slot they are written to)
+        """
+        redirected, flips = [], {}
+        for change in changes:
+            if not change[0].startswith('L'):
+                continue
+            linenum, slot = change[0][1:].split('P', 1)
+            pagenum = self.pageof(change[0])
+            if pagenum not in self.spares:
+                redirected.append(change)
+            elif pagenum not in flips:
+                flips[pagenum] = self.spares[pagenum] if slot == pagenum else pagenum
+                redirected.extend(self.pagepacket(linenum, pagenum, flips[pagenum]) for linenum, line in sorted(self.lines.items()) if pagenum in line)
+        return redirected, flips
+
+    def pageof(self, name):
+        '''Returns the page (A..Z) a page packet (e.g. 'L1PZ') belongs to, the slot may be its spare page; None for other packets'''
+        if not name.startswith('L'):
+            return None
+        slot = name[1:].split('P', 1)[1]
+        return {slot: pagenum for pagenum, slot in self.shown.items()}.get(slot, slot)
+
+    def switchover(self, report, flips):
+        """Show the pages from the slots they were written to completely
+
+        Parameters
+        ------
+        report: dict
+            the results of the page changes, see backbuffer
+        flips: dict
+            page -> slot, see backbuffer
+
+        Return
+        ------
+        tuple
+            (the changed schedules, [('RP', packet)] if the default run
+            page was switched, otherwise an empty list)
+        """
+        switched = {}
+        for pagenum, slot in flips.items():
+            if all(report.get('L' + linenum + 'P' + slot) == RESPONSE_ACK for linenum, line in self.lines.items() if pagenum in line):
+                switched[pagenum] = slot
+        if switched:
+            self.shown.update(switched)
+            self.confrecord([['buffers', self.spares, self.shown]])
+        schedules = [change for change in self.collectchanges() if change[0].startswith('T')]
+        default = [('RP', '<RP' + self.slot(self.defaultPage) + '>')] if self.defaultPage in switched else []
+        return schedules, default
+
+    def swapchanges(self, changes, window=1, retries=1, progress=None):
+        """Push changes without turning off the display (see pushchanges)
+
+        The pages with a spare page (see doublebuffer) are written to the slot
+        which is not shown, other pages are written in place. Then the
+        schedules are sent and the display switches to the new slots with one
+        packet per schedule and <RP>.
+
+        Return
+        ------
+        dict
+            packet name (e.g. 'L1PA', 'TA', 'RP') -> RESPONSE_* result
+        """
+        changes, flips = self.backbuffer(changes)
+        invalid = self.invalidchanges(changes)
+        report = self.sendmany([(name, packet) for name, packet, item, message in changes if name not in invalid], window, retries, progress)
+        report.update(invalid)
+        self.pushresult(report, changes)
+
+        schedules, default = self.switchover(report, flips)
+        if schedules or default:
+            switches = self.sendmany([(name, packet) for name, packet, item, message in schedules] + default, window, retries, progress)
+            self.pushresult({name: switches[name] for name, packet, item, message in schedules if name in switches}, schedules)
+            report.update(switches)
+        return report
+
+    def collectchanges(self, reset=False):
+        """Collect the packets which differ from what the display acknowledged last
+
+        A packet is sent if its hash differs from the one in the shadow, so
+        pages which were set to the same content again are skipped and
+        packets which were never acknowledged are always resent.
+
+        Parameters
+        ------
+        reset: bool, default=False
+            Collect all pages and schedules
+
+        Return
+        ------
+        list
+            (name, packet, page or schedule, message) tuples, see allpackets
+        """
+        changes = []
+        packets = self.allpackets()
+        for name, packet, item, message in packets:
+            if reset or self.differs(name, {name: packet}):
+                changes.append((name, packet, item, message))
+            else:
+                item.modified(False)
+                logging.info(name + " Not Changed - " + message)
+        return changes
+
+    def invalidchanges(self, changes):
+        """Find the pages which can not be sent because their message has errors
+
+        Parameters
+        ------
+        changes: list
+            as returned by collectchanges
+
+        Return
+        ------
+        dict
+            name -> RESPONSE_INVALID
+        """
+        invalid = {}
+        for name, packet, item, message in changes:
+            if isinstance(item, opage) and item.compiled().errors:
+                logging.warning(name + " Not Sent - " + item.compiled().describe().replace('\n', ', '))
+                invalid[name] = RESPONSE_INVALID
+        return invalid
+
+    def pushresult(self, report, changes):
+        """Update the shadow with the result of a push and save the config
+
+        Parameters
+        ------
+        report: dict
+            name -> RESPONSE_* result, as returned by sendmany
+        changes: list
+            the packets which were sent, as returned by collectchanges
+        """
+        # pages are saved under their name, not the slot they were written to
+        names = {id(page): 'L' + linenum + 'P' + pagenum for linenum, line in self.lines.items() for pagenum, page in line.items()}
+        entries = []
+        for name, packet, item, message in changes:
+            if name not in report:
+                # cancelled before it was sent, the display still shows the old content
+                logging.info(name + " Not Sent - " + message)
+                continue
+            result = report[name]
+            saved = getattr(item, 'saved', 0)
+            logging.info(name + " " + result + " - " + message + (" (%d bytes saved)" % saved if saved else ""))
+            if result == RESPONSE_ACK:
+                self.shadow[name] = self.packethash(packet)
+                item.modified(False)
+            else:
+                # unknown what the display shows now, send again next time
+                self.shadow.pop(name, None)
+            entries.append(['item', names.get(id(item), name), confstore.dumpitem(item)])
+            entries.append(['shadow', name, self.shadow.get(name)])
+        changed = list(report.values()).count(RESPONSE_ACK)
+        if changed != len(report):
             logging.info('There was some issue with the loading of changes')
 
-        # save the new display config
+        # save the pushed pages and schedules
         if changed > 0:
             logging.info('Changes Pushed')
-            self.confput()
+        self.confrecord(entries)
+
+    def deleteall(self):
+        """Delete all contents on the display
+
+        Return
+        ------
+        bool:
+            true on success
+        """
+        # nothing is left on the display to compare with
+        self.shadow = {}
+        self.confput()
+        return self.send('<D*>')
 
     def defaultrunpage(self, page=''):
-        """The default page to display if no schedules are ser"""
-        if len(page) == 1 and page in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
-            self.defaultPage = page
-            if self.send("<RP" +self.defaultPage + ">"):
-                logging.info("Default Run Page " + self.defaultPage + " set - OK")
-            else:
-                logging.info("Default Run Page " + self.defaultPage + " set - Failed")
-        return self.defaultPage
+        """The default page to display if no schedules are set
+
+        The page is saved in the config, pushchanges switches the display
+        over to the spare page of it (see doublebuffer).
+
+        Return
+        ------
+        bool:
+            true on success, false if the page is invalid or the display did not acknowledge
+        """
+        if len(page) != 1 or page not in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+            logging.info("Invalid Default Run Page " + repr(page))
+            return False
+        self.defaultPage = page
+        self.confrecord([['default', page]])
+        if self.send("<RP" + self.slot(self.defaultPage) + ">"):
+            logging.info("Default Run Page " + self.defaultPage + " set - OK")
+            return True
+        logging.info("Default Run Page " + self.defaultPage + " set - Failed")
+        return False
 
     def setclock(self):
         """Will set the RTC on the display to localtime
@@ -679,8 +1365,9 @@ class sixleds():
         """
         if self.send(strftime("<SC>%y0%w%m%d%H%M%S", localtime())):
             logging.info("RTC set - OK")
-        else:
-            logging.info("RTC set - Failed")
+            return True
+        logging.info("RTC set - Failed")
+        return False
 
     def brightness(self, bn='D'):
         """Modify the brightness of the screen
@@ -703,10 +1390,11 @@ class sixleds():
                 logging.info("Brightness set - OK")
             else:
                 logging.info("Brightness set - Failed")
+                return False
+            return True
         else:
             print("Invalid brightness")
-
-        return self.response()
+            return False
 
     def setid(self, newid):
         """Will set the ID on the display
@@ -721,11 +1409,12 @@ class sixleds():
         self.ser.write(bytes(data, 'ASCII'))
         if self.response(expected="%02d" % int(newid)):
             logging.info("ID set - OK")
-        else:
-            logging.info("ID set - Failed")
+            return True
+        logging.info("ID set - Failed")
+        return False
 
     def getcolorbyte(self, colorChar):
-        """Helper function for programgraphic()
+        """Helper function for programgraphic(), see sixleds_graphic.COLORS
 
         Paramaters
         -------
@@ -737,10 +1426,83 @@ class sixleds():
         byte:
             the corresponding color byte
         """
-        if  (colorChar == 'A'): return 0b10000000
-        elif(colorChar == 'D'): return 0b01000000
-        elif(colorChar == 'E'): return 0b11000000
-        else: return 0b00000000
+        return GRAPHIC_COLORS.get(colorChar, 0b00) << 6
+
+    def programbank(self, bank, window=1, retries=1, progress=None, force=False):
+        """Program several graphics to the display in one session
+
+        Graphics which the display acknowledged before with the same data are
+        skipped (see bankchanges).
+
+        Parameters
+        ------
+        bank: dict
+            slot (e.g. 'A1') -> encoded graphic, see sixleds_graphic.compilebank
+        window: int, default=1
+            Number of packets sent ahead before waiting for the reply (see sendmany)
+        retries: int, default=1
+            How often packets which were not acknowledged are resent
+        progress: callable, default=None
+            Called after every reply, see sendmany
+        force: bool, default=False
+            Send all graphics of the bank
+
+        Return
+        ------
+        dict
+            slot -> RESPONSE_* result of the graphics which were sent
+        """
+        packets = self.bankchanges(bank, force)
+        report = self.sendmany(packets, window, retries, progress)
+        self.bankresult(report, packets)
+        return {name[1:]: result for name, result in report.items()}
+
+    def bankchanges(self, bank, force=False):
+        """Collect the graphic packets which differ from what the display acknowledged last
+
+        Parameters
+        ------
+        bank: dict
+            slot (e.g. 'A1') -> encoded graphic, see sixleds_graphic.compilebank
+        force: bool, default=False
+            Collect all graphics
+
+        Return
+        ------
+        list
+            (name, packet) tuples, the name is 'G' + slot (e.g. 'GA1')
+        """
+        packets = []
+        for slot, data in sorted(bank.items()):
+            name, packet = 'G' + slot, b'<G' + slot.encode() + b'>' + data
+            if force or self.shadow.get(name) != self.packethash(packet):
+                packets.append((name, packet))
+            else:
+                logging.info("Graphic " + slot + " Not Changed")
+        return packets
+
+    def bankresult(self, report, packets):
+        """Update the shadow with the results of graphic packets and save it
+
+        Parameters
+        ------
+        report: dict
+            name -> RESPONSE_* result, as returned by sendmany
+        packets: list
+            (name, packet) tuples, as returned by bankchanges
+        """
+        entries = []
+        for name, packet in packets:
+            if name not in report:
+                continue
+            logging.info("Graphic " + name[1:] + " " + report[name])
+            if report[name] == RESPONSE_ACK:
+                self.shadow[name] = self.packethash(packet)
+            else:
+                self.shadow.pop(name, None)
+            entries.append(['shadow', name, self.shadow.get(name)])
+        if entries:
+            self.confrecord(entries)
 
     def programgraphic(self, graphicid, blockid, graphiccontent):
         """Will program a graphic to the display
@@ -750,94 +1512,52 @@ class sixleds():
         graphicid: string
             The graphic identifier (this graphic will be overridden on device)
         graphiccontent: string
+            The graphic itself, see graphicpacket
+
+        Return
+        ------
+        bool:
+            true on success
+        """
+        packet = self.graphicpacket(graphicid, blockid, graphiccontent)
+        if packet is None:
+            return
+
+        # send payload
+        result = self.send(packet)
+        self.bankresult({'G' + graphicid + blockid: RESPONSE_ACK if result else RESPONSE_NACK}, [('G' + graphicid + blockid, packet)])
+        return result
+
+    def graphicpacket(self, graphicid, blockid, graphiccontent):
+        """Returns the packet which programs a graphic to the display
+
+        Paramaters
+        -------
+        graphicid: string
+            The graphic identifier (this graphic will be overridden on device)
+        graphiccontent: string, bytes or 2D array
             The graphic itself, represented as a string. Each char represents one pixel.
             Valid chars are: A = red, D = green, E = yellow, @ = off
             Please have a look at the sample graphic text file.
+            Also accepts rows of chars or 2 bit color codes (see sixleds_graphic.graphicrows).
 
         Return
         ------
-        bool:
-            true on success
+        bytes:
+            the packet for send(), None if the ids or the graphic are invalid
         """
         # check graphic and block parameter
-        if(not graphicid in "ABCDEFGHIJKLMNOP" or not blockid in "12345678"):
+        if(len(graphicid) != 1 or not graphicid in "ABCDEFGHIJKLMNOP" or len(blockid) != 1 or not blockid in "12345678"):
             logging.info("Invalid graphic or block id - abort!")
             return
 
-        # default data of one graphic (= 4 chars/blocks)
-        # 0b10 = red, 0b01 = green, 0b11 = yellow, 0b00 = off
-        data = [
-            # block 1 (8x8 px)
-            0xff,0xff, # 2 bytes represents 8 px
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            # block 2 (right of prev block)
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            # block 3 (right of prev block)
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            # block 4 (right of prev block)
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00,
-            0x00,0x00
-        ]
-
-        # parse graphic string
-        graphiccontent = graphiccontent.splitlines()
-        charoffset = 0
-        block = 0
-        blockok = True
-        for block in [0,1,2,3,4,5,6,7]:
-            for line in [0,1,2,3,4,5,6]:
-                # check if enough data is avail for next block
-                if(charoffset+7 >= len(graphiccontent[line])):
-                    blockok = False
-                    break
-            # parse block if block is ok
-            if(blockok):
-                for line in [0,1,2,3,4,5,6]:
-                    #print(graphiccontent[line][charoffset+0:charoffset+8])
-                    chunk = 0x00
-                    chunk2 = 0x00
-                    for char in [0,1,2,3]:
-                        chunk |= self.getcolorbyte(graphiccontent[line][charoffset+char]) >> (char*2)
-                    for char in [0,1,2,3]:
-                        chunk2 |= self.getcolorbyte(graphiccontent[line][charoffset+char+4]) >> (char*2)
-                    data[(block*16)+(line*2)+0] = chunk
-                    data[(block*16)+(line*2)+1] = chunk2
-                # set next block begin
-                charoffset += 8
-                block += 1
-
-        # convert byte array to string for send() function
-        packet = ""
-        for d in data: packet += chr(d)
+        try:
+            data = encodegraphic(graphiccontent)
+        except ValueError as e:
+            logging.info("Invalid graphic (" + str(e) + ") - abort!")
+            return
 
-        # send payload
-        self.send("<G"+graphicid+blockid+">"+packet)
+        return b"<G" + graphicid.encode() + blockid.encode() + b">" + data
 
     def send(self, packet):
         """Send the packet to the display and return the response
@@ -852,24 +1572,134 @@ class sixleds():
         bool:
             from the self.response function
         """
+        self.write(packet)
+        return self.response()
+
+    def write(self, packet):
+        """Send the packet to the display without waiting for the response
+
+        Parameters
+        ------
+        packet: string
+            The packet to send to the display
+        """
+        self.ser.write(self.frame(packet))
+
+    def frame(self, packet):
+        """Returns the bytes to send for a packet
+
+        Parameters
+        ------
+        packet: string or bytes
+            The packet to send to the display, chars of a string are sent as
+            one byte each (binary data of graphics)
+
+        Return
+        ------
+        bytes:
+            the packet with device ID, checksum and end tag
+        """
+        if isinstance(packet, str):
+            packet = packet.encode('latin-1')
+
         # append device ID and end tag
-        payload = '<ID%02x>' % self.device + packet + self.chsum(packet) + '<E>'
+        data = b'<ID%02x>' % self.device + packet + self.chsum(packet).encode('ascii') + b'<E>'
 
-        # correct conversion for binary data (graphics)
-        data = []
-        for char in payload: data.append(ord(char))
-        data = bytes(data)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info('Send: ' + data.decode('latin-1'))
+            logging.info('Send bytes: ' + data.hex(':'))
+        return data
 
-        # send
-        logging.info('Send: ' + payload)
-        logging.info('Send bytes: ' + ":".join("{:02x}".format(c) for c in data))
-        self.ser.write(data)
-        return self.response()
+    def sendmany(self, packets, window=1, retries=1, progress=None):
+        """Send several packets, keeping up to window packets in flight
+
+        The display confirms packets in the order they were received, so each
+        reply is matched to the oldest unconfirmed packet. If a reply is lost
+        or garbled, the packets confirmed while it was in flight may have got
+        the reply of a later packet, so they are not confirmed either. To
+        limit them, all replies are read after every DRAIN windows. Packets
+        which were not confirmed are sent again, up to retries times, one by
+        one after a reply was lost.
 
-    def response(self, expected='ACK'):
+        Parameters
+        ------
+        packets: list
+            (name, packet) tuples, the name is used in the report
+        window: int, default=1
+            How many packets are written before waiting for the first reply
+        retries: int, default=1
+            How often unconfirmed packets are resent
+        progress: callable, default=None
+            Called as progress(name, result, done, total) after every reply of
+            an attempt. If it returns False, no further packets are written,
+            the replies of the packets in flight are still read.
+
+        Return
+        ------
+        dict:
+            name -> RESPONSE_* result of the last attempt, packets which were
+            not sent because of a cancel are missing
+        """
+        report = {}
+        pending = list(packets)
+        cancelled = False
+        lost = False
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                logging.info('Resending %d packet(s)' % len(pending))
+            failed = []
+            unsure = []
+            queue = deque(pending)
+            inflight = deque()
+            while queue or inflight:
+                # drained now and then, a lost reply only puts the packets since then in doubt
+                while queue and len(inflight) < max(1, window) and len(unsure) + len(inflight) < DRAIN * max(1, window):
+                    name, packet = queue.popleft()
+                    self.write(packet)
+                    inflight.append((name, packet))
+                name, packet = inflight.popleft()
+                result = RESPONSE_ACK if self.device == 0 else self.readresponse()
+                report[name] = result
+                if result != RESPONSE_ACK:
+                    failed.append((name, packet))
+                elif inflight:
+                    # the reply of a later packet if the display dropped the one of this packet
+                    unsure.append((name, packet))
+                if result not in (RESPONSE_ACK, RESPONSE_NACK):
+                    # without a clean reply the following ones can not be matched anymore,
+                    # and the replies read before may have belonged to later packets
+                    for other in unsure + list(inflight):
+                        report[other[0]] = result
+                        failed.append(other)
+                    inflight.clear()
+                    unsure = []
+                    lost = True
+                    self.flushresponse()
+                if not inflight:
+                    # every reply was matched to its own packet
+                    unsure = []
+                if progress is not None and progress(name, result, len(pending) - len(queue) - len(inflight), len(pending)) is False:
+                    cancelled = True
+                    queue.clear()
+            pending = failed
+            if lost:
+                # the resends are matched one by one
+                window = 1
+            if not pending or cancelled:
+                break
+        return report
+
+    def response(self, expected='ACK', timeout=None):
         """ Get the response from the display
         Note: There is no ACK response using Sign ID=00
 
+        Parameters
+        ------
+        expected: string, default='ACK'
+            The reply which confirms the packet
+        timeout: float, default=None
+            Seconds to wait for the reply, self.timeout if None
+
         Return
         ------
         bool:
@@ -877,14 +1707,82 @@ class sixleds():
         """
         if(self.device == 0):
             return True
+        return self.readresponse(expected, timeout) == RESPONSE_ACK
 
-        out = ''
-        sleep(1)
-        while self.ser.inWaiting() > 0:
-            out += self.ser.read(1).decode('ASCII')
-        logging.info('Response: ' + out)
-        if out != '':
-            if out == expected:
-                return True
-            else:
-                return False
+    def readresponse(self, expected='ACK', timeout=None):
+        """ Read the reply of the display
+
+        Returns as soon as the expected reply or a NACK was received, otherwise
+        when the timeout is over. Bytes are read in bulk as they arrive.
+
+        Parameters
+        ------
+        expected: string, default='ACK'
+            The reply which confirms the packet ('%02d' echo for setid)
+        timeout: float, default=None
+            Seconds to wait for the reply, self.timeout if None
+
+        Return
+        ------
+        string:
+            RESPONSE_ACK if the expected reply was received,
+            RESPONSE_NACK if the display rejected the packet,
+            RESPONSE_TIMEOUT if nothing was received,
+            RESPONSE_GARBAGE if something else was received
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = monotonic() + timeout
+
+        # replies of pipelined packets may already be buffered
+        out = self.rxbuf
+        self.rxbuf = ''
+        while True:
+            result, out, self.rxbuf = self.parseresponse(out, expected)
+            if result is not None:
+                break
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            # block until the first byte arrives, then fetch whatever is buffered
+            self.ser.timeout = remaining
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if not chunk:
+                break
+            out += chunk.decode('ASCII', errors='replace')
+
+        if result is None:
+            result = RESPONSE_GARBAGE if out != '' else RESPONSE_TIMEOUT
+        logging.info('Response: ' + out + ' (' + result + ')')
+        return result
+
+    def parseresponse(self, out, expected='ACK'):
+        """Find the first complete reply in the received data
+
+        Parameters
+        ------
+        out: string
+            The data received so far
+        expected: string, default='ACK'
+            The reply which confirms the packet
+
+        Return
+        ------
+        tuple:
+            (RESPONSE_ACK or RESPONSE_NACK or None if no reply is complete yet,
+            the data up to the end of the reply, the remaining data)
+        """
+        # the earliest complete reply belongs to the oldest packet
+        nack = out.find('NACK')
+        ack = out.find(expected)
+        if nack >= 0 and (ack < 0 or nack < ack):
+            return RESPONSE_NACK, out[:nack+4], out[nack+4:]
+        if ack >= 0:
+            return RESPONSE_ACK, out[:ack+len(expected)], out[ack+len(expected):]
+        return None, out, ''
+
+    def flushresponse(self):
+        '''Drop all replies which were received but not read yet'''
+        self.rxbuf = ''
+        self.ser.reset_input_buffer()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from . import sixleds, confstore, SERIAL_DEFAULTS, BAUDRATES, RESPONSE_ACK, RESPONSE_NACK, RESPONSE_GARBAGE, RESPONSE_TIMEOUT, DRAIN
+from time import localtime, strftime, monotonic
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import copy
+import os
+
+
+class AsyncSixleds(sixleds):
+    """The sixleds display control for asyncio applications
+
+    Uses the same pages, schedules and packet framing as sixleds, but all
+    communication with the display is awaitable. One event loop can drive
+    many displays, use AsyncSixleds.open() to create a connected instance.
+    Changes of the config are written by a background thread in order, so
+    the event loop does not wait for the disk (see confflush).
+    """
+
+    def __init__(self, reader=None, writer=None, conf='/var/lib/sixleds/config', device=0x01, timeout=1.0):
+        ''' Create the display control on an already opened stream
+
+        Paramaters
+        ------
+        reader: :obj:`asyncio.StreamReader`
+            The stream to read the responses of the display from
+        writer: :obj:`asyncio.StreamWriter`
+            The stream to write the packets to
+        conf: string, default='/var/lib/sixleds/status'
+            The saved configuration for the display (see sixleds)
+        device: byte, default=0x01
+            The device identifier
+        timeout: float, default=1.0
+            Seconds to wait for the response of the display
+
+        Return
+        ------
+        :obj: 'AsyncSixleds'
+            The AsyncSixleds Object
+        '''
+        self.initstate(device)
+        self.timeout=timeout
+        # the stream is already opened, settings saved by sixleds are kept in the config
+        self.serialsettings=dict(SERIAL_DEFAULTS, timeout=timeout)
+        self.ser=None
+        self.reader=reader
+        self.writer=writer
+        # one request/response exchange with the display at a time
+        self.lock=asyncio.Lock()
+        # one thread writes the config, so the writes keep their order
+        self.confwriter=ThreadPoolExecutor(max_workers=1)
+        self.confpending=None
+        self.unsaved=0
+
+        if self.connected():
+            self.openconfig(conf)
+            self.unsaved=self.store.entries
+
+    @classmethod
+    async def open(cls, dev='/dev/ttyUSB0', conf='/var/lib/sixleds/config', device=0x01, timeout=None, baudrate=None, rtscts=None):
+        ''' Open the serial port and create the display control
+
+        Requires the pyserial-asyncio package. The serial settings which are
+        not given are taken from the config of the device (see
+        sixleds.configure), the given ones are saved for the next time.
+
+        Paramaters
+        ------
+        dev: string, default='/dev/ttyUSB0'
+            The serial device the display is connected to.
+        conf, device:
+            see __init__
+        timeout: float, default=None
+            Seconds to wait for the response of the display, 1.0 by default
+        baudrate: int, default=None
+            Baud rate of the serial line, 9600 by default (see probebaud)
+        rtscts: bool, default=None
+            Use RTS/CTS hardware flow control, off by default
+
+        Return
+        ------
+        :obj: 'AsyncSixleds'
+            The AsyncSixleds Object, not connected if the port could not be opened
+        '''
+        import serial, serial_asyncio
+        requested = {'baudrate': baudrate, 'rtscts': rtscts, 'timeout': timeout}
+        settings = dict(SERIAL_DEFAULTS)
+        config = os.path.expanduser(conf + '-%02x.conf' % device)
+        try:
+            state = await asyncio.get_running_loop().run_in_executor(None, confstore(config).load)
+        except Exception as e:
+            logging.warning("Failed to load config " + config + ": " + repr(e))
+            state = None
+        if state is not None and 'serial' in state:
+            settings.update(state['serial'])
+        settings.update((key, value) for key, value in requested.items() if value is not None)
+
+        try:
+            reader, writer = await serial_asyncio.open_serial_connection(
+                url=dev,
+                baudrate=settings['baudrate'],
+                parity=serial.PARITY_NONE,
+                stopbits=serial.STOPBITS_ONE,
+                bytesize=serial.EIGHTBITS,
+                rtscts=settings['rtscts']
+            )
+        except serial.SerialException as e:
+            logging.warning("Failed to connect to Display on {0}: Serial Error{1}: {2}".format(dev, e.errno, e.strerror))
+            reader, writer = None, None
+        ld = cls(reader, writer, conf, device, settings['timeout'])
+        if ld.connected():
+            await ld.configure(**requested)
+        return ld
+
+    def connected(self):
+        '''Is the display connected'''
+        return self.writer is not None
+
+    def isopen(self):
+        '''Check if the stream to the display is open'''
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def close(self):
+        '''Close the stream to the display, after the config is written'''
+        await self.confflush()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    def confput(self):
+        '''Save the current config to disk in the background (see sixleds.confput)'''
+        self.unsaved = 0
+        self.confwrite(self.store.save, copy.deepcopy(self.confstate()))
+
+    def confrecord(self, entries):
+        '''Save single changes to disk in the background (see sixleds.confrecord)'''
+        self.unsaved += len(entries)
+        if self.unsaved >= confstore.COMPACT:
+            # the snapshot contains the changes
+            self.confput()
+        else:
+            self.confwrite(self.store.record, copy.deepcopy(entries))
+
+    def confwrite(self, func, data):
+        '''Queue a write of the config, data must not be changed afterwards'''
+        def write():
+            try:
+                func(data)
+            except (IOError, OSError) as e:
+                logging.warning("Failed to save config: I/O error({0}): {1}".format(e.errno, e.strerror))
+        self.confpending = self.confwriter.submit(write)
+
+    async def confflush(self):
+        '''Wait until the changes of the config are on disk'''
+        if self.confpending is not None:
+            await asyncio.wrap_future(self.confpending)
+
+    async def deleteall(self):
+        """Delete all contents on the display (see sixleds.deleteall)"""
+        self.shadow = {}
+        self.confput()
+        return await self.send('<D*>')
+
+    async def defaultrunpage(self, page=''):
+        """The default page to display if no schedules are set (see sixleds.defaultrunpage)"""
+        if len(page) != 1 or page not in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+            logging.info("Invalid Default Run Page " + repr(page))
+            return False
+        self.defaultPage = page
+        self.confrecord([['default', page]])
+        if await self.send("<RP" + self.slot(self.defaultPage) + ">"):
+            logging.info("Default Run Page " + self.defaultPage + " set - OK")
+            return True
+        logging.info("Default Run Page " + self.defaultPage + " set - Failed")
+        return False
+
+    async def setclock(self):
+        """Will set the RTC on the display to localtime (see sixleds.setclock)"""
+        if await self.send(strftime("<SC>%y0%w%m%d%H%M%S", localtime())):
+            logging.info("RTC set - OK")
+            return True
+        logging.info("RTC set - Failed")
+        return False
+
+    async def brightness(self, bn='D'):
+        """Modify the brightness of the screen (see sixleds.brightness)"""
+        if len(bn) == 1 and bn in 'ABCD':
+            if await self.send('<B' + bn + '>' ):
+                logging.info("Brightness set - OK")
+                return True
+            logging.info("Brightness set - Failed")
+        else:
+            print("Invalid brightness")
+        return False
+
+    async def setid(self, newid):
+        """Will set the ID on the display (see sixleds.setid)"""
+        data = "<ID><%02d><E>" % int(newid)
+        logging.info("Send: " + data)
+        async with self.lock:
+            self.writer.write(bytes(data, 'ASCII'))
+            await self.writer.drain()
+            result = await self.readresponse(expected="%02d" % int(newid))
+        if result == RESPONSE_ACK:
+            logging.info("ID set - OK")
+            return True
+        logging.info("ID set - Failed")
+        return False
+
+    async def programgraphic(self, graphicid, blockid, graphiccontent):
+        """Will program a graphic to the display (see sixleds.programgraphic)"""
+        packet = self.graphicpacket(graphicid, blockid, graphiccontent)
+        if packet is None:
+            return
+        result = await self.send(packet)
+        self.bankresult({'G' + graphicid + blockid: RESPONSE_ACK if result else RESPONSE_NACK}, [('G' + graphicid + blockid, packet)])
+        return result
+
+    async def programbank(self, bank, window=1, retries=1, progress=None, force=False):
+        """Program several graphics to the display in one session (see sixleds.programbank)
+
+        Return
+        ------
+        dict
+            slot -> RESPONSE_* result of the graphics which were sent
+        """
+        packets = self.bankchanges(bank, force)
+        report = await self.sendmany(packets, window, retries, progress)
+        self.bankresult(report, packets)
+        return {name[1:]: result for name, result in report.items()}
+
+    def serialport(self):
+        '''Returns the serial port below the stream, opened by AsyncSixleds.open()'''
+        port = getattr(getattr(self.writer, 'transport', None), 'serial', None)
+        if port is None:
+            raise RuntimeError('The stream to the display is no serial port, use AsyncSixleds.open()')
+        return port
+
+    async def configure(self, baudrate=None, rtscts=None, timeout=None, writetimeout=None):
+        """Change the serial settings and save them in the config of the device (see sixleds.configure)
+
+        The write timeout is only saved, writing to the stream never blocks.
+
+        Return
+        ------
+        dict
+            the current settings, see SERIAL_DEFAULTS
+
+        Raises
+        ------
+        RuntimeError
+            if the stream is no serial port
+        """
+        settings = dict(self.serialsettings)
+        requested = {'baudrate': baudrate, 'rtscts': rtscts, 'timeout': timeout, 'writetimeout': writetimeout}
+        settings.update((key, value) for key, value in requested.items() if value is not None)
+        settings['writetimeout'] = settings['writetimeout'] or None
+
+        port = self.serialport()
+        async with self.lock:
+            self.timeout = settings['timeout']
+            if port.baudrate != settings['baudrate']:
+                port.baudrate = settings['baudrate']
+            if port.rtscts != settings['rtscts']:
+                port.rtscts = settings['rtscts']
+
+        if settings != self.serialsettings:
+            logging.info('Serial settings: ' + repr(settings))
+            self.serialsettings = settings
+            self.confrecord([['serial', settings]])
+        return settings
+
+    async def probebaud(self, rates=BAUDRATES, timeout=0.3):
+        """Find the fastest baud rate the display acknowledges and save it (see sixleds.probebaud)
+
+        Return
+        ------
+        int:
+            the baud rate, None if the display did not reply at any rate
+
+        Raises
+        ------
+        RuntimeError
+            if the stream is no serial port
+        """
+        if self.device == 0:
+            logging.info('There is no reply using ID 0, can not probe the baud rate')
+            return None
+        port = self.serialport()
+        found = None
+        async with self.lock:
+            for rate in rates:
+                port.baudrate = rate
+                await self.flushresponse()
+                await self.write(strftime("<SC>%y0%w%m%d%H%M%S", localtime()))
+                if await self.readresponse(timeout=timeout) == RESPONSE_ACK:
+                    logging.info('Baud rate %d - OK' % rate)
+                    found = rate
+                    break
+                logging.info('Baud rate %d - No Reply' % rate)
+            else:
+                port.baudrate = self.serialsettings['baudrate']
+        if found is not None:
+            await self.configure(baudrate=found)
+        return found
+
+    async def pushchanges(self, reset=False, window=1, retries=1, progress=None, swap=None):
+        """ Push the changes to the display (see sixleds.pushchanges)
+
+        Return
+        ------
+        dict
+            packet name (e.g. 'L1PA', 'TA') -> RESPONSE_* result
+        """
+        changes = self.collectchanges(reset)
+        if not changes and not reset:
+            logging.info('Nothing to push')
+            return {}
+
+        # reset display if requested
+        if reset: await self.deleteall()
+
+        if swap or (swap is None and self.spares):
+            return await self.swapchanges(changes, window, retries, progress)
+
+        # begin update (turn the display off)
+        await self.send("<BE>")
+        await asyncio.sleep(0.1)
+
+        # pages with errors in their message are not sent
+        invalid = self.invalidchanges(changes)
+        report = await self.sendmany([(name, packet) for name, packet, item, message in changes if name not in invalid], window, retries, progress)
+        report.update(invalid)
+
+        # end update
+        await asyncio.sleep(0.1)
+        await self.send("<BF>")
+
+        self.pushresult(report, changes)
+        return report
+
+    async def swapchanges(self, changes, window=1, retries=1, progress=None):
+        """Push changes without turning off the display (see sixleds.swapchanges)"""
+        changes, flips = self.backbuffer(changes)
+        invalid = self.invalidchanges(changes)
+        report = await self.sendmany([(name, packet) for name, packet, item, message in changes if name not in invalid], window, retries, progress)
+        report.update(invalid)
+        self.pushresult(report, changes)
+
+        schedules, default = self.switchover(report, flips)
+        if schedules or default:
+            switches = await self.sendmany([(name, packet) for name, packet, item, message in schedules] + default, window, retries, progress)
+            self.pushresult({name: switches[name] for name, packet, item, message in schedules if name in switches}, schedules)
+            report.update(switches)
+        return report
+
+    async def send(self, packet):
+        """Send the packet to the display and return the response
+
+        Return
+        ------
+        bool:
+            from the self.response function
+        """
+        async with self.lock:
+            await self.write(packet)
+            return await self.response()
+
+    async def write(self, packet):
+        """Send the packet to the display without waiting for the response"""
+        self.writer.write(self.frame(packet))
+        await self.writer.drain()
+
+    async def sendmany(self, packets, window=1, retries=1, progress=None):
+        """Send several packets, keeping up to window packets in flight (see sixleds.sendmany)
+
+        Return
+        ------
+        dict:
+            name -> RESPONSE_* result of the last attempt
+        """
+        report = {}
+        pending = list(packets)
+        cancelled = False
+        lost = False
+        async with self.lock:
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    logging.info('Resending %d packet(s)' % len(pending))
+                failed = []
+                unsure = []
+                queue = deque(pending)
+                inflight = deque()
+                while queue or inflight:
+                    # drained now and then, a lost reply only puts the packets since then in doubt
+                    while queue and len(inflight) < max(1, window) and len(unsure) + len(inflight) < DRAIN * max(1, window):
+                        name, packet = queue.popleft()
+                        await self.write(packet)
+                        inflight.append((name, packet))
+                    name, packet = inflight.popleft()
+                    result = RESPONSE_ACK if self.device == 0 else await self.readresponse()
+                    report[name] = result
+                    if result != RESPONSE_ACK:
+                        failed.append((name, packet))
+                    elif inflight:
+                        # the reply of a later packet if the display dropped the one of this packet
+                        unsure.append((name, packet))
+                    if result not in (RESPONSE_ACK, RESPONSE_NACK):
+                        # without a clean reply the following ones can not be matched anymore,
+                        # and the replies read before may have belonged to later packets
+                        for other in unsure + list(inflight):
+                            report[other[0]] = result
+                            failed.append(other)
+                        inflight.clear()
+                        unsure = []
+                        lost = True
+                        await self.flushresponse()
+                    if not inflight:
+                        # every reply was matched to its own packet
+                        unsure = []
+                    if progress is not None and progress(name, result, len(pending) - len(queue) - len(inflight), len(pending)) is False:
+                        cancelled = True
+                        queue.clear()
+                pending = failed
+                if lost:
+                    # the resends are matched one by one
+                    window = 1
+                if not pending or cancelled:
+                    break
+        return report
+
+    async def response(self, expected='ACK', timeout=None):
+        """ Get the response from the display
+        Note: There is no ACK response using Sign ID=00
+
+        Return
+        ------
+        bool:
+            true on success
+        """
+        if(self.device == 0):
+            return True
+        return await self.readresponse(expected, timeout) == RESPONSE_ACK
+
+    async def readresponse(self, expected='ACK', timeout=None):
+        """ Read the reply of the display (see sixleds.readresponse)
+
+        Return
+        ------
+        string:
+            one of RESPONSE_ACK, RESPONSE_NACK, RESPONSE_TIMEOUT, RESPONSE_GARBAGE
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = monotonic() + timeout
+
+        # replies of pipelined packets may already be buffered
+        out = self.rxbuf
+        self.rxbuf = ''
+        while True:
+            result, out, self.rxbuf = self.parseresponse(out, expected)
+            if result is not None:
+                break
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(64), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            out += chunk.decode('ASCII', errors='replace')
+
+        if result is None:
+            result = RESPONSE_GARBAGE if out != '' else RESPONSE_TIMEOUT
+        logging.info('Response: ' + out + ' (' + result + ')')
+        return result
+
+    async def flushresponse(self):
+        '''Drop all replies which were received but not read yet'''
+        self.rxbuf = ''
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(64), 0.01)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from . import __version__
+from .sixleds_graphic import encodegraphic
+from .sixleds_simulator import simulator
+from collections import deque
+from time import monotonic
+import tempfile
+import platform
+import argparse
+import datetime
+import logging
+import json
+import sixleds
+import sys
+import os
+
+
+# the display talks 9600 baud 8N1, 10 bits per byte on the line
+LINE_BAUD = 9600
+
+SCENARIOS = ['full', 'partial', 'graphics', 'schedules']
+
+PAGES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def percentile(values, percent):
+    '''Returns the nearest-rank percentile of the values, None if there are none'''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, -(-len(values) * percent // 100) - 1))]
+
+
+class probe():
+    """Measures where the time of a sixleds object goes
+
+    The methods of the object are wrapped, the object itself is not changed
+    otherwise: encoding (collecting and framing packets), writing, waiting
+    for replies, saving the config and the pauses around <BE>/<BF> of
+    pushchanges are timed separately, written frames and bytes are counted
+    and every reply is matched to the oldest written frame to get the ACK
+    latency (like sendmany matches them). The pauses are measured by
+    replacing the sleep function of the sixleds module, close() restores it.
+    """
+
+    def __init__(self, ld):
+        self.ld = ld
+        self.reset()
+        self.wrap('collectchanges', 'encode')
+        self.wrap('frame', 'encode')
+        self.wrap('readresponse', 'wait')
+        self.wrap('confrecord', 'config')
+        self.wrap('confput', 'config')
+        ld.ser.write = self.timed(self.write, ld.ser.write, 'write')
+        ld.readresponse = self.timed(self.reply, ld.readresponse, None)
+        ld.flushresponse = self.timed(self.flush, ld.flushresponse, None)
+        self.sleep = sixleds.sleep
+        sixleds.sleep = self.timed(None, self.sleep, 'sleep')
+
+    def close(self):
+        '''Restore the sleep function of the sixleds module'''
+        sixleds.sleep = self.sleep
+
+    def reset(self):
+        self.times = {'encode': 0.0, 'write': 0.0, 'wait': 0.0, 'config': 0.0, 'sleep': 0.0}
+        self.packets = 0
+        self.bytes = 0
+        self.latencies = []
+        self.results = {}
+        self.sent = deque()
+
+    def wrap(self, name, category):
+        setattr(self.ld, name, self.timed(None, getattr(self.ld, name), category))
+
+    def timed(self, hook, func, category):
+        def wrapper(*args, **kwargs):
+            start = monotonic()
+            result = func(*args, **kwargs)
+            end = monotonic()
+            if category is not None:
+                self.times[category] += end - start
+            if hook is not None:
+                hook(start, end, args, result)
+            return result
+        return wrapper
+
+    def write(self, start, end, args, result):
+        self.packets += 1
+        self.bytes += len(args[0])
+        self.sent.append(start)
+
+    def reply(self, start, end, args, result):
+        self.results[result] = self.results.get(result, 0) + 1
+        if self.sent:
+            self.latencies.append(end - self.sent.popleft())
+
+    def flush(self, start, end, args, result):
+        # the replies of the packets in flight are discarded
+        self.sent.clear()
+
+    def report(self, seconds, baud=LINE_BAUD, simulated=True):
+        """Returns the measurements since the last reset
+
+        Parameters
+        ------
+        seconds: float
+            The wall time of the measured run
+        baud: int, default=LINE_BAUD
+            The baud rate to compare the throughput with
+        simulated: bool, default=True
+            The simulated display waited for the transfer time at baud,
+            without it the line utilization is meaningless and left out (None)
+
+        Return
+        ------
+        dict:
+            the figures of the run, times in seconds
+        """
+        limit = baud / 10
+        return {
+            'seconds': seconds,
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'packets_per_second': self.packets / seconds if seconds else None,
+            'bytes_per_second': self.bytes / seconds if seconds else None,
+            'line_bytes_per_second': limit,
+            'line_utilization': self.bytes / seconds / limit if seconds and simulated else None,
+            'line_seconds': self.bytes / limit,
+            'replies': self.results,
+            'ack_latency': {
+                'p50': percentile(self.latencies, 50),
+                'p90': percentile(self.latencies, 90),
+                'p99': percentile(self.latencies, 99),
+                'max': max(self.latencies) if self.latencies else None,
+            },
+            'encode_seconds': self.times['encode'],
+            'write_seconds': self.times['write'],
+            'wait_seconds': self.times['wait'],
+            'config_seconds': self.times['config'],
+            'sleep_seconds': self.times['sleep'],
+            'other_seconds': seconds - sum(self.times.values()),
+        }
+
+
+def graphicbank(count=8, run=0):
+    '''Returns count encoded test graphics, slot -> graphic (see programbank), they differ for every run'''
+    bank = {}
+    for i in range(count):
+        slot = 'ABCDEFGHIJKLMNOP'[i // 8] + str(i % 8 + 1)
+        rows = [('ADE@'[(i + row + run) % 4] * (row + 1 + run % 8)).ljust(32, '@') for row in range(7)]
+        bank[slot] = encodegraphic(rows)
+    return bank
+
+
+def scenario(ld, meter, name, run, window=1, retries=1):
+    """Run one pass of a scenario
+
+    Parameters
+    ------
+    ld: :obj: 'sixleds'
+        The connection to the (simulated) display
+    meter: :obj: 'probe'
+        The probe of ld, the encoding of graphics is added to it
+    name: string
+        One of SCENARIOS
+    run: int
+        Number of the pass, to make every pass change the contents
+    window, retries: int, default=1
+        see sendmany
+    """
+    if name == 'full':
+        # every page changes
+        for page in PAGES:
+            ld.updateline(page, '<CB>Page %s run %d' % (page, run), FX='A', MX='A', WX='C', FY='A')
+        ld.pushchanges(window=window, retries=retries)
+    elif name == 'partial':
+        # a few pages of a full program change
+        for page in PAGES[:3]:
+            ld.updateline(page, '<CC>Update %s run %d' % (page, run))
+        ld.pushchanges(window=window, retries=retries)
+    elif name == 'graphics':
+        start = monotonic()
+        bank = graphicbank(run=run)
+        meter.times['encode'] += monotonic() - start
+        ld.programbank(bank, window=window, retries=retries)
+    elif name == 'schedules':
+        for i, sched in enumerate('ABCDE'):
+            ld.updatesched(sched, PAGES[i:i + 3 + run % 3], True, '2601010000', '2612312359')
+        ld.pushchanges(window=window, retries=retries)
+
+
+def benchmark(scenarios=SCENARIOS, windows=(1,), repeat=3, retries=1, latency=0.0, simulatebaud=LINE_BAUD, nackrate=0.0, seed=0, baud=LINE_BAUD):
+    """Measure pushes against a simulated display (see sixleds_simulator)
+
+    Every scenario runs on a fresh display and config. The first pass of
+    'partial' pushes the full program, it is not measured.
+
+    Parameters
+    ------
+    scenarios: list, default=SCENARIOS
+        'full' (26 pages), 'partial' (3 of 26 pages), 'graphics' (8 graphic
+        blocks) and 'schedules' (5 schedules)
+    windows: list, default=(1,)
+        The send windows to measure every scenario with
+    repeat: int, default=3
+        Passes per scenario and window
+    retries: int, default=1
+        see sendmany
+    latency, simulatebaud, nackrate, seed:
+        The behavior of the simulated display, see simulator; without
+        simulatebaud the line utilization is not reported
+    baud: int, default=LINE_BAUD
+        The baud rate to compare the throughput with
+
+    Return
+    ------
+    dict:
+        the settings and one result per scenario and window, ready for JSON
+    """
+    results = []
+    for window in windows:
+        for name in scenarios:
+            sim = simulator(latency=latency, baud=simulatebaud, nackrate=nackrate, seed=seed)
+            port = sim.open()
+            sim.start()
+            with tempfile.TemporaryDirectory() as confdir:
+                ld = sixleds.sixleds(dev=port, conf=os.path.join(confdir, 'bench'))
+                if not ld.connected():
+                    sim.stop()
+                    raise OSError(ld.error)
+                meter = probe(ld)
+                try:
+                    if name == 'partial':
+                        scenario(ld, meter, 'full', 0, window, retries)
+                        meter.reset()
+                    passes = []
+                    start = monotonic()
+                    for run in range(1, repeat + 1):
+                        begin = monotonic()
+                        scenario(ld, meter, name, run, window, retries)
+                        passes.append(monotonic() - begin)
+                    result = meter.report(monotonic() - start, baud, simulatebaud is not None)
+                finally:
+                    meter.close()
+                ld.close()
+            sim.stop()
+            result.update({'scenario': name, 'window': window, 'passes': passes})
+            results.append(result)
+            logging.info('Benchmark %s window %d: %.3f s' % (name, window, result['seconds']))
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'settings': {
+            'repeat': repeat, 'retries': retries, 'latency': latency,
+            'simulatebaud': simulatebaud, 'nackrate': nackrate, 'seed': seed, 'baud': baud,
+        },
+        'results': results,
+    }
+
+
+def summary(data):
+    '''Returns a table of the results of benchmark()'''
+    lines = ['%-10s %6s %8s %8s %9s %7s %8s %8s %8s %8s %8s' % (
+        'scenario', 'window', 'seconds', 'pkt/s', 'bytes/s', 'line%', 'p50 ms', 'p99 ms', 'encode', 'wait', 'sleep')]
+    for r in data['results']:
+        latency = r['ack_latency']
+        lines.append('%-10s %6d %8.3f %8.1f %9.1f %7s %8s %8s %8.3f %8.3f %8.3f' % (
+            r['scenario'], r['window'], r['seconds'], r['packets_per_second'], r['bytes_per_second'],
+            'n/a' if r['line_utilization'] is None else '%.1f%%' % (r['line_utilization'] * 100),
+            '-' if latency['p50'] is None else '%.2f' % (latency['p50'] * 1000),
+            '-' if latency['p99'] is None else '%.2f' % (latency['p99'] * 1000),
+            r['encode_seconds'], r['wait_seconds'], r['sleep_seconds']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sixleds benchmark - measure pushes against a simulated display')
+    parser.add_argument("--scenario", nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--window", nargs='+', default=[1], type=int, help="send windows to measure")
+    parser.add_argument("--repeat", default=3, type=int, help="passes per scenario and window")
+    parser.add_argument("--retries", default=1, type=int)
+    parser.add_argument("--latency", default=0.0, type=float, help="seconds the simulated display needs per frame")
+    parser.add_argument("--simulate-line", action="store_true", default=True, help="let the simulated display wait for the transfer time at --baud (default)")
+    parser.add_argument("--no-simulate-line", action="store_false", dest="simulate_line", help="answer at once, the line utilization is not reported then")
+    parser.add_argument("--nack-rate", default=0.0, type=float, help="probability of the simulated display to reply NACK")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--baud", default=LINE_BAUD, type=int, help="baud rate to compare the throughput with")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if(args.verbose):
+        logging.getLogger().setLevel(logging.INFO)
+
+    data = benchmark(args.scenario, args.window, args.repeat, args.retries, args.latency,
+        args.baud if args.simulate_line else None, args.nack_rate, args.seed, args.baud)
+    print(summary(data))
+    if(args.output):
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+    else:
+        json.dump(data, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
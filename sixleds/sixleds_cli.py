@@ -2,9 +2,71 @@
 # -*- coding: utf-8 -*-
 
 from . import __version__, __author__, __copyright__, __website__, __license__
+from . import sixleds_daemon, sixleds_graphic, sixleds_image, sixleds_emulator, sixleds_magic, sixleds_stream
+import os
 import sixleds
 import argparse
 import logging
+import signal
+
+
+def daemonrequest(args):
+    '''Execute the operational parameters on a running sixledsd instead of opening the port
+
+    Return
+    ------
+    int:
+        the exit code
+    '''
+    if(args.window != 1):
+        print("Error: --window is not available with --socket, sixledsd sends one packet at a time! Exit.")
+        return 1
+    queueing = {'priority':args.priority, 'deadline':args.deadline}
+    if(args.print_config):
+        cmd, params = 'show', {}
+    elif(args.send != ""):
+        cmd, params = 'send', dict(queueing, packet=args.send)
+    elif(args.set_brightness):
+        cmd, params = 'brightness', {'value':args.set_brightness}
+    elif(args.set_default):
+        cmd, params = 'default', {'page':args.set_default}
+    elif(args.set_time):
+        cmd, params = 'time', {}
+    elif(args.delete_all):
+        cmd, params = 'delete', {}
+    elif(args.probe_baud):
+        cmd, params = 'probe', {}
+    elif(args.set_page != "" and args.content != ""):
+        cmd, params = 'page', {'page':args.set_page, 'content':args.content,
+            'leading':args.leading_fx, 'display':args.display_fx, 'wait':args.wait_time, 'lagging':args.lagging_fx,
+            'spare':args.spare_page, **queueing}
+    elif(args.program_graphic != "" and args.block != "" and args.file != ""):
+        content = sixleds_image.loadgraphic(args.file)
+        cmd, params = 'graphic', {'graphic':args.program_graphic, 'block':args.block, 'content':content}
+    elif(args.program_bank != ""):
+        cmd, params = 'bank', dict(queueing, manifest=os.path.abspath(args.program_bank))
+    elif(args.stream != ""):
+        print("Error: --stream needs the serial port and is not available with --socket! Exit.")
+        return 1
+    elif(args.set_schedule != ""):
+        cmd, params = 'schedule', {'schedule':args.set_schedule, 'pages':args.schedule_pages,
+            'start':args.start, 'end':args.end, **queueing}
+    else:
+        print("Error: The interactive shell is not available with --socket! Exit.")
+        return 1
+
+    try:
+        response = sixleds_daemon.request(args.socket, cmd, **params)
+    except OSError as e:
+        print("Error: Could not connect to sixledsd on " + args.socket + ": " + str(e))
+        return 1
+    if('error' in response):
+        print("Error: " + response['error'])
+        return 1
+    print(response['output'], end='')
+    if(args.verbose):
+        print(response['result'])
+    return 0
 
 
 def main():
@@ -15,6 +77,16 @@ Configuration Parameters (for use with command line and interactive shell):
  --conf <PATH> : config file path
  --port <PATH> : serial port (default /dev/ttyUSB0)
  --id   <INT>  : device id to address
+ --window <INT> : packets to send ahead before waiting for the ACK (default 1, not with --socket)
+ --baud <INT>   : baud rate of the serial line (default 9600, or the one saved for the device)
+ --flow-control <none|rtscts> : RTS/CTS hardware flow control (default none)
+ --timeout <SEC>       : seconds to wait for the reply of the display (default 1.0)
+ --write-timeout <SEC> : seconds a write may block (default 0 = no limit)
+                         (line settings which are given are saved for the device)
+ --socket <PATH> : send the operational parameters to a running sixledsd instead of opening the port
+ --priority <urgent|normal|background> : with --socket: urgent pages are sent before the rest of a running push
+                                         (default normal)
+ --deadline <SEC> : with --socket: drop the packets which could not be sent within SEC seconds
  --verbose     : enable debug output
 
 Operational Paramaters (disables the interactive shell):
@@ -26,6 +98,7 @@ Operational Paramaters (disables the interactive shell):
  --set-default <VALUE>    : configure the default run page when no schedules active (A..Z)
  --set-time               : write time to device RTC
  --delete-all             : delete all contents on the device
+ --probe-baud             : find the fastest baud rate the device acknowledges and save it
  --send                   : send raw command to device
 
  --set-page <PAGE>      : change content of page where <PAGE> is A..Z, requires --content parameter
@@ -34,16 +107,42 @@ Operational Paramaters (disables the interactive shell):
  [--lagging-fx <VALUE>] : lagging effect to set to the page, <VALUE> should be A..K
  [--display-fx <VALUE>] : display effect to set to the page, <VALUE> should be A..E, Q..U, a..e, q..u
  [--wait-time  <VALUE>] : wait time to set to the page, <VALUE> should be A..Z
+ [--spare-page <PAGE>]  : update the page through a spare page which is not used otherwise, the new content
+                          is written while the old one is shown and the display switches over at once,
+                          the spare page is saved for the page (- to stop)
 
  --program-graphic <GRAPHIC> : send graphic to device where <GRAPHIC> is A..Z, requires --block and --file parameter
  --block <BLOCK              : the graphic block to program, range: 1..8
- --file <FILE>               : the path to graphic file (a simple text file, see sample-graphics folder)
+ --file <FILE>               : the path to graphic file (a simple text file, see sample-graphics folder,
+                               or a PNG/PPM/BMP image which is converted, requires Pillow and NumPy)
+
+ --import-image <PATH> : convert an image or all images in a directory into graphic files (<NAME>.txt)
+                         next to the images, requires Pillow and NumPy
+ [--no-dither]         : convert images with a fixed threshold instead of dithering
+
+ --program-bank <MANIFEST> : send all graphics listed in the manifest to the device,
+                             one line per graphic: <GRAPHIC A..P> <BLOCK 1..8> <FILE>
+
+ --export-gif <FILE>      : render the page given by --content and the effect parameters
+                            into an animated GIF instead of sending it, requires Pillow and NumPy
+ [--display-width <INT>]  : LED columns of the emulated display (default 80)
+ [--graphics <MANIFEST>]  : graphics to show for <Gxn>, see --program-bank
 
  --set-schedule <SCHEDULE> : set schedule - <SCHEDULE> is the schedule slot to modify (A..E)
  --schedule-pages <PAGES>  : set the page display order for this schedule (e.g. ABEFC)
                              schedule will be deleted if empty
  --start <YYMMDDHHmm>      : schedule start time
  --end <YYMMDDHHmm>        : schedule end time
+
+ --stream <SOURCE>        : keep the port open and push the page updates read from <SOURCE>, one per line:
+                            <PAGE> <CONTENT> (e.g. "A <CB>Queue: 12"); <SOURCE> is - (stdin), a FIFO path,
+                            unix:<PATH> or tcp:<HOST>:<PORT> (listen for clients); uses the effect parameters
+ [--stream-window <SEC>]  : seconds to collect updates before pushing them, only the last update
+                            of a page is sent (default 0.2)
+
+ --cycle-time <PAGES>     : print how long the display needs to show the pages of a schedule
+                            (e.g. ABEFC) as saved in the config, without opening the port
+ [--display-width <INT>]  : LED columns of the display (default 80)
 '''
 
     helpInteractiveShell = '''
@@ -140,6 +239,15 @@ Display Method Characters:
     parser.add_argument("--conf", default="~/.config/sixleds/config", type=str)
     parser.add_argument("--port", default="/dev/ttyUSB0", type=str)
     parser.add_argument("--id", default=0, type=int)
+    parser.add_argument("--window", default=1, type=int)
+    parser.add_argument("--baud", default=None, type=int)
+    parser.add_argument("--flow-control", default=None, choices=["none", "rtscts"])
+    parser.add_argument("--timeout", default=None, type=float)
+    parser.add_argument("--write-timeout", default=None, type=float)
+    parser.add_argument("--probe-baud", action="store_true")
+    parser.add_argument("--socket", default="", type=str)
+    parser.add_argument("--priority", default="normal", choices=["urgent", "normal", "background"])
+    parser.add_argument("--deadline", default=None, type=float)
     parser.add_argument("--verbose", action="store_true")
     parser.add_argument("--version", action="store_true")
     parser.add_argument("--help", action="store_true")
@@ -155,13 +263,23 @@ Display Method Characters:
     parser.add_argument("--program-graphic", default="", type=str)
     parser.add_argument("--block", default="", type=str)
     parser.add_argument("--file", default="", type=str)
+    parser.add_argument("--program-bank", default="", type=str)
+    parser.add_argument("--import-image", default="", type=str)
+    parser.add_argument("--no-dither", action="store_true")
+    parser.add_argument("--export-gif", default="", type=str)
+    parser.add_argument("--display-width", default=80, type=int)
+    parser.add_argument("--graphics", default="", type=str)
     parser.add_argument("--wait-time", default="A", type=str)
+    parser.add_argument("--spare-page", default="", type=str)
     parser.add_argument("--set-schedule", default="", type=str)
     parser.add_argument("--schedule-pages", default="", type=str)
     parser.add_argument("--start", default="", type=str)
     parser.add_argument("--end", default="", type=str)
     parser.add_argument("--send", default="", type=str)
     parser.add_argument("--content", default="", type=str)
+    parser.add_argument("--cycle-time", default="", type=str)
+    parser.add_argument("--stream", default="", type=str)
+    parser.add_argument("--stream-window", default=0.2, type=float)
     args = parser.parse_args()
 
     if(args.help):
@@ -177,10 +295,64 @@ Display Method Characters:
         print( "Verbose Mode" )
         logging.getLogger().setLevel(logging.INFO)
 
+    if(args.import_image != ""):
+        # offline conversion, no serial port needed
+        outdir = args.import_image if os.path.isdir(args.import_image) else os.path.dirname(os.path.abspath(args.import_image))
+        result = sixleds_image.importimages([args.import_image], dither=not args.no_dither, outdir=outdir)
+        for fileName in result:
+            print(os.path.splitext(fileName)[0] + ".txt")
+        exit(0 if len(result) > 0 else 1)
+
+    if(args.export_gif != ""):
+        # offline rendering with the emulator, no serial port needed
+        if(args.content == ""):
+            print("Error: --export-gif requires --content! Exit.")
+            exit(1)
+        try:
+            graphics = sixleds_graphic.compilebank(args.graphics) if args.graphics != "" else {}
+        except (OSError, ValueError) as e:
+            print("Error: " + str(e))
+            exit(1)
+        page = sixleds.opage(args.content, args.leading_fx, args.display_fx, args.wait_time, args.lagging_fx)
+        duration = sixleds_emulator.emulator(width=args.display_width, graphics=graphics).exportgif(page, args.export_gif)
+        print(args.export_gif + " (%.1f sec)" % duration)
+        exit(0)
+
+    if(args.cycle_time != ""):
+        # offline estimation from the saved pages, no serial port needed
+        store = sixleds.confstore(os.path.expanduser(args.conf + '-%02x.conf' % args.id))
+        state = store.load() or {'lines': {}}
+        line = state['lines'].get('1', {})
+        total = 0.0
+        for pagenum in args.cycle_time:
+            if(pagenum not in line):
+                print("(" + pagenum + ") not configured")
+                continue
+            seconds = sixleds.confstore.loaditem(line[pagenum]).estimate_duration(args.display_width)
+            total += seconds
+            print("(" + pagenum + ") %6.1f sec" % seconds)
+        print("Cycle time: %.1f sec" % total)
+        exit(0)
+
+    if(args.set_page != "" and args.content != ""):
+        # check the magic strings before anything is sent
+        code = sixleds_magic.compilemessage(args.content)
+        if(code.errors):
+            print("Error: " + code.describe().replace("\n", "\nError: "))
+            exit(1)
+        if(code.warnings):
+            print("Warning: " + code.describe(warnings=True).replace("\n", "\nWarning: "))
+        logging.info("Message: %d bytes (%d bytes saved)" % (code.length, code.saved))
+
+    if(args.socket != ""):
+        exit(daemonrequest(args))
+
     print( "Using Serial Port: " + args.port )
     print( "Adressing ID: " + str(args.id) )
 
-    ld = sixleds.sixleds(dev=args.port, conf=args.conf, device=args.id)
+    ld = sixleds.sixleds(dev=args.port, conf=args.conf, device=args.id,
+        timeout=args.timeout, baudrate=args.baud, writetimeout=args.write_timeout,
+        rtscts=None if args.flow_control is None else args.flow_control == "rtscts")
 
     if(not ld.isopen()):
         print("Error: Could not open serial port! Exit.")
@@ -196,30 +368,66 @@ Display Method Characters:
         ld.brightness(args.set_brightness)
         exit(0)
     elif(args.set_default):
-        ld.send('<RP'+args.set_default+'>')
+        ld.defaultrunpage(args.set_default)
         exit(0)
     elif(args.set_time):
         ld.setclock()
         exit(0)
     elif(args.delete_all):
-        ld.send('<D*>')
+        ld.deleteall()
+        exit(0)
+    elif(args.probe_baud):
+        rate = ld.probebaud()
+        if(rate is None):
+            print("Error: The device did not reply at any baud rate!")
+            exit(1)
+        print("Baud rate: " + str(rate))
         exit(0)
     elif(args.set_page != "" and args.content != ""):
+        if(args.spare_page != "" and not ld.doublebuffer(args.set_page, None if args.spare_page == "-" else args.spare_page)):
+            print("Error: Page " + args.spare_page + " is in use and can not be the spare page! Exit.")
+            exit(1)
         ld.updateline(args.set_page, args.content, '1', args.leading_fx, args.display_fx, args.wait_time, args.lagging_fx)
-        ld.pushchanges()
+        ld.pushchanges(window=args.window)
         exit(0)
     elif(args.program_graphic != "" and args.block != "" and args.file != ""):
-        file = open(args.file, "r")
-        content = file.read()
-        file.close()
+        content = sixleds_image.loadgraphic(args.file)
         ld.programgraphic(args.program_graphic, args.block, content)
         exit(0)
+    elif(args.program_bank != ""):
+        try:
+            bank = sixleds_graphic.compilebank(args.program_bank)
+        except (OSError, ValueError) as e:
+            print("Error: " + str(e))
+            exit(1)
+        report = ld.programbank(bank, window=args.window)
+        for slot, result in report.items():
+            print(slot + ": " + result)
+        if(not report):
+            print("No graphic changed")
+        exit(0)
     elif(args.set_schedule != ""):
         if args.schedule_pages == '' or args.start == '' or args.end == '':
             ld.updatesched(args.set_schedule, active=False)
         else:
             ld.updatesched(args.set_schedule, args.schedule_pages, active=True, start=args.start, end=args.end)
-        ld.pushchanges()
+        ld.pushchanges(window=args.window)
+        exit(0)
+    elif(args.stream != ""):
+        stream = sixleds_stream.ticker(ld, args.stream_window,
+            args.leading_fx, args.display_fx, args.wait_time, args.lagging_fx, args.window)
+        # push the queued updates and clean up on SIGTERM as well
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+        try:
+            stream.serve(args.stream)
+        except OSError as e:
+            print("Error: " + str(e))
+            exit(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ld.close()
+        logging.info(stream.stats)
         exit(0)
     else:
         print( "Welcome to interactive shell. Type 'help' for more information." )
@@ -245,10 +453,10 @@ Display Method Characters:
 
         elif cmd == 'default':
             page = input('Default Run Page (A..Z): ')
-            ld.send('<RP'+page+'>')
+            ld.defaultrunpage(page)
 
         elif cmd == 'delete':
-            ld.send('<D*>')
+            ld.deleteall()
 
         elif cmd == 'bright':
             brightness = input('Brightness (A..D): ')
@@ -269,6 +477,12 @@ Display Method Characters:
             if(displayfx == ''): displayfx = 'Q'
             if(waittime == ''): waittime = 'A'
             if(outfx == ''): outfx = 'E'
+            code = sixleds_magic.compilemessage(message)
+            if(code.errors):
+                print(code.describe())
+                continue
+            if(code.warnings):
+                print(code.describe(warnings=True))
             ld.updateline(page, message, '1', infx, displayfx, waittime, outfx)
 
         elif cmd == 'sched':
@@ -282,7 +496,7 @@ Display Method Characters:
                 ld.updatesched(sched, pages, active=True, start=start, end=end)
 
         elif cmd == 'push':
-            ld.pushchanges()
+            ld.pushchanges(window=args.window)
 
         else:
             ld.send(cmd)
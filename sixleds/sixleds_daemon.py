@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from . import __version__
+from . import sixleds_graphic
+from .sixleds_transmit import transmitter, PRIORITIES
+import sixleds
+import socketserver
+import argparse
+import logging
+import inspect
+import signal
+import socket
+import json
+import io
+import os
+
+
+DEFAULT_SOCKET = '~/.config/sixleds/sixledsd.sock'
+
+
+class SixledsRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection
+
+    Every line sent by the client is a JSON object {"cmd": ..., "args": {...}},
+    every answer is a JSON object {"result": ..., "output": ...} or {"error": ...}.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self.server.execute(request.get('cmd', ''), request.get('args', {}))
+            except Exception as e:
+                logging.exception('Request failed')
+                response = {'error': str(e)}
+            self.wfile.write(bytes(json.dumps(response) + '\n', 'utf-8'))
+
+
+class SixledsDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Keeps the serial port and the display config open and serves requests on a Unix socket
+
+    Clients are served in parallel, but only the transmitter (see
+    sixleds_transmit) addresses the display: page, schedule and push
+    requests are queued by priority, so an urgent page is sent before the
+    rest of a running bulk push. Other commands wait until the packet in
+    flight is done and then use the display exclusively.
+
+    The cmd_ methods get the stream for the output of the request as first
+    parameter, sys.stdout is shared by all requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, ld):
+        self.ld = ld
+        self.tx = transmitter(ld)
+        self.tx.start()
+        if os.path.exists(path):
+            os.remove(path)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        super(SixledsDaemon, self).__init__(path, SixledsRequestHandler)
+        # only the user running the daemon may drive the display
+        os.chmod(path, 0o600)
+
+    def execute(self, cmd, args):
+        '''Execute a command on the display
+
+        Return
+        ------
+        dict:
+            the answer for the client
+        '''
+        handler = getattr(self, 'cmd_' + cmd, None)
+        if handler is None:
+            return {'error': 'Unknown command: ' + cmd}
+        output = io.StringIO()
+        try:
+            inspect.signature(handler).bind(output, **args)
+        except TypeError as e:
+            return {'error': 'Invalid arguments for ' + cmd + ': ' + str(e)}
+        try:
+            result = handler(output, **args)
+        except ValueError as e:
+            return {'error': str(e)}
+        return {'result': result, 'output': output.getvalue()}
+
+    def exclusive(self, func, *args):
+        return self.tx.exclusive(func, *args)
+
+    @staticmethod
+    def priority(name):
+        '''Returns the priority class of a name (see PRIORITIES)'''
+        if name not in PRIORITIES:
+            raise ValueError('Unknown priority: ' + str(name))
+        return PRIORITIES[name]
+
+    def report(self, tickets):
+        '''Wait for the tickets of the transmitter, returns name -> RESPONSE_* result'''
+        result = {}
+        for item in tickets:
+            result[item.name] = item.wait()
+            if item.report is not None:
+                result.update(item.report)
+        return result
+
+    def server_close(self):
+        self.tx.stop()
+        super(SixledsDaemon, self).server_close()
+
+    def cmd_show(self, output):
+        self.exclusive(self.ld.show, output)
+
+    def cmd_send(self, output, packet, priority='normal', deadline=None):
+        return self.tx.submit(None, packet, self.priority(priority), deadline).wait() == sixleds.RESPONSE_ACK
+
+    def cmd_brightness(self, output, value):
+        if len(value) != 1 or value not in 'ABCD':
+            print('Invalid brightness', file=output)
+            return False
+        return self.exclusive(self.ld.brightness, value)
+
+    def cmd_default(self, output, page):
+        if len(page) != 1 or page not in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+            raise ValueError('Invalid page: ' + page)
+        # the page is saved, switchover needs it to show the spare page
+        return self.exclusive(self.ld.defaultrunpage, page)
+
+    def cmd_time(self, output):
+        return self.exclusive(self.ld.setclock)
+
+    def cmd_delete(self, output):
+        return self.exclusive(self.ld.deleteall)
+
+    def cmd_probe(self, output):
+        rate = self.exclusive(self.ld.probebaud)
+        if rate is not None:
+            print('Baud rate: ' + str(rate), file=output)
+        return rate
+
+    def cmd_setid(self, output, newid):
+        return self.exclusive(self.ld.setid, newid)
+
+    def cmd_page(self, output, page, content, leading='E', display='Q', wait='A', lagging='E', priority='normal', deadline=None, spare=''):
+        if len(page) != 1 or page not in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+            raise ValueError('Invalid page: ' + page)
+        if content == '':
+            raise ValueError('No content for page ' + page)
+        if spare != '' and not self.exclusive(self.ld.doublebuffer, page, None if spare == '-' else spare):
+            raise ValueError('Page ' + spare + ' is in use and can not be the spare page')
+        return self.report(self.tx.updateline(page, content, '1', leading, display, wait, lagging, self.priority(priority), deadline))
+
+    def cmd_schedule(self, output, schedule, pages='', start='', end='', priority='normal', deadline=None):
+        if len(schedule) != 1 or schedule not in 'ABCDE':
+            raise ValueError('Invalid schedule: ' + schedule)
+        with self.tx.lock:
+            if pages == '' or start == '' or end == '':
+                self.ld.updatesched(schedule, active=False)
+            else:
+                self.ld.updatesched(schedule, pages, active=True, start=start, end=end)
+        return self.report(self.tx.pushchanges(self.priority(priority), deadline))
+
+    def cmd_push(self, output, priority='background', deadline=None):
+        return self.report(self.tx.pushchanges(self.priority(priority), deadline))
+
+    def cmd_graphic(self, output, graphic, block, content):
+        return self.exclusive(self.ld.programgraphic, graphic, block, content)
+
+    def cmd_bank(self, output, manifest, priority='background', deadline=None):
+        try:
+            bank = sixleds_graphic.compilebank(manifest)
+        except OSError as e:
+            raise ValueError(str(e))
+        report = self.report(self.tx.programbank(bank, self.priority(priority), deadline))
+        return {name[1:]: result for name, result in report.items()}
+
+
+def request(path, cmd, **args):
+    '''Send a command to a running sixledsd
+
+    Paramaters
+    ------
+    path: string
+        The socket of the daemon
+    cmd: string
+        The command, e.g. 'page' (see the cmd_ methods of SixledsDaemon)
+    args:
+        The parameters of the command
+
+    Return
+    ------
+    dict:
+        {'result': ..., 'output': ...} or {'error': ...}
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(os.path.expanduser(path))
+        s.sendall(bytes(json.dumps({'cmd': cmd, 'args': args}) + '\n', 'utf-8'))
+        with s.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sixleds daemon - keeps the serial port open and serves sixleds-cli --socket requests')
+    parser.add_argument("--conf", default="~/.config/sixleds/config", type=str)
+    parser.add_argument("--port", default="/dev/ttyUSB0", type=str)
+    parser.add_argument("--id", default=0, type=int)
+    parser.add_argument("--baud", default=None, type=int)
+    parser.add_argument("--flow-control", default=None, choices=["none", "rtscts"])
+    parser.add_argument("--timeout", default=None, type=float)
+    parser.add_argument("--write-timeout", default=None, type=float)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, type=str)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--version", action="store_true")
+    args = parser.parse_args()
+
+    if(args.version):
+        print(__version__)
+        exit(0)
+
+    if(args.verbose):
+        logging.getLogger().setLevel(logging.INFO)
+
+    ld = sixleds.sixleds(dev=args.port, conf=args.conf, device=args.id,
+        timeout=args.timeout, baudrate=args.baud, writetimeout=args.write_timeout,
+        rtscts=None if args.flow_control is None else args.flow_control == "rtscts")
+    if(not ld.isopen()):
+        print("Error: Could not open serial port! Exit.")
+        exit(1)
+
+    path = os.path.expanduser(args.socket)
+    server = SixledsDaemon(path, ld)
+    # let serve_forever() return on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+    print("Listening on " + path)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+        ld.close()
+
+
+if __name__ == "__main__":
+    main()
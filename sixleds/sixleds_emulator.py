@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .sixleds_graphic import COLORS, ROWS, WIDTH, decodegraphic, graphicrows
+from .sixleds_magic import compilemessage, TTABLE
+from functools import lru_cache
+from time import localtime, strftime
+import unicodedata
+
+
+# the 5x7 glyphs of ASCII 20H..7FH, 5 columns per char, bit 0 is the top row
+GLYPHS = bytes.fromhex(
+    '0000000000' '00005f0000' '0007000700' '147f147f14' '242a7f2a12' '2313086462' '3649552250' '0005030000'
+    '001c224100' '0041221c00' '082a1c2a08' '08083e0808' '0050300000' '0808080808' '0060600000' '2010080402'
+    '3e5149453e' '00427f4000' '4261514946' '2141454b31' '1814127f10' '2745454539' '3c4a494930' '0171090503'
+    '3649494936' '064949291e' '0036360000' '0056360000' '0814224100' '1414141414' '0041221408' '0201510906'
+    '324979413e' '7e1111117e' '7f49494936' '3e41414122' '7f4141221c' '7f49494941' '7f09090101' '3e41415132'
+    '7f0808087f' '00417f4100' '2040413f01' '7f08142241' '7f40404040' '7f0204027f' '7f0408107f' '3e4141413e'
+    '7f09090906' '3e4151215e' '7f09192946' '4649494931' '01017f0101' '3f4040403f' '1f2040201f' '7f2018207f'
+    '6314081463' '0304780403' '6151494543' '007f414100' '0204081020' '0041417f00' '0402010204' '4040404040'
+    '0001020400' '2054545478' '7f48444438' '3844444420' '384444487f' '3854545418' '087e090102' '081454543c'
+    '7f08040478' '00447d4000' '2040443d00' '007f102844' '00417f4000' '7c04180478' '7c08040478' '3844444438'
+    '7c14141408' '081414187c' '7c08040408' '4854545420' '043f444020' '3c4040207c' '1c2040201c' '3c4030403c'
+    '4428102844' '0c5050503c' '4464544c44' '0008364100' '00007f0000' '0041360800' '0201020402' '7f7f7f7f7f'
+)
+
+# font code -> (width, height) of the glyphs, see glyph()
+FONTS = {'A': (5, 7), 'B': (6, 7), 'C': (4, 7), 'D': (7, 13), 'E': (5, 8)}
+
+# lower case letters which reach below the base line in the long font
+DESCENDERS = 'gjpqy'
+
+# <KD> and <KT> with the widest digits, for widths without the time
+CLOCK_TEXTS = {'D': '00/00/00', 'T': '00:00'}
+
+# 2 bit color codes, as in graphics
+OFF, GREEN, RED, YELLOW = COLORS['@'], COLORS['D'], COLORS['A'], COLORS['E']
+
+# color code -> (foreground, background), the LEDs only know red, green and both,
+# so dim and bright variants look the same
+TEXT_COLORS = {
+    'A': (RED, OFF),    'B': (RED, OFF),    'C': (RED, OFF),
+    'D': (GREEN, OFF),  'E': (GREEN, OFF),  'F': (GREEN, OFF),
+    'G': (YELLOW, OFF), 'H': (YELLOW, OFF), 'I': (YELLOW, OFF),
+    'J': (YELLOW, OFF), 'K': (YELLOW, OFF),
+    'L': (OFF, RED),    'M': (OFF, GREEN),  'N': (OFF, YELLOW),
+    'P': (RED, GREEN),  'Q': (GREEN, RED),
+    'R': (None, OFF),   'S': (None, OFF),
+}
+
+# R/Y/G: red upper rows, yellow middle rows and green lower rows
+RYG_ROWS = [RED, RED, YELLOW, YELLOW, YELLOW, GREEN, GREEN, GREEN]
+
+# rainbow: changes the color every column
+RAINBOW = [RED, YELLOW, GREEN]
+
+# display method -> speed level, 1 is the fastest
+SPEEDS = {}
+for level, methods in enumerate(('ABCDE', 'QRSTU', 'abcde', 'qrstu'), 1):
+    SPEEDS.update((method, level) for method in methods)
+
+# seconds per animation step of a speed level, estimated from watching the display
+STEP_TIME = {1: 0.02, 2: 0.035, 3: 0.05, 4: 0.07}
+
+# texts of the pen writing leading effects
+PEN_TEXTS = {'Q': 'Hello World', 'R': 'Welcome', 'S': 'Amplus'}
+
+# screen colors of the code values (off, green, red, yellow) for images
+PALETTE = [(40, 40, 40), (0, 230, 0), (255, 20, 20), (255, 190, 0)]
+
+# <Uxx> -> the char it stands for
+EUROPEAN = dict((tag, chr(char)) for char, tag in TTABLE.items())
+
+
+def waittime(WX):
+    '''Returns the wait time of a page in seconds (A = 0.5, B = 1, C = 2, .. Z = 25)'''
+    index = ord(WX) - ord('A')
+    return 0.5 if index == 0 else 1 if index == 1 else float(index)
+
+
+@lru_cache(maxsize=1024)
+def linewidth(message):
+    """Returns the number of LED columns a message takes, without rendering it
+
+    Follows strip(): every char takes the columns of its glyph and a blank
+    column (see advance()), a graphic 32 columns and <Nxx> moves to a
+    column. The date and time are counted with their widest digits.
+
+    Parameters
+    ------
+    message: string
+        The message with magic strings, as in opage.MM
+
+    Return
+    ------
+    int:
+        the column after the rightmost char or graphic
+    """
+    font = 'A'
+    x = width = 0
+    for kind, value in compilemessage(message).tokens:
+        if kind == 'T':
+            x += sum(advance(char, font) for char in value)
+        elif kind == 'A':
+            font = value
+        elif kind == 'G':
+            x += WIDTH
+        elif kind == 'K':
+            x += sum(advance(char, font) for char in CLOCK_TEXTS[value])
+        elif kind == 'U':
+            x += advance(EUROPEAN.get('<U' + value + '>', '\x7f'), font)
+        elif kind == 'N':
+            x = int(value, 16)
+            continue
+        width = max(width, x)
+    return width
+
+
+def transitionsteps(fx, target, width=80, rows=ROWS):
+    """Returns the number of animation steps of a leading or lagging effect
+
+    The counts match the frames of emulator.transition, the hold effect
+    takes no time.
+
+    Parameters
+    ------
+    fx: string
+        The effect code (see opage.leadin and opage.lagging)
+    target: int
+        Columns of the frame shown after, the horizontal scroll effects
+        scroll through all of them
+    width, rows: int
+        The size of the display
+    """
+    fx = fx.upper()
+    if fx in 'EF':
+        return target
+    if fx in 'CDIJ':
+        return rows
+    if fx == 'B':
+        return max(width, rows) // 2 + 1
+    if fx == 'G':
+        return rows // 2 + 1
+    if fx == 'H':
+        return (rows + 1) // 2
+    if fx == 'L':
+        return rows * (rows + 1) // 2
+    if fx == 'M':
+        return width + rows + 2
+    if fx == 'N':
+        return sum(max(0, width - 7 - block) for block in range(0, width, 8))
+    if fx == 'P':
+        return 16
+    if fx in PEN_TEXTS:
+        return width + 1
+    if fx == 'K':
+        return 0
+    return 1
+
+
+@lru_cache(maxsize=1024)
+def duration(MM, FX='E', MX='Q', WX='A', FY='E', width=80, rows=ROWS):
+    """Returns the seconds a page occupies the display
+
+    Leading effect, wait time and lagging effect, like emulator.frames
+    shows them, but without rendering. The scroll effects take longer the
+    wider the message is.
+
+    Parameters
+    ------
+    MM, FX, MX, WX, FY: string
+        The message and settings of the page (see opage)
+    width: int, default=80
+        Number of LED columns of the display
+    rows: int, default=7
+        Number of LED rows of the display
+
+    Return
+    ------
+    float:
+        the estimated duration in seconds
+    """
+    step = STEP_TIME[SPEEDS.get(MX, 2)]
+    steps = transitionsteps(FX, max(width, linewidth(MM)), width, rows)
+    if FY.upper() != 'K':
+        steps += transitionsteps(FY, width, width, rows)
+    return steps * step + waittime(WX)
+
+
+@lru_cache(maxsize=None)
+def glyph(char, font='A'):
+    """Returns the columns of a char
+
+    The 5x7 glyphs are built in, the other fonts are derived from them.
+    Chars without a glyph use the glyph of their base letter (e.g. 'e' for
+    'é') or a block. The font is proportional: blank columns left and right
+    of a glyph are cut, a space is half as wide as the font.
+
+    Parameters
+    ------
+    char: string
+        One char
+    font: string, default='A'
+        The font code (A..E, see FONTS)
+
+    Return
+    ------
+    tuple:
+        one int per column, bit 0 is the top row
+    """
+    code = ord(char)
+    if code < 0x20 or code > 0x7f:
+        base = unicodedata.normalize('NFD', char)[0]
+        code = ord(base) if 0x20 <= ord(base) <= 0x7f else 0x7f
+    columns = tuple(GLYPHS[(code - 0x20) * 5:(code - 0x1f) * 5])
+
+    if font == 'B':
+        # bold: every column is drawn twice
+        columns = tuple(a | b for a, b in zip(columns + (0,), (0,) + columns))
+    elif font == 'C':
+        # narrow: the two middle columns are merged
+        columns = (columns[0], columns[1] | columns[2], columns[3], columns[4])
+    elif font == 'D':
+        # large: twice as high, the middle columns are doubled
+        tall = [sum(((c >> bit) & 1) * 3 << 2 * bit for bit in range(7)) & 0x1fff for c in columns]
+        columns = (tall[0], tall[1], tall[1], tall[2], tall[3], tall[3], tall[4])
+    elif font == 'E' and chr(code) in DESCENDERS:
+        # long: the 8th row is used for the descenders
+        columns = tuple(c << 1 for c in columns)
+    drawn = [index for index, column in enumerate(columns) if column]
+    if not drawn:
+        return (0,) * (FONTS[font][0] // 2 + 1)
+    return columns[drawn[0]:drawn[-1] + 1]
+
+
+def advance(char, font='A'):
+    '''Returns the columns a char takes in a line, its glyph and the blank column after it'''
+    return len(glyph(char, font)) + 1
+
+
+class emulator():
+    """Renders pages like the display shows them
+
+    Frames are NumPy arrays of rows x width 2 bit color codes (0b10 = red,
+    0b01 = green, 0b11 = yellow, 0b00 = off, as in graphics), so rendering
+    is much faster than the display. The effects follow the protocol
+    documentation, the animation speed is an estimation.
+    Requires NumPy, exportgif() also requires Pillow.
+    """
+
+    def __init__(self, width=80, rows=ROWS, graphics=None, now=None):
+        ''' Create the emulator
+
+        Paramaters
+        ------
+        width: int, default=80
+            Number of LED columns of the display
+        rows: int, default=7
+            Number of LED rows of the display
+        graphics: dict, default=None
+            slot (e.g. 'A1') -> graphic for <Gxn>, either the encoded graphic
+            (see sixleds_graphic.compilebank) or a graphic as accepted by
+            graphicrows, missing graphics are shown as blank block
+        now: :obj:`time.struct_time`, default=None
+            Date and time for <KD> and <KT>, None for the current time
+
+        Return
+        ------
+        :obj: 'emulator'
+            The emulator Object
+        '''
+        import numpy
+        self.numpy = numpy
+        self.width = width
+        self.rows = rows
+        self.graphics = graphics if graphics is not None else {}
+        self.now = now
+
+    def blank(self):
+        '''Returns a frame with all LEDs off'''
+        return self.numpy.zeros((self.rows, self.width), dtype=self.numpy.uint8)
+
+    def graphic(self, slot):
+        '''Returns the color codes of a graphic (rows x 32)'''
+        numpy = self.numpy
+        content = self.graphics.get(slot)
+        if content is None:
+            rows = [b'@' * WIDTH] * ROWS
+        elif isinstance(content, (bytes, bytearray)) and len(content) == WIDTH * 2 and b'\n' not in content:
+            rows = decodegraphic(content)
+        else:
+            rows = [row[:WIDTH].ljust(WIDTH, b'@') for row in graphicrows(content)[:ROWS]]
+        codes = numpy.zeros((self.rows, WIDTH), dtype=numpy.uint8)
+        for index, row in enumerate(rows[:self.rows]):
+            codes[index] = [COLORS[chr(c)] for c in row]
+        return codes
+
+    def strip(self, message):
+        """Render a message into one line of LEDs
+
+        Parameters
+        ------
+        message: string
+            The message with magic strings, as in opage.MM
+
+        Return
+        ------
+        :obj:`numpy.ndarray`
+            rows x n color codes, at least as wide as the display
+        """
+        numpy = self.numpy
+        font, color = 'A', 'B'
+        x = 0
+        chunks = []
+
+        def text(chars):
+            nonlocal x
+            for char in chars:
+                columns = glyph(char, font) + (0,)
+                bits = (numpy.array(columns)[None, :] >> numpy.arange(self.rows)[:, None]) & 1
+                foreground, background = TEXT_COLORS[color]
+                if color == 'R':
+                    foreground = numpy.array((RYG_ROWS * 2)[:self.rows])[:, None]
+                elif color == 'S':
+                    foreground = numpy.array(RAINBOW)[(x + numpy.arange(len(columns))) % len(RAINBOW)][None, :]
+                chunks.append((x, numpy.where(bits == 1, foreground, background).astype(numpy.uint8)))
+                x += len(columns)
+
+        for kind, value in compilemessage(message).tokens:
+            if kind == 'T':
+                text(value)
+            elif kind == 'A':
+                font = value
+            elif kind == 'C':
+                color = value
+            elif kind == 'G':
+                chunks.append((x, self.graphic(value)))
+                x += WIDTH
+            elif kind == 'K':
+                text(strftime('%d/%m/%y' if value == 'D' else '%H:%M', self.now or localtime()))
+            elif kind == 'U':
+                text(EUROPEAN.get('<U' + value + '>', '\x7f'))
+            elif kind == 'N':
+                x = int(value, 16)
+            # <Bx> only rings the bell
+
+        strip = numpy.zeros((self.rows, max([self.width] + [start + chunk.shape[1] for start, chunk in chunks])), dtype=numpy.uint8)
+        for start, chunk in chunks:
+            strip[:, start:start + chunk.shape[1]] = chunk
+        return strip
+
+    def transition(self, source, target, fx, step):
+        """The frames of a leading or lagging effect
+
+        Parameters
+        ------
+        source: :obj:`numpy.ndarray`
+            The frame shown before
+        target: :obj:`numpy.ndarray`
+            The frame shown after, may be wider than the display for the
+            horizontal scroll effects (the whole line is scrolled through)
+        fx: string
+            The effect code (see opage.leadin and opage.lagging)
+        step: float
+            Seconds per animation step
+
+        Return
+        ------
+        generator:
+            (frame, seconds) tuples, the last frame is the target
+        """
+        numpy = self.numpy
+        rows, width = self.rows, self.width
+        fx = fx.upper()
+        screen = target[:, :width]
+        rowIndex = numpy.arange(rows)[:, None]
+        columnIndex = numpy.arange(width)[None, :]
+
+        def masked(masks):
+            for mask in masks:
+                yield numpy.where(mask, screen, source), step
+
+        if fx == 'E':
+            # scroll left, the target comes in from the right
+            both = numpy.hstack((source, target))
+            for offset in range(1, target.shape[1] + 1):
+                yield both[:, offset:offset + width], step
+        elif fx == 'F':
+            both = numpy.hstack((target, source))
+            for offset in range(target.shape[1] - 1, -1, -1):
+                yield both[:, offset:offset + width], step
+        elif fx == 'I':
+            # scroll up, the target comes in from the bottom
+            both = numpy.vstack((source, screen))
+            for offset in range(1, rows + 1):
+                yield both[offset:offset + rows], step
+        elif fx == 'J':
+            both = numpy.vstack((screen, source))
+            for offset in range(rows - 1, -1, -1):
+                yield both[offset:offset + rows], step
+        elif fx == 'B':
+            # xopen, from the center to all sides
+            steps = max(width, rows) // 2 + 1
+            distance = numpy.maximum(abs(columnIndex - (width - 1) / 2) / width, abs(rowIndex - (rows - 1) / 2) / rows)
+            yield from masked(distance < (n + 0.5) / (2 * steps - 1) for n in range(1, steps + 1))
+        elif fx == 'C':
+            yield from masked(numpy.broadcast_to(rowIndex >= rows - n, (rows, width)) for n in range(1, rows + 1))
+        elif fx == 'D':
+            yield from masked(numpy.broadcast_to(rowIndex < n, (rows, width)) for n in range(1, rows + 1))
+        elif fx == 'G':
+            # vopen, from the center to top and bottom
+            yield from masked(numpy.broadcast_to(abs(rowIndex - (rows - 1) / 2) < n, (rows, width)) for n in range(1, rows // 2 + 2))
+        elif fx == 'H':
+            yield from masked(numpy.broadcast_to((rowIndex < n) | (rowIndex >= rows - n), (rows, width)) for n in range(1, (rows + 1) // 2 + 1))
+        elif fx == 'L':
+            # snow, the rows fall down from the top and stack up
+            frame = source.copy()
+            for row in range(rows - 1, -1, -1):
+                lit = screen[row] != OFF
+                for y in range(row + 1):
+                    falling = frame.copy()
+                    falling[y] = numpy.where(lit, screen[row], falling[y])
+                    yield falling, step
+                frame[row] = screen[row]
+        elif fx == 'M':
+            # twinkle, a blank diagonal line runs over the target
+            for offset in range(-rows, width + 1):
+                yield numpy.where(columnIndex - rowIndex == offset, OFF, screen), step
+            yield screen, step
+        elif fx == 'N':
+            # block move, 8 columns at a time move in from the right
+            frame = source.copy()
+            for block in range(0, width, 8):
+                for x in range(width - 8, block - 1, -1):
+                    moving = frame.copy()
+                    moving[:, x:x + 8] = screen[:, block:block + 8]
+                    yield moving, step
+                frame[:, block:block + 8] = screen[:, block:block + 8]
+        elif fx == 'P':
+            # random pixels appear
+            order = numpy.random.default_rng(0).permutation(rows * width).reshape(rows, width)
+            steps = 16
+            yield from masked(order < rows * width * n // steps for n in range(1, steps + 1))
+        elif fx in PEN_TEXTS:
+            # the text is written column by column, then the target appears
+            pen = self.strip(PEN_TEXTS[fx])[:, :width]
+            for x in range(1, width + 1):
+                frame = numpy.zeros_like(screen)
+                frame[:, :x] = pen[:, :x]
+                yield frame, step
+            yield screen, step
+        elif fx == 'K':
+            # hold, the previous screen is kept
+            yield source, 0.0
+            yield screen, 0.0
+        else:
+            yield screen, step
+
+    def frames(self, page, previous=None):
+        """The frames of a page: leading effect, waiting and lagging effect
+
+        Parameters
+        ------
+        page: :obj:`opage`
+            The page to render
+        previous: :obj:`numpy.ndarray`, default=None
+            The frame shown before the page (for the hold effect), blank if None
+
+        Return
+        ------
+        generator:
+            (frame, seconds to show it) tuples
+        """
+        step = STEP_TIME[SPEEDS.get(page.MX, 2)]
+        wait = waittime(page.WX)
+        blank = self.blank()
+        strip = self.strip(page.MM)
+
+        screen = previous if previous is not None else blank
+        for screen, seconds in self.transition(screen, strip, page.FX, step):
+            yield screen, seconds
+
+        if page.MX in 'BRbr':
+            # blinking while waiting
+            shown = 0.0
+            while shown < wait:
+                yield (screen if round(shown * 2) % 2 == 0 else blank), min(0.5, wait - shown)
+                shown += 0.5
+        else:
+            yield screen, wait
+
+        if page.FY.upper() != 'K':
+            yield from self.transition(screen, blank, page.FY, step)
+
+    def framergb(self, frame, scale=4):
+        """Convert a frame into an RGB image of LEDs
+
+        Parameters
+        ------
+        frame: :obj:`numpy.ndarray`
+            The frame
+        scale: int, default=4
+            Pixels per LED, from 3 on the LEDs are separated by a black line
+
+        Return
+        ------
+        :obj:`numpy.ndarray`
+            rows*scale x width*scale x 3 uint8 array
+        """
+        numpy = self.numpy
+        rgb = numpy.array(PALETTE, dtype=numpy.uint8)[frame]
+        rgb = rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+        if scale >= 3:
+            rgb[scale - 1::scale, :] = 0
+            rgb[:, scale - 1::scale] = 0
+        return rgb
+
+    def exportgif(self, page, path, scale=4):
+        """Save the animation of a page as GIF
+
+        Parameters
+        ------
+        page: :obj:`opage`
+            The page to render
+        path: string
+            The GIF file to write
+        scale: int, default=4
+            Pixels per LED
+
+        Return
+        ------
+        float:
+            the duration of the animation in seconds
+        """
+        from PIL import Image
+        numpy = self.numpy
+
+        # join frames which are equal, GIF timing has a resolution of 10 ms
+        frames, durations = [], []
+        for frame, seconds in self.frames(page):
+            if frames and numpy.array_equal(frames[-1], frame):
+                durations[-1] += seconds
+            else:
+                frames.append(frame)
+                durations.append(seconds)
+        images = [Image.fromarray(self.framergb(frame, scale), 'RGB') for frame in frames]
+        images[0].save(
+            path, save_all=True, append_images=images[1:], loop=0,
+            duration=[max(20, int(round(seconds * 100)) * 10) for seconds in durations]
+        )
+        return sum(durations)
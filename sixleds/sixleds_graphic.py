@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from itertools import product
+import hashlib
+import logging
+import glob
+import json
+import os
+
+
+# a graphic consists of 4 chars (blocks) of 8x8 pixels side by side,
+# the display uses the upper 7 rows of each block
+BLOCKS      = 4
+BLOCK_WIDTH = 8
+ROWS        = 7
+WIDTH       = BLOCKS * BLOCK_WIDTH
+
+# 2 bits per pixel: 0b10 = red, 0b01 = green, 0b11 = yellow, 0b00 = off
+COLORS = {'@': 0b00, 'D': 0b01, 'A': 0b10, 'E': 0b11}
+
+# where compilebank keeps the encoded graphics of a manifest
+BANK_CACHE = '~/.cache/sixleds/banks'
+
+# maps every byte to a color char, unknown chars are off
+NORMALIZE = bytes(c if chr(c) in COLORS else ord('@') for c in range(256))
+
+# maps the 2 bit color codes of numeric graphics to color chars
+CODES = bytes(ord(dict((v, k) for k, v in COLORS.items()).get(c, '@')) for c in range(256))
+
+# maps 4 color chars to the byte which holds them, first pixel in the upper bits
+QUADS = {
+    bytes(ord(c) for c in chars): COLORS[chars[0]] << 6 | COLORS[chars[1]] << 4 | COLORS[chars[2]] << 2 | COLORS[chars[3]]
+    for chars in product(COLORS, repeat=4)
+}
+
+
+# maps a byte of graphic data to the 4 color chars it holds
+UNQUADS = dict((value, chars) for chars, value in QUADS.items())
+
+
+def graphicrows(graphic):
+    """Returns the rows of a graphic as color chars
+
+    Parameters
+    ------
+    graphic: string, bytes or 2D array
+        Text with one char per pixel ('A' = red, 'D' = green, 'E' = yellow,
+        '@' = off) and one line per row, or a sequence of rows where each
+        row is a string or a sequence of chars or 2 bit color codes
+
+    Return
+    ------
+    list:
+        bytes per row, every pixel normalized to one of the COLORS chars
+    """
+    if isinstance(graphic, str):
+        graphic = graphic.encode('latin-1', 'replace')
+    if isinstance(graphic, (bytes, bytearray)):
+        return [row.translate(NORMALIZE) for row in graphic.splitlines()]
+
+    rows = []
+    for row in graphic:
+        if isinstance(row, str):
+            row = row.encode('latin-1', 'replace').translate(NORMALIZE)
+        elif isinstance(row, (bytes, bytearray)):
+            row = bytes(row).translate(NORMALIZE)
+        elif hasattr(row, 'astype'):
+            # NumPy array of color codes
+            row = row.astype('uint8').tobytes().translate(CODES)
+        elif len(row) > 0 and isinstance(row[0], str):
+            row = ''.join(row).encode('latin-1', 'replace').translate(NORMALIZE)
+        else:
+            row = bytes(bytearray(int(c) for c in row)).translate(CODES)
+        rows.append(row)
+    return rows
+
+
+def encodegraphic(graphic):
+    """Encode a graphic into the payload of a graphic packet
+
+    Only as many blocks as all rows are wide are encoded, the remaining
+    blocks are left off. Pixels right of the 4th block are ignored.
+
+    Parameters
+    ------
+    graphic: string, bytes or 2D array
+        see graphicrows
+
+    Return
+    ------
+    bytes:
+        2 bytes per row, 8 rows per block, 4 blocks
+
+    Raises
+    ------
+    ValueError
+        if the graphic has less than 7 rows or is not wide enough for one block
+    """
+    rows = graphicrows(graphic)
+    if len(rows) < ROWS:
+        raise ValueError('graphic has %d rows, %d are required' % (len(rows), ROWS))
+    width = min(len(row) for row in rows[:ROWS])
+    if width < BLOCK_WIDTH:
+        raise ValueError('graphic is %d pixels wide, at least %d are required' % (width, BLOCK_WIDTH))
+
+    data = bytearray(BLOCKS * BLOCK_WIDTH * 2)
+    for block in range(min(width // BLOCK_WIDTH, BLOCKS)):
+        for line in range(ROWS):
+            offset = block * BLOCK_WIDTH
+            data[block*16 + line*2 + 0] = QUADS[rows[line][offset:offset+4]]
+            data[block*16 + line*2 + 1] = QUADS[rows[line][offset+4:offset+8]]
+    return bytes(data)
+
+
+def decodegraphic(data):
+    """Decode the payload of a graphic packet, the inverse of encodegraphic
+
+    Parameters
+    ------
+    data: bytes
+        2 bytes per row, 8 rows per block, 4 blocks
+
+    Return
+    ------
+    list:
+        7 rows of 32 color chars as bytes
+    """
+    data = bytes(data).ljust(BLOCKS * BLOCK_WIDTH * 2, b'\x00')
+    rows = []
+    for line in range(ROWS):
+        row = b''
+        for block in range(BLOCKS):
+            row += UNQUADS[data[block*16 + line*2 + 0]] + UNQUADS[data[block*16 + line*2 + 1]]
+        rows.append(row)
+    return rows
+
+
+def encodedirectory(path, pattern='*.txt'):
+    """Encode all graphic files in a directory, e.g. sample-graphics
+
+    Files which are not valid graphics are logged and skipped.
+
+    Parameters
+    ------
+    path: string
+        The directory
+    pattern: string, default='*.txt'
+        Which files to encode
+
+    Return
+    ------
+    dict:
+        file name -> encoded graphic (see encodegraphic)
+    """
+    result = {}
+    for fileName in sorted(glob.glob(os.path.join(path, pattern))):
+        with open(fileName, 'rb') as f:
+            content = f.read()
+        try:
+            result[os.path.basename(fileName)] = encodegraphic(content)
+        except ValueError as e:
+            logging.warning('Skipping graphic ' + fileName + ': ' + str(e))
+    return result
+
+
+def loadbank(manifest):
+    """Read a graphic bank manifest
+
+    Every line of the manifest assigns a graphic file to a graphic slot:
+    '<GRAPHIC> <BLOCK> <FILE>', e.g. 'A 1 crown.txt', where GRAPHIC is A..P
+    and BLOCK is 1..8. Relative file paths are relative to the manifest.
+    Empty lines and lines starting with '#' are ignored.
+
+    Parameters
+    ------
+    manifest: string
+        The path of the manifest
+
+    Return
+    ------
+    list:
+        (graphic, block, file path) tuples
+
+    Raises
+    ------
+    ValueError
+        if a line is not valid
+    """
+    bank = []
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, 'r') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            fields = line.split(None, 2)
+            if(len(fields) != 3 or len(fields[0]) != 1 or fields[0] not in 'ABCDEFGHIJKLMNOP'
+            or len(fields[1]) != 1 or fields[1] not in '12345678'):
+                raise ValueError('%s:%d: expected "<GRAPHIC A..P> <BLOCK 1..8> <FILE>"' % (manifest, number))
+            bank.append((fields[0], fields[1], os.path.join(base, fields[2])))
+    return bank
+
+
+def compilebank(manifest, cachedir=BANK_CACHE):
+    """Encode all graphics of a bank manifest (see loadbank)
+
+    The encoded graphics are cached per manifest in cachedir, a graphic is
+    only encoded again if its file was modified.
+
+    Parameters
+    ------
+    manifest: string
+        The path of the manifest
+    cachedir: string, default=BANK_CACHE
+        Where the encoded graphics are stored, None to disable the cache
+
+    Return
+    ------
+    dict:
+        slot (e.g. 'A1') -> encoded graphic (see encodegraphic)
+
+    Raises
+    ------
+    ValueError
+        if the manifest or a graphic is not valid
+    """
+    cacheFile = None
+    cache = {}
+    if cachedir is not None:
+        key = hashlib.sha1(os.path.abspath(manifest).encode('utf-8')).hexdigest()
+        cacheFile = os.path.join(os.path.expanduser(cachedir), key + '.json')
+        try:
+            with open(cacheFile, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    result = {}
+    newCache = {}
+    for graphic, block, fileName in loadbank(manifest):
+        stat = os.stat(fileName)
+        key = '%s:%d:%d' % (fileName, stat.st_mtime_ns, stat.st_size)
+        if key in cache:
+            data = bytes.fromhex(cache[key])
+        else:
+            # graphic text files or images
+            from .sixleds_image import loadgraphic
+            try:
+                data = encodegraphic(loadgraphic(fileName))
+            except ValueError as e:
+                raise ValueError(fileName + ': ' + str(e))
+        result[graphic + block] = data
+        newCache[key] = data.hex()
+
+    if cacheFile is not None and newCache != cache:
+        try:
+            os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+            with open(cacheFile + '.tmp', 'w') as f:
+                json.dump(newCache, f)
+            os.replace(cacheFile + '.tmp', cacheFile)
+        except OSError as e:
+            logging.warning('Failed to save graphic cache ' + cacheFile + ': ' + str(e))
+    return result
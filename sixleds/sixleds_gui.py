@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from . import __version__, __author__, __copyright__, __website__, __license__
+from . import sixleds_graphic, sixleds_emulator, sixleds_magic
 from os import path, getcwd
 from functools import partial
 from PyQt6 import QtWidgets, QtGui, QtCore
@@ -10,17 +11,76 @@ import sixleds
 import logging
 import time
 import platform
-import glob
-import serial
+from serial.tools import list_ports
+import threading
+import queue
 import sys
 
 
-class QClickLabel(QtWidgets.QLabel):
-    clicked = QtCore.pyqtSignal()
+class SerialPortScanner(QtCore.QThread):
+    portsFound = QtCore.pyqtSignal(list)
 
-    def mousePressEvent(self, event):
-        self.clicked.emit()
-        QtWidgets.QLabel.mousePressEvent(self, event)
+    def __init__(self, scan, parent=None):
+        super(SerialPortScanner, self).__init__(parent)
+        self.scan = scan
+
+    def run(self):
+        self.portsFound.emit(self.scan())
+
+class SixledsWorker(QtCore.QThread):
+    """Runs the display commands one after another, so the GUI never waits for the serial port"""
+    commandStarted  = QtCore.pyqtSignal(str)
+    commandProgress = QtCore.pyqtSignal(str, str, int, int) # packet name, result, done, total
+    commandFinished = QtCore.pyqtSignal(str, object)        # title, return value of the command
+    commandFailed   = QtCore.pyqtSignal(str, str)           # title, error
+
+    def __init__(self, parent=None):
+        super(SixledsWorker, self).__init__(parent)
+        self.commands = queue.Queue()
+        self.cancelled = threading.Event()
+        self.busy = False
+
+    def Submit(self, title, func, *args, progress=False, **kwargs):
+        # commands with progress=True get a progress callback (see sixleds.sendmany)
+        if(progress): kwargs["progress"] = self.OnProgress
+        self.commands.put((title, func, args, kwargs))
+        if(not self.isRunning()): self.start()
+
+    def Busy(self):
+        return self.busy or not self.commands.empty()
+
+    def Cancel(self):
+        # drop the queued commands and stop the running one after the current packet
+        while(not self.commands.empty()):
+            try: self.commands.get_nowait()
+            except queue.Empty: break
+        self.cancelled.set()
+
+    def Stop(self):
+        self.Cancel()
+        self.commands.put(None)
+        self.wait()
+
+    def OnProgress(self, name, result, done, total):
+        self.commandProgress.emit(name, result, done, total)
+        return not self.cancelled.is_set()
+
+    def run(self):
+        while(True):
+            command = self.commands.get()
+            if(command == None): break
+            title, func, args, kwargs = command
+            self.busy = True
+            self.cancelled.clear()
+            self.commandStarted.emit(title)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                logging.exception(title+" failed")
+                self.commandFailed.emit(title, str(e))
+            else:
+                self.commandFinished.emit(title, result)
+            self.busy = False
 
 class SixledsScheduleWindow(QtWidgets.QDialog):
 
@@ -77,14 +137,10 @@ class SixledsScheduleWindow(QtWidgets.QDialog):
 
     def OnSend(self):
         selectedSchedule = self.comboSchedule.currentText()
-        if(self.textPages.text() == ""):
-            self.parent.ld.updatesched(selectedSchedule, active=False)
-        else:
-            self.parent.ld.updatesched(selectedSchedule, self.textPages.text().upper(), active=True,
-                start=self.textStart.text(),
-                end=self.textEnd.text()
-            )
-        self.parent.ld.pushchanges()
+        self.parent.RunCommand("Sending schedule "+selectedSchedule, self.parent.PushSchedule, self.parent.ld,
+            selectedSchedule, self.textPages.text().upper(), self.textStart.text(), self.textEnd.text(),
+            progress=True
+        )
         self.parent.SCHEDULES[selectedSchedule]['pages'] = self.textPages.text()
         self.parent.SCHEDULES[selectedSchedule]['start'] = self.textStart.text()
         self.parent.SCHEDULES[selectedSchedule]['end'] = self.textEnd.text()
@@ -93,6 +149,75 @@ class SixledsScheduleWindow(QtWidgets.QDialog):
     def OnClose(self):
         self.close()
 
+class SixledsLineSettingsWindow(QtWidgets.QDialog):
+
+    def __init__(self, parent=None):
+        super(SixledsLineSettingsWindow, self).__init__(parent)
+        self.parent = parent
+        self.InitUI()
+
+    def InitUI(self):
+        self.layout = QtWidgets.QGridLayout()
+        settings = self.parent.ld.serialsettings
+
+        self.comboBaudrate = QtWidgets.QComboBox()
+        for rate in sorted(set(sixleds.BAUDRATES) | {settings['baudrate']}):
+            self.comboBaudrate.addItem(str(rate))
+        self.comboBaudrate.setCurrentText(str(settings['baudrate']))
+
+        self.checkRtsCts = QtWidgets.QCheckBox("RTS/CTS hardware flow control")
+        self.checkRtsCts.setChecked(settings['rtscts'])
+
+        self.spinTimeout = QtWidgets.QDoubleSpinBox()
+        self.spinTimeout.setRange(0.1, 30)
+        self.spinTimeout.setSingleStep(0.1)
+        self.spinTimeout.setSuffix(" sec")
+        self.spinTimeout.setValue(settings['timeout'])
+
+        self.spinWriteTimeout = QtWidgets.QDoubleSpinBox()
+        self.spinWriteTimeout.setRange(0, 30)
+        self.spinWriteTimeout.setSingleStep(0.5)
+        self.spinWriteTimeout.setSuffix(" sec")
+        self.spinWriteTimeout.setSpecialValueText("No limit")
+        self.spinWriteTimeout.setValue(settings['writetimeout'] or 0)
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.StandardButton.Ok
+            |QtWidgets.QDialogButtonBox.StandardButton.Cancel
+        )
+        self.probeButton = self.buttonBox.addButton("Probe Fastest", QtWidgets.QDialogButtonBox.ButtonRole.ActionRole)
+        self.probeButton.setToolTip("Try the baud rates from the fastest to 9600 and keep the first one the device acknowledges")
+        self.probeButton.clicked.connect(self.OnProbe)
+        self.buttonBox.accepted.connect(self.OnApply)
+        self.buttonBox.rejected.connect(self.OnClose)
+
+        self.layout.addWidget(QtWidgets.QLabel("Baud rate:"), 0, 0)
+        self.layout.addWidget(self.comboBaudrate, 0, 1)
+        self.layout.addWidget(self.checkRtsCts, 1, 1)
+        self.layout.addWidget(QtWidgets.QLabel("Reply timeout:"), 2, 0)
+        self.layout.addWidget(self.spinTimeout, 2, 1)
+        self.layout.addWidget(QtWidgets.QLabel("Write timeout:"), 3, 0)
+        self.layout.addWidget(self.spinWriteTimeout, 3, 1)
+        self.layout.addWidget(QtWidgets.QLabel("The settings are saved for this device."), 4, 0, 1, 2)
+        self.layout.addWidget(self.buttonBox, 5, 0, 1, 2)
+
+        self.setLayout(self.layout)
+        self.setWindowTitle("Line Settings")
+
+    def OnApply(self):
+        self.parent.RunCommand("Changing line settings", self.parent.ConfigureLine, self.parent.ld,
+            int(self.comboBaudrate.currentText()), self.checkRtsCts.isChecked(),
+            self.spinTimeout.value(), self.spinWriteTimeout.value()
+        )
+        self.close()
+
+    def OnProbe(self):
+        self.parent.RunCommand("Probing baud rate", self.parent.ld.probebaud)
+        self.close()
+
+    def OnClose(self):
+        self.close()
+
 class SixledsGraphicInsertWindow(QtWidgets.QDialog):
 
     def __init__(self, parent=None):
@@ -140,6 +265,137 @@ class SixledsGraphicInsertWindow(QtWidgets.QDialog):
     def OnClose(self):
         self.close()
 
+class SixledsGraphicCanvas(QtWidgets.QWidget):
+    """Paints a graphic from a pixel array, one color char (see sixleds_graphic.COLORS) per LED"""
+    changed = QtCore.pyqtSignal()
+
+    ledWidth  = 10
+    ledHeight = 10
+    margin    = 6
+    undoLimit = 100
+
+    # LED pictures, loaded once per file
+    sprites = {}
+
+    def __init__(self, spritePaths, parent=None):
+        super(SixledsGraphicCanvas, self).__init__(parent)
+        self.spritePaths = spritePaths
+        self.paintCode = ord("A")
+        self.lastPixel = None
+        self.undoStack = []
+        self.Resize(1)
+
+    def Resize(self, graphics):
+        # the canvas is always a multiple of whole graphics (4 blocks of 8 LEDs)
+        self.graphics = graphics
+        self.columns = graphics * sixleds_graphic.WIDTH
+        self.pixels = bytearray(b"@" * (self.columns * sixleds_graphic.ROWS))
+        self.setFixedSize(self.columns*self.ledWidth + 2*self.margin, sixleds_graphic.ROWS*self.ledHeight + 2*self.margin)
+        self.update()
+
+    def Sprite(self, code):
+        fileName = self.spritePaths.get(chr(code), self.spritePaths["@"])
+        if(fileName not in self.sprites):
+            pixmap = QtGui.QPixmap(fileName)
+            if(pixmap.isNull()):
+                # icons not installed, draw a plain dot
+                pixmap = QtGui.QPixmap(self.ledWidth, self.ledHeight)
+                pixmap.fill(QtCore.Qt.GlobalColor.transparent)
+                painter = QtGui.QPainter(pixmap)
+                painter.setBrush(QtGui.QColor({"A":"red", "D":"lime", "E":"yellow"}.get(chr(code), "#333")))
+                painter.drawEllipse(1, 1, self.ledWidth-2, self.ledHeight-2)
+                painter.end()
+            self.sprites[fileName] = pixmap.scaled(self.ledWidth, self.ledHeight)
+        return self.sprites[fileName]
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        painter.setBrush(QtGui.QColor("black"))
+        painter.drawRoundedRect(self.rect(), 6, 6)
+        # only repaint the LEDs inside the dirty area
+        area = event.rect()
+        firstColumn = max(0, (area.left() - self.margin) // self.ledWidth)
+        lastColumn = min(self.columns - 1, (area.right() - self.margin) // self.ledWidth)
+        for row in range(sixleds_graphic.ROWS):
+            offset = row * self.columns
+            for column in range(firstColumn, lastColumn + 1):
+                painter.drawPixmap(self.margin + column*self.ledWidth, self.margin + row*self.ledHeight, self.Sprite(self.pixels[offset + column]))
+        painter.end()
+
+    def PixelAt(self, position):
+        column = int(position.x() - self.margin) // self.ledWidth
+        row = int(position.y() - self.margin) // self.ledHeight
+        if(column < 0 or column >= self.columns or row < 0 or row >= sixleds_graphic.ROWS): return None
+        return (row, column)
+
+    def SetPixel(self, row, column, code):
+        index = row * self.columns + column
+        if(self.pixels[index] == code): return
+        self.pixels[index] = code
+        self.update(self.margin + column*self.ledWidth, self.margin + row*self.ledHeight, self.ledWidth, self.ledHeight)
+
+    def mousePressEvent(self, event):
+        self.SaveUndo()
+        self.lastPixel = None
+        self.mouseMoveEvent(event)
+
+    def mouseMoveEvent(self, event):
+        # left button paints the selected color, right button turns LEDs off
+        if(event.buttons() & QtCore.Qt.MouseButton.LeftButton): code = self.paintCode
+        elif(event.buttons() & QtCore.Qt.MouseButton.RightButton): code = ord("@")
+        else: return
+        pixel = self.PixelAt(event.position())
+        if(pixel == None or pixel == self.lastPixel): return
+        self.lastPixel = pixel
+        self.SetPixel(pixel[0], pixel[1], code)
+        self.changed.emit()
+
+    def SaveUndo(self):
+        self.undoStack.append((self.graphics, bytes(self.pixels)))
+        del self.undoStack[:-self.undoLimit]
+
+    def Undo(self):
+        if(len(self.undoStack) == 0): return
+        graphics, pixels = self.undoStack.pop()
+        if(graphics != self.graphics): self.Resize(graphics)
+        self.pixels[:] = pixels
+        self.update()
+        self.changed.emit()
+
+    def Fill(self, code):
+        self.SaveUndo()
+        self.pixels[:] = bytes([code]) * len(self.pixels)
+        self.update()
+        self.changed.emit()
+
+    def Shift(self, columns):
+        # rotate every row, LEDs leaving on one side come in on the other
+        self.SaveUndo()
+        rows = self.Rows()
+        self.pixels[:] = b"".join(row[columns:] + row[:columns] for row in rows)
+        self.update()
+        self.changed.emit()
+
+    def Rows(self):
+        return [bytes(self.pixels[row*self.columns:(row+1)*self.columns]) for row in range(sixleds_graphic.ROWS)]
+
+    def SetGraphic(self, content, maxGraphics):
+        self.SaveUndo()
+        rows = sixleds_graphic.graphicrows(content)[:sixleds_graphic.ROWS]
+        width = max([len(row) for row in rows] + [1])
+        self.Resize(max(1, min(maxGraphics, -(-width // sixleds_graphic.WIDTH))))
+        for row, line in enumerate(rows):
+            line = line[:self.columns]
+            self.pixels[row*self.columns:row*self.columns+len(line)] = line
+        self.changed.emit()
+
+    def GraphicRows(self, graphic):
+        # the rows of one graphic (4 blocks) of the canvas
+        start = graphic * sixleds_graphic.WIDTH
+        return [row[start:start+sixleds_graphic.WIDTH] for row in self.Rows()]
+
 class SixledsGraphicWindow(QtWidgets.QMainWindow):
     COLORS = {
         "Off"    : { "code":"@", "pixmap":"led-off.png" },
@@ -148,11 +404,6 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
         "Yellow" : { "code":"E", "pixmap":"led-yellow.png" }
     }
 
-    ledsHorizontal = 33
-    ledsVertical = 8
-    ledWidth = 10
-    ledHeight = 10
-
     def __init__(self, parent=None):
         super(SixledsGraphicWindow, self).__init__(parent)
         self.InitUI()
@@ -172,11 +423,16 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
         self.comboColor = QtWidgets.QComboBox()
         for color, details in self.COLORS.items():
             self.comboColor.addItem(color)
+        self.comboColor.setCurrentText("Red")
+        self.comboColor.currentTextChanged.connect(self.OnColorChanged)
 
         self.comboBlock = QtWidgets.QComboBox()
         for page in self.parentWidget().GRAPHIC_BLOCKS: self.comboBlock.addItem(page)
         self.comboNumber = QtWidgets.QComboBox()
         for page in self.parentWidget().GRAPHIC_NUMS: self.comboNumber.addItem(page)
+        self.spinGraphics = QtWidgets.QSpinBox()
+        self.spinGraphics.setRange(1, len(self.parentWidget().GRAPHIC_NUMS))
+        self.spinGraphics.valueChanged.connect(self.OnGraphicsChanged)
 
         buttonShiftLeft = QtWidgets.QPushButton("<<")
         buttonShiftRight = QtWidgets.QPushButton(">>")
@@ -195,14 +451,19 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
         buttonFill.clicked.connect(self.OnFill)
         self.toolBox.addWidget(buttonFill)
         self.toolBox.addWidget(shiftButtonBoxWidget)
+        buttonUndo = QtWidgets.QPushButton("Undo")
+        buttonUndo.clicked.connect(self.OnUndo)
+        self.toolBox.addWidget(buttonUndo)
 
         self.buttonBox = QtWidgets.QGridLayout()
         self.buttonBox.addWidget(QtWidgets.QLabel("Block:"), 0, 0)
         self.buttonBox.addWidget(self.comboBlock, 0, 1)
         self.buttonBox.addWidget(QtWidgets.QLabel("Number:"), 1, 0)
         self.buttonBox.addWidget(self.comboNumber, 1, 1)
-        self.buttonBox.addWidget(buttonProgram, 2, 0, 1, 2)
-        self.buttonBox.addWidget(buttonInsert, 3, 0, 1, 2)
+        self.buttonBox.addWidget(QtWidgets.QLabel("Graphics (width):"), 2, 0)
+        self.buttonBox.addWidget(self.spinGraphics, 2, 1)
+        self.buttonBox.addWidget(buttonProgram, 3, 0, 1, 2)
+        self.buttonBox.addWidget(buttonInsert, 4, 0, 1, 2)
 
         self.buttonBox2 = QtWidgets.QHBoxLayout()
         self.buttonBox2.addWidget(buttonOpenFile)
@@ -211,26 +472,16 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
 
         self.layout = QtWidgets.QGridLayout()
 
-        self.display = QtWidgets.QGridLayout()
-        self.display.setContentsMargins(0,0,0,0)
-        for i in range(0, self.ledsHorizontal-1):
-            for n in range(0, self.ledsVertical-1):
-                pic = QClickLabel()
-                pic.colorCode = self.COLORS["Off"]["code"]
-                pic.setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+self.COLORS["Off"]["pixmap"]))
-                pic.setFixedWidth(self.ledWidth)
-                pic.setFixedHeight(self.ledHeight)
-                pic.clicked.connect(self.OnLedClicked)
-                pic.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
-                pic.customContextMenuRequested.connect(self.OnLedClickedSecondary)
-                self.display.addWidget(pic, n, i)
-
-        widget = QtWidgets.QWidget()
-        widget.setLayout(self.display)
-        widget.setFixedWidth(self.ledsHorizontal*self.ledWidth)
-        widget.setFixedHeight(self.ledsVertical*self.ledHeight)
-        widget.setContentsMargins(6,6,12,12)
-        widget.setStyleSheet("background-color: black; border-radius: 6px;")
+        spritePaths = {}
+        for color, details in self.COLORS.items():
+            spritePaths[details["code"]] = path.join(self.parentWidget().PRODUCT_ICON_PATH, details["pixmap"])
+        self.canvas = SixledsGraphicCanvas(spritePaths)
+        self.canvas.paintCode = ord(self.COLORS[self.comboColor.currentText()]["code"])
+        scrollArea = QtWidgets.QScrollArea()
+        scrollArea.setWidget(self.canvas)
+        scrollArea.setWidgetResizable(False)
+        scrollArea.setMinimumWidth(sixleds_graphic.WIDTH*self.canvas.ledWidth + 2*self.canvas.margin + 4)
+        scrollArea.setFixedHeight(self.canvas.height() + scrollArea.horizontalScrollBar().sizeHint().height() + 4)
 
         widget2 = QtWidgets.QWidget()
         widget2.setLayout(self.buttonBox)
@@ -241,7 +492,7 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
         widget4 = QtWidgets.QWidget()
         widget4.setLayout(self.toolBox)
 
-        self.layout.addWidget(widget, 0, 0)
+        self.layout.addWidget(scrollArea, 0, 0)
         self.layout.addWidget(widget4, 0, 1)
         self.layout.addWidget(widget2, 1, 0)
         self.layout.addWidget(widget3, 2, 0, 1, 2)
@@ -251,91 +502,47 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(mainWidget)
         self.setWindowTitle("Graphic Editor")
 
-    def OnLedClicked(self):
-        colorInfo = self.COLORS[self.comboColor.currentText()]
-        self.sender().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
-        self.sender().colorCode = colorInfo["code"]
+        undoAction = QtGui.QAction("Undo", self)
+        undoAction.setShortcut(QtGui.QKeySequence.StandardKey.Undo)
+        undoAction.triggered.connect(self.OnUndo)
+        self.addAction(undoAction)
+
+    def OnColorChanged(self, color):
+        self.canvas.paintCode = ord(self.COLORS[color]["code"])
 
-    def OnLedClickedSecondary(self):
-        colorInfo = self.COLORS["Off"]
-        self.sender().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
-        self.sender().colorCode = colorInfo["code"]
+    def OnGraphicsChanged(self, graphics):
+        if(graphics == self.canvas.graphics): return
+        # keep the pixels which still fit
+        self.canvas.SaveUndo()
+        rows = self.canvas.Rows()
+        self.canvas.Resize(graphics)
+        for row, line in enumerate(rows):
+            line = line[:self.canvas.columns]
+            self.canvas.pixels[row*self.canvas.columns:row*self.canvas.columns+len(line)] = line
 
     def OnFill(self, e):
-        colorInfo = self.COLORS[self.comboColor.currentText()]
-        for i in range(0, self.ledsVertical-1):
-            for n in range(0, self.ledsHorizontal-1):
-                widgetItem = self.display.itemAtPosition(i, n)
-                widgetItem.widget().colorCode = colorInfo["code"]
-                widgetItem.widget().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
+        self.canvas.Fill(self.canvas.paintCode)
 
     def OnShiftLeft(self, e):
-        for i in range(0, self.ledsVertical-1):
-            a = self.display.itemAtPosition(i, 0)
-            prevColorCode = a.widget().colorCode
-            for n in range(self.ledsHorizontal-2, -1, -1):
-                # get widget from grid
-                widgetItemNext = self.display.itemAtPosition(i, n)
-
-                # save current color
-                tmpColorCode = widgetItemNext.widget().colorCode
-                #print(str(n)+" is currenty "+tmpColorCode)
-
-                # override color from previous led
-                colorInfo = self.COLORS["Off"]
-                for color, details in self.COLORS.items():
-                    if(details["code"] == prevColorCode): colorInfo = details
-                widgetItemNext.widget().colorCode = colorInfo["code"]
-                widgetItemNext.widget().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
-                #print(str(n)+" overwrite with "+colorInfo["code"])
-
-                # save color for next iteration
-                prevColorCode = tmpColorCode
+        self.canvas.Shift(1)
 
     def OnShiftRight(self, e):
-        for i in range(0, self.ledsVertical-1):
-            a = self.display.itemAtPosition(i, self.ledsHorizontal-2)
-            prevColorCode = a.widget().colorCode
-            for n in range(0, self.ledsHorizontal-1, 1):
-                # get widget from grid
-                widgetItemNext = self.display.itemAtPosition(i, n)
-
-                # save current color
-                tmpColorCode = widgetItemNext.widget().colorCode
-                #print(str(n)+" is currenty "+tmpColorCode)
-
-                # override color from previous led
-                colorInfo = self.COLORS["Off"]
-                for color, details in self.COLORS.items():
-                    if(details["code"] == prevColorCode): colorInfo = details
-                widgetItemNext.widget().colorCode = colorInfo["code"]
-                widgetItemNext.widget().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
-                #print(str(n)+" overwrite with "+colorInfo["code"])
-
-                # save color for next iteration
-                prevColorCode = tmpColorCode
+        self.canvas.Shift(-1)
+
+    def OnUndo(self, e=None):
+        self.canvas.Undo()
+        self.spinGraphics.setValue(self.canvas.graphics)
 
     def OnOpenFile(self, e):
         fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Choose Graphic File", "", "Text Files (*.txt);;All Files (*.*)")
         if(not fileName): return
 
-        file = open(fileName, "r")
+        file = open(fileName, "rb")
         content = file.read()
         file.close()
 
-        linecounter = 0
-        for line in content.splitlines():
-            charcounter = 0
-            for char in line:
-                widgetItem = self.display.itemAtPosition(linecounter, charcounter)
-                if(widgetItem != None):
-                    colorInfo = self.COLORS["Off"]
-                    for color, details in self.COLORS.items():
-                        if(details["code"] == char): colorInfo = details
-                    widgetItem.widget().colorCode = colorInfo["code"]
-                    widgetItem.widget().setPixmap(QtGui.QPixmap(self.parentWidget().PRODUCT_ICON_PATH+"/"+colorInfo["pixmap"]))
-                charcounter += 1
-            linecounter += 1
+        self.canvas.SetGraphic(content, self.spinGraphics.maximum())
+        self.spinGraphics.setValue(self.canvas.graphics)
 
     def OnSaveFile(self, e):
         fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Graphic File", "", "Text Files (*.txt);;All Files (*.*)")
@@ -347,25 +554,97 @@ class SixledsGraphicWindow(QtWidgets.QMainWindow):
 
     def CompileGraphicToText(self):
         content = ""
-        for i in range(0, self.ledsVertical-1):
-            line = ""
-            for n in range(0, self.ledsHorizontal-1):
-                widgetItem = self.display.itemAtPosition(i, n)
-                if(widgetItem != None): line += widgetItem.widget().colorCode
-                else: line += "@"
-            content += line + "\r\n" # windows compatible line endings
+        for line in self.canvas.Rows():
+            content += line.decode("ascii") + "\r\n" # windows compatible line endings
         return content
 
+    def GraphicSlots(self):
+        # a wide graphic is stored in consecutive numbers of the block, e.g. A1, A2, A3
+        first = self.parentWidget().GRAPHIC_NUMS.index(self.comboNumber.currentText())
+        numbers = self.parentWidget().GRAPHIC_NUMS[first:first+self.canvas.graphics]
+        if(len(numbers) < self.canvas.graphics):
+            QtWidgets.QMessageBox.warning(self, "Graphic Too Wide", "The graphic needs "+str(self.canvas.graphics)+" numbers, please choose a lower start number.")
+            return None
+        return [self.comboBlock.currentText()+number for number in numbers]
+
     def OnProgram(self, e):
-        self.parentWidget().ld.programgraphic(self.comboBlock.currentText(), self.comboNumber.currentText(), self.CompileGraphicToText())
+        mainWindow = self.parentWidget()
+        slots = self.GraphicSlots()
+        if(slots == None): return
+        bank = {}
+        for graphic, slot in enumerate(slots):
+            bank[slot] = sixleds_graphic.encodegraphic(self.canvas.GraphicRows(graphic))
+        if(mainWindow.SetupConnection()):
+            mainWindow.RunCommand("Programming graphic "+", ".join(slots), mainWindow.ld.programbank, bank, progress=True)
 
     def OnInsert(self, e):
-        self.parentWidget().textField.insertPlainText("<G"+self.comboBlock.currentText()+self.comboNumber.currentText()+">")
+        slots = self.GraphicSlots()
+        if(slots == None): return
+        self.parentWidget().textField.insertPlainText("".join("<G"+slot+">" for slot in slots))
 
     def OnClose(self, e):
         self.close()
 
 
+class SixledsPreviewWindow(QtWidgets.QDialog):
+    """Plays the current page with the display emulator"""
+
+    def __init__(self, parent=None):
+        super(SixledsPreviewWindow, self).__init__(parent)
+        self.parent = parent
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.OnNextFrame)
+        self.InitUI()
+        self.OnRestart()
+
+    def InitUI(self):
+        self.layout = QtWidgets.QGridLayout()
+
+        self.display = QtWidgets.QLabel()
+        self.display.setStyleSheet("background-color: black;")
+
+        self.spinWidth = QtWidgets.QSpinBox()
+        self.spinWidth.setRange(sixleds_graphic.WIDTH, 512)
+        self.spinWidth.setValue(80)
+        self.spinWidth.valueChanged.connect(self.OnRestart)
+
+        buttonRestart = QtWidgets.QPushButton("Restart")
+        buttonRestart.clicked.connect(self.OnRestart)
+        self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.StandardButton.Close)
+        self.buttonBox.rejected.connect(self.close)
+
+        self.layout.addWidget(self.display, 0, 0, 1, 3)
+        self.layout.addWidget(QtWidgets.QLabel("Display width (LEDs):"), 1, 0)
+        self.layout.addWidget(self.spinWidth, 1, 1)
+        self.layout.addWidget(buttonRestart, 1, 2)
+        self.layout.addWidget(self.buttonBox, 2, 0, 1, 3)
+
+        self.setLayout(self.layout)
+        self.setWindowTitle("Preview Page "+self.parent.page)
+
+    def OnRestart(self):
+        p = self.parent
+        self.page = sixleds.opage(p.textField.toPlainText(), p.leadingFx, p.displayMethod, p.waitTime, p.laggingFx)
+        self.emulator = sixleds_emulator.emulator(width=self.spinWidth.value())
+        self.frames = self.emulator.frames(self.page)
+        self.OnNextFrame()
+
+    def OnNextFrame(self):
+        frame, seconds = next(self.frames, (None, 0))
+        if(frame is None):
+            # start over
+            self.frames = self.emulator.frames(self.page)
+            frame, seconds = next(self.frames)
+        rgb = self.emulator.framergb(frame, 5)
+        image = QtGui.QImage(rgb.data, rgb.shape[1], rgb.shape[0], rgb.shape[1]*3, QtGui.QImage.Format.Format_RGB888)
+        self.display.setPixmap(QtGui.QPixmap.fromImage(image))
+        self.timer.start(max(1, int(seconds * 1000)))
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        event.accept()
+
 class SixledsAboutWindow(QtWidgets.QDialog):
     def __init__(self, *args, **kwargs):
         super(SixledsAboutWindow, self).__init__(*args, **kwargs)
@@ -423,6 +702,8 @@ class SixledsAboutWindow(QtWidgets.QDialog):
         self.setWindowTitle("About")
 
 class SixledsMainWindow(QtWidgets.QMainWindow):
+    deviceIdChanged   = QtCore.pyqtSignal(int)
+
     PRODUCT_NAME      = "sixleds GUI"
     PRODUCT_ICON      = "sixleds-icon.png"
     ABOUT_ICON        = "sixleds.png"
@@ -440,6 +721,7 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
     serialPort     = "/dev/ttyUSB0"
     configFile     = "~/.config/sixleds/config"
     deviceId       = 0
+    connection     = None # (port, device id) of self.ld
 
     page          = "A"
     line          = "1"
@@ -452,31 +734,51 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
 
     def __init__(self, *args, **kwargs):
         super(SixledsMainWindow, self).__init__(*args, **kwargs)
-        self.serialPorts = self.GetSerialPorts()
+        # start with the ports found last time, scanning runs in the background
+        self.settings = QtCore.QSettings("sixleds", "sixleds-gui")
+        self.serialPorts = self.settings.value("serialPorts", [], type=list)
         if(len(self.serialPorts) > 0): self.serialPort = self.serialPorts[0]
+        self.worker = SixledsWorker(self)
+        self.connectionLabel = QtWidgets.QLabel()
         self.SetupConnection(message=False)
         self.InitUI()
+        self.InitSerialPortScanner()
+
+    def InitSerialPortScanner(self):
+        self.portScanner = SerialPortScanner(self.GetSerialPorts, self)
+        self.portScanner.portsFound.connect(self.OnSerialPortsFound)
+        self.portScanner.start()
+
+        # rescan when adapters are plugged in or removed
+        self.portScanTimer = QtCore.QTimer(self)
+        self.portScanTimer.setSingleShot(True)
+        self.portScanTimer.setInterval(500)
+        self.portScanTimer.timeout.connect(self.portScanner.start)
+        self.portWatcher = QtCore.QFileSystemWatcher(self)
+        if(path.isdir('/dev')):
+            self.portWatcher.addPath('/dev')
+        self.portWatcher.directoryChanged.connect(self.portScanTimer.start)
 
     def GetSerialPorts(self):
-        if platform.system() == 'Windows':
-            ports = ['COM%s' % (i + 1) for i in range(10)]
-        elif platform.system() == 'Linux':
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif platform.system() == 'Darwin':
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
+        # enumerates the adapters from OS metadata (sysfs, registry, IOKit) without opening them
         result = []
-        for port in ports:
-            if("bluetooth" in port): continue # macOS
-            try:
-                s = serial.Serial(port)
-                s.close()
-                result.append(port)
-            except(OSError, serial.SerialException):
-                pass
+        for port in sorted(list_ports.comports(), key=lambda p: (p.vid is None, p.device)):
+            if("bluetooth" in port.device.lower()): continue # macOS
+            result.append(port.device)
         return result
 
+    def OnSerialPortsFound(self, ports):
+        self.serialPorts = ports
+        self.settings.setValue("serialPorts", ports)
+        if(self.serialPort not in ports and len(ports) > 0):
+            self.serialPort = ports[0]
+            self.SetupConnection(message=False)
+        elif(self.serialPort not in ports and self.connection != None):
+            # adapter unplugged, reconnect when it is back
+            self.connection = None
+            self.SetConnectionState("Disconnected")
+        self.UpdatePortAndDeviceText()
+
     def InitUI(self):
         # Menubar
         mainMenu = self.menuBar()
@@ -591,6 +893,12 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
             actionButton.fxCode = key
             self.displayFxMenu.addAction(actionButton)
 
+        actionButton = QtGui.QAction('&Preview...', self)
+        actionButton.setShortcut('Ctrl+R')
+        actionButton.triggered.connect(self.OnPreview)
+        pageMenu.addAction(actionButton)
+        pageMenu.addSeparator()
+
         actionButton = QtGui.QAction('Display &Time...', self)
         actionButton.triggered.connect(self.OnSetDisplayTime)
         pageMenu.addAction(actionButton)
@@ -701,6 +1009,9 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
         actionButton.setShortcut('F8')
         actionButton.triggered.connect(self.OnSetSchedule)
         commandsMenu.addAction(actionButton)
+        actionButton = QtGui.QAction('&Line Settings...', self)
+        actionButton.triggered.connect(self.OnLineSettings)
+        commandsMenu.addAction(actionButton)
 
         commandsMenu.addSeparator()
         actionButton = QtGui.QAction('Delete All Content (&Factory Reset)', self)
@@ -723,6 +1034,20 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
 
         # Statusbar
         self.statusBar = self.statusBar()
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(150)
+        self.progressBar.hide()
+        self.statusBar.addPermanentWidget(self.progressBar)
+        self.cancelButton = QtWidgets.QPushButton("Cancel")
+        self.cancelButton.clicked.connect(self.OnCancelCommand)
+        self.cancelButton.hide()
+        self.statusBar.addPermanentWidget(self.cancelButton)
+        self.statusBar.addPermanentWidget(self.connectionLabel)
+        self.worker.commandStarted.connect(self.OnCommandStarted)
+        self.worker.commandProgress.connect(self.OnCommandProgress)
+        self.worker.commandFinished.connect(self.OnCommandFinished)
+        self.worker.commandFailed.connect(self.OnCommandFailed)
+        self.deviceIdChanged.connect(self.OnDeviceIdChanged)
 
         # Window Content
         hbox = QtWidgets.QHBoxLayout()
@@ -791,7 +1116,13 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
         self.deviceAction.setText('Device: '+str(self.deviceId))
 
     def OnTextChanged(self):
-        self.statusBar.showMessage("Page: "+self.page+", Chars: "+str(len(self.textField.toPlainText())))
+        code = sixleds_magic.compilemessage(self.textField.toPlainText())
+        message = "Page: "+self.page+", Chars: "+str(len(code.source))+", Bytes: "+str(sixleds_magic.PAGE_OVERHEAD + code.length)
+        if(code.errors):
+            message += " - "+code.describe().split("\n")[0]
+        elif(code.warnings):
+            message += " - "+code.describe(warnings=True).split("\n")[0]
+        self.statusBar.showMessage(message)
 
     def OnOpenReadme(self, e):
         webbrowser.open(__website__)
@@ -800,6 +1131,14 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
         dlg = SixledsGraphicWindow(self)
         dlg.show()
 
+    def OnPreview(self, e):
+        try:
+            dlg = SixledsPreviewWindow(self)
+        except ImportError as error:
+            QtWidgets.QMessageBox.critical(self, "Preview", "The preview requires NumPy ("+str(error)+").")
+            return
+        dlg.show()
+
     def OnOpenAboutDialog(self, e):
         dlg = SixledsAboutWindow(self)
         dlg.exec()
@@ -910,17 +1249,89 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
     def OnDelete(self, e):
         self.textField.insertPlainText("")
 
+    def RunCommand(self, title, func, *args, **kwargs):
+        # serial I/O runs on the worker thread, results are reported via OnCommand*
+        self.worker.Submit(title, func, *args, **kwargs)
+
+    def OnCommandStarted(self, title):
+        self.statusBar.showMessage(title+"...")
+        self.progressBar.setRange(0, 0)
+        self.progressBar.show()
+        self.cancelButton.setEnabled(True)
+        self.cancelButton.show()
+
+    def OnCommandProgress(self, name, result, done, total):
+        self.progressBar.setRange(0, total)
+        self.progressBar.setValue(done)
+        self.statusBar.showMessage(name+": "+result+" ("+str(done)+"/"+str(total)+")")
+
+    def OnCommandFinished(self, title, result):
+        if(isinstance(result, dict)):
+            failed = [name for name, value in result.items() if value != sixleds.RESPONSE_ACK]
+            if(len(failed) > 0): message = title+" - Failed: "+", ".join(failed)
+            elif(len(result) == 0): message = title+" - Nothing to send"
+            else: message = title+" - OK"
+            if(len(result) > 0): self.SetConnectionState("No Reply" if len(failed) == len(result) else "OK")
+        elif(result == False or result == None):
+            message = title+" - Failed"
+            self.SetConnectionState("No Reply")
+        else:
+            message = title+" - OK"
+            self.SetConnectionState("OK")
+        if(self.worker.cancelled.is_set()): message += " (cancelled)"
+        self.statusBar.showMessage(message)
+        self.OnCommandDone()
+
+    def OnCommandFailed(self, title, error):
+        # the port is broken (e.g. adapter unplugged), reconnect on the next command
+        self.connection = None
+        self.SetConnectionState("I/O Error")
+        self.statusBar.showMessage(title+" - Error: "+error)
+        self.OnCommandDone()
+
+    def SetConnectionState(self, state):
+        details = self.serialPort+" #"+str(self.deviceId)
+        if(hasattr(self, 'ld') and self.ld.connected()):
+            details += ", "+str(self.ld.serialsettings['baudrate'])+" baud"
+        self.connectionLabel.setText(state+" ("+details+")")
+
+    def OnCommandDone(self):
+        if(self.worker.Busy()): return
+        self.progressBar.hide()
+        self.cancelButton.hide()
+
+    def OnCancelCommand(self, e):
+        self.cancelButton.setEnabled(False)
+        self.worker.Cancel()
+
+    def PushPage(self, ld, page, content, line, leadingFx, displayMethod, waitTime, laggingFx, progress=None):
+        # runs on the worker thread, the pages are only modified there while it is running
+        ld.updateline(page, content, line, leadingFx, displayMethod, waitTime, laggingFx)
+        return ld.pushchanges(progress=progress)
+
+    def ConfigureLine(self, ld, baudrate, rtscts, timeout, writetimeout):
+        # changing the port settings while sending would garble the packets, so it runs on the worker too
+        ld.configure(baudrate=baudrate, rtscts=rtscts, timeout=timeout, writetimeout=writetimeout)
+        return True
+
+    def PushSchedule(self, ld, schedule, pages, start, end, progress=None):
+        if(pages == ""):
+            ld.updatesched(schedule, active=False)
+        else:
+            ld.updatesched(schedule, pages, active=True, start=start, end=end)
+        return ld.pushchanges(progress=progress)
+
     def OnSendMessage(self, e):
         if(self.SetupConnection()):
             item, ok = QtWidgets.QInputDialog.getText(self, "Send Command", "Enter a raw command to send")
             if ok and item:
-                self.ld.send(item)
+                self.RunCommand("Sending command", self.ld.send, item)
 
     def OnSetDefaultRunPage(self, e):
         if(self.SetupConnection()):
             item, ok = QtWidgets.QInputDialog.getItem(self, "Default Run Page", "Please select a default run page", self.PAGES, 0, False)
             if ok and item:
-                self.ld.send('<RP'+item+'>')
+                self.RunCommand("Setting default run page", self.ld.defaultrunpage, item)
 
     def OnChangeDeviceId(self, e):
         if(self.SetupConnection()):
@@ -934,28 +1345,41 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
         if(self.SetupConnection()):
             item, ok = QtWidgets.QInputDialog.getInt(self, "Set Device ID", "Enter the ID which should be assigned to the device (1..255)", self.deviceId, 1, 255)
             if ok:
-                self.ld.setid(newid=int(item))
-                self.deviceId = item
-                self.UpdatePortAndDeviceText()
+                self.RunCommand("Setting device ID", self.SetDeviceId, self.ld, int(item))
+
+    def SetDeviceId(self, ld, newid):
+        # runs on the worker thread, the new ID is only used once the display confirmed it
+        result = ld.setid(newid)
+        if(result): self.deviceIdChanged.emit(newid)
+        return result
+
+    def OnDeviceIdChanged(self, newid):
+        self.deviceId = newid
+        self.UpdatePortAndDeviceText()
 
     def OnSetClock(self, e):
         if(self.SetupConnection()):
-            self.ld.setclock()
+            self.RunCommand("Setting clock", self.ld.setclock)
 
     def OnSetBrightness(self, e):
         if(self.SetupConnection()):
             item, ok = QtWidgets.QInputDialog.getItem(self, "Set Brightness Level", "Please choose new brightness level", self.BRIGHTNESS, 0, False)
             if ok and item:
-                self.ld.brightness(item)
+                self.RunCommand("Setting brightness", self.ld.brightness, item)
 
     def OnSetSchedule(self, e):
         if(self.SetupConnection()):
             dlg = SixledsScheduleWindow(self)
             dlg.show()
 
+    def OnLineSettings(self, e):
+        if(self.SetupConnection()):
+            dlg = SixledsLineSettingsWindow(self)
+            dlg.show()
+
     def OnFactoryReset(self, e):
         if(self.SetupConnection()):
-            self.ld.send('<D*>')
+            self.RunCommand("Deleting all content", self.ld.deleteall)
 
     def OnInsertCmd(self, cmd, e):
         self.textField.insertPlainText(cmd)
@@ -993,9 +1417,19 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
 
     def SetupConnection(self, message=True):
         logging.getLogger().setLevel(logging.INFO)
+        # keep the port and the config open as long as port and device ID stay the same
+        if(self.connection == (self.serialPort, self.deviceId) and self.ld.isopen()):
+            return True
+        if(self.worker.Busy()):
+            # the worker is still using the current connection
+            if(message): QtWidgets.QMessageBox.information(self, "Busy", "Please wait until the running command is finished.")
+            return False
         if(hasattr(self, 'ld') and self.ld.isopen()): self.ld.close()
         self.ld = sixleds.sixleds(dev=self.serialPort, conf=self.configFile, device=self.deviceId)
+        self.connection = (self.serialPort, self.deviceId)
         if(self.ld.ser == None):
+            self.connection = None
+            self.SetConnectionState("Disconnected")
             if(message):
                 messageText = "Cannot send data. Please check if serial port »"+self.serialPort+"« is correct and if you have privileges to use this port (add your user to group dialout via »usermod -a -G dialout USERNAME« and log in again).\n\nIf the error persists, please use the command line tool to examine the error."
                 if(platform.system() == 'Windows' or platform.system() == 'Darwin'):
@@ -1003,6 +1437,7 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
                 QtWidgets.QMessageBox.critical(self, "Connection Error", messageText)
             return False
         else:
+            self.SetConnectionState("Connected")
             return True
 
     def OnSelectSerialPort(self, e):
@@ -1013,13 +1448,24 @@ class SixledsMainWindow(QtWidgets.QMainWindow):
             self.UpdatePortAndDeviceText()
 
     def OnSendPage(self, e):
+        code = sixleds_magic.compilemessage(self.textField.toPlainText())
+        if(code.errors):
+            QtWidgets.QMessageBox.warning(self, "Invalid Page", "The page can not be sent:\n\n"+code.describe())
+            return
         if(self.SetupConnection()):
-            self.ld.updateline(self.page, self.textField.toPlainText(), self.line, self.leadingFx, self.displayMethod, self.waitTime, self.laggingFx)
-            self.ld.pushchanges()
+            self.RunCommand("Sending page "+self.page, self.PushPage, self.ld,
+                self.page, self.textField.toPlainText(), self.line, self.leadingFx, self.displayMethod, self.waitTime, self.laggingFx,
+                progress=True
+            )
 
     def OnQuit(self, e):
         self.close()
 
+    def closeEvent(self, event):
+        self.worker.Stop()
+        self.portScanner.wait()
+        event.accept()
+
 
 def main():
     app = QtWidgets.QApplication(sys.argv)
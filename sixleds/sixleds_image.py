@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .sixleds_graphic import BLOCK_WIDTH, ROWS, WIDTH, CODES
+import hashlib
+import logging
+import os
+
+
+# image files which are converted by loadgraphic()
+IMAGE_EXTENSIONS = ('.png', '.ppm', '.pgm', '.pbm', '.bmp')
+
+# converted images, the key is a hash of the image file and the conversion settings
+DEFAULT_CACHE = '~/.cache/sixleds/images'
+
+# bump when the conversion changes, so cached results are not reused
+CONVERSION_VERSION = 1
+
+# 4x4 ordered dithering thresholds
+BAYER = [
+    [ 0,  8,  2, 10],
+    [12,  4, 14,  6],
+    [ 3, 11,  1,  9],
+    [15,  7, 13,  5],
+]
+
+
+def imagecodes(image, dither=True):
+    """Convert an image into the 2 bit color codes of a graphic
+
+    The LEDs have a red and a green part (both on = yellow), so the red and
+    green channel of the image are quantized to on/off independently. The
+    image is scaled to 7 rows, the width keeps the aspect ratio (8..32
+    pixels) and is padded with off pixels to complete blocks.
+    Requires Pillow and NumPy.
+
+    Parameters
+    ------
+    image: :obj:`PIL.Image.Image`
+        The image to convert, transparent pixels are off
+    dither: bool, default=True
+        Use ordered dithering instead of a fixed threshold
+
+    Return
+    ------
+    :obj:`numpy.ndarray`
+        uint8 array of 7 rows, 0b10 = red, 0b01 = green, 0b11 = yellow, 0b00 = off
+    """
+    import numpy
+    from PIL import Image
+
+    image = image.convert('RGBA')
+    background = Image.new('RGBA', image.size, (0, 0, 0, 255))
+    image = Image.alpha_composite(background, image).convert('RGB')
+
+    width = max(BLOCK_WIDTH, min(WIDTH, round(image.width * ROWS / image.height)))
+    image = image.resize((width, ROWS), Image.Resampling.BOX)
+    pixels = numpy.asarray(image, dtype=numpy.float32) / 255
+
+    if dither:
+        tiles = numpy.tile(numpy.array(BAYER, dtype=numpy.float32), (-(-ROWS // 4), -(-width // 4)))
+        threshold = (tiles[:ROWS, :width] + 0.5) / 16
+    else:
+        threshold = 0.5
+    red = pixels[:, :, 0] > threshold
+    green = pixels[:, :, 1] > threshold
+
+    codes = numpy.zeros((ROWS, -(-width // BLOCK_WIDTH) * BLOCK_WIDTH), dtype=numpy.uint8)
+    codes[:, :width] = (red.astype(numpy.uint8) << 1) | green.astype(numpy.uint8)
+    return codes
+
+
+def codestext(codes):
+    """Returns the text representation of a graphic (like the files in sample-graphics)"""
+    return ''.join(bytes(row).translate(CODES).decode('ascii') + '\r\n' for row in codes)
+
+
+def importimage(path, dither=True, cachedir=DEFAULT_CACHE):
+    """Convert an image file into a text graphic
+
+    Results are cached by a hash of the file content, so converting the
+    same image again only reads the file.
+
+    Parameters
+    ------
+    path: string
+        The image file (PNG, PPM, BMP or anything else Pillow can read)
+    dither: bool, default=True
+        see imagecodes
+    cachedir: string, default=DEFAULT_CACHE
+        Where converted images are stored, None to disable the cache
+
+    Return
+    ------
+    string:
+        the graphic, ready for programgraphic()
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    cacheFile = None
+    if cachedir is not None:
+        key = hashlib.sha1(content + b'|%d|%d' % (CONVERSION_VERSION, dither)).hexdigest()
+        cacheFile = os.path.join(os.path.expanduser(cachedir), key + '.txt')
+        if os.path.isfile(cacheFile):
+            with open(cacheFile, 'r', newline='') as f:
+                return f.read()
+
+    import io
+    from PIL import Image
+    with Image.open(io.BytesIO(content)) as image:
+        text = codestext(imagecodes(image, dither))
+
+    if cacheFile is not None:
+        try:
+            os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+            with open(cacheFile + '.tmp', 'w', newline='') as f:
+                f.write(text)
+            os.replace(cacheFile + '.tmp', cacheFile)
+        except OSError as e:
+            logging.warning('Failed to save image cache ' + cacheFile + ': ' + str(e))
+    return text
+
+
+def importimages(paths, dither=True, cachedir=DEFAULT_CACHE, outdir=None):
+    """Convert many image files into text graphics
+
+    Parameters
+    ------
+    paths: list
+        Image files and directories (all images in it are converted)
+    dither, cachedir:
+        see importimage
+    outdir: string, default=None
+        If set, every graphic is also saved there as '<image name>.txt'
+
+    Return
+    ------
+    dict:
+        image path -> graphic, images which can not be read are logged and skipped
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+        else:
+            files.append(path)
+
+    result = {}
+    for fileName in files:
+        try:
+            result[fileName] = importimage(fileName, dither, cachedir)
+        except (OSError, ValueError) as e:
+            logging.warning('Skipping image ' + fileName + ': ' + str(e))
+            continue
+        if outdir is not None:
+            with open(os.path.join(outdir, os.path.splitext(os.path.basename(fileName))[0] + '.txt'), 'w', newline='') as f:
+                f.write(result[fileName])
+    return result
+
+
+def loadgraphic(path):
+    """Read a graphic file, images are converted (see importimage)
+
+    Return
+    ------
+    string:
+        the graphic, ready for programgraphic()
+    """
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return importimage(path)
+    with open(path, 'r') as f:
+        return f.read()
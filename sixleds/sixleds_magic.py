@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+import re
+
+
+# chars which are sent as european chars <Uxx>, see opage.message
+TTABLE = {
+    ord('€'): '<U00>', ord('↑'): '<U01>', ord('↓'): '<U02>', ord('˥'): '<U03>',
+    ord('˦'): '<U04>', ord('˨'): '<U05>', ord('˩'): '<U06>', ord('└'): '<U07>',
+    ord('┴'): '<U08>', ord('├'): '<U09>', ord('┬'): '<U0A>', ord('─'): '<U0B>',
+    ord('┼'): '<U0C>', ord('┘'): '<U0D>', ord('┌'): '<U0E>', ord('█'): '<U0F>',
+
+    ord('▄'): '<U10>', ord('▌'): '<U11>', ord('▐'): '<U12>', ord('▀'): '<U13>',
+    ord('α'): '<U14>', ord('β'): '<U15>', ord('Γ'): '<U16>', ord('ä'): '<U17>',
+    ord('Σ'): '<U18>', ord('σ'): '<U19>', ord('μ'): '<U1A>', ord('τ'): '<U1B>',
+    ord('Φ'): '<U1C>', ord('≈'): '<U1D>', ord('Ω'): '<U1E>', ord('δ'): '<U1F>',
+
+    ord('∞'): '<U20>', ord('λ'): '<U21>', ord('¢'): '<U22>', ord('£'): '<U23>',
+    ord('♉'): '<U24>', ord('¥'): '<U25>', ord('→'): '<U26>', ord('←'): '<U27>',
+    ord('¿'): '<U28>', ord('©'): '<U29>', ord('ª'): '<U2A>', ord('≥'): '<U2B>',
+    ord('Ɛ'): '<U2C>', ord('∩'): '<U2D>', ord('®'): '<U2E>', ord('�'): '<U2F>',
+
+    ord('š'): '<U30>', ord('±'): '<U31>', ord('²'): '<U32>', ord('³'): '<U33>',
+    ord('ž'): '<U34>', ord('Ÿ'): '<U35>', ord('¶'): '<U36>', ord('ɶ'): '<U37>',
+    ord('Š'): '<U38>', ord('¹'): '<U39>', ord('⁰'): '<U3A>', ord('≤'): '<U3B>',
+    ord('¼'): '<U3C>', ord('½'): '<U3D>', ord('¤'): '<U3E>', ord('¿'): '<U3F>',
+
+    ord('À'): '<U40>', ord('Á'): '<U41>', ord('Â'): '<U42>', ord('Ã'): '<U43>',
+    ord('Ä'): '<U44>', ord('Å'): '<U45>', ord('Æ'): '<U46>', ord('Ç'): '<U47>',
+    ord('È'): '<U48>', ord('É'): '<U49>', ord('Ê'): '<U4A>', ord('Ë'): '<U4B>',
+    ord('Ì'): '<U4C>', ord('Í'): '<U4D>', ord('Î'): '<U4E>', ord('Ï'): '<U4F>',
+
+    ord('Ð'): '<U50>', ord('Ñ'): '<U51>', ord('Ò'): '<U52>', ord('Ó'): '<U53>',
+    ord('Ô'): '<U54>', ord('Õ'): '<U55>', ord('Ö'): '<U56>', ord('Ž'): '<U57>',
+    ord('Ø'): '<U58>', ord('Ù'): '<U59>', ord('Ú'): '<U5A>', ord('Û'): '<U5B>',
+    ord('Ü'): '<U5C>', ord('Ý'): '<U5D>', ord('Þ'): '<U5E>', ord('ß'): '<U5F>',
+
+    ord('à'): '<U60>', ord('á'): '<U61>', ord('â'): '<U62>', ord('ã'): '<U63>',
+    ord('ä'): '<U64>', ord('å'): '<U65>', ord('æ'): '<U66>', ord('ç'): '<U67>',
+    ord('è'): '<U68>', ord('é'): '<U69>', ord('ê'): '<U6A>', ord('ë'): '<U6B>',
+    ord('ì'): '<U6C>', ord('í'): '<U6D>', ord('î'): '<U6E>', ord('ï'): '<U6F>',
+
+    ord('ð'): '<U70>', ord('ñ'): '<U71>', ord('ò'): '<U72>', ord('ó'): '<U73>',
+    ord('ô'): '<U74>', ord('õ'): '<U75>', ord('ö'): '<U76>', ord('…'): '<U77>',
+    ord('ø'): '<U78>', ord('ù'): '<U79>', ord('ú'): '<U7A>', ord('û'): '<U7B>',
+    ord('ü'): '<U7C>', ord('ý'): '<U7D>', ord('þ'): '<U7E>', ord('ÿ'): '<U7F>',
+}
+
+# magic strings: font, bell, color, graphic, date/time, european char, column
+TAGS = re.compile(r'<(A[A-E]|B[A-Z]|C[A-NP-S]|G[A-P][1-8]|K[DT]|U[0-7][0-9A-F]|N[0-9A-F]{2})>')
+
+# looks like a magic string of a known kind, but is not one (e.g. '<Bob>'),
+# sent as text
+SUSPECT = re.compile(r'<([ABCGKNU])([^<>]{0,3})>')
+
+# what the kinds of magic strings mean, for warnings
+KINDS = {
+    'A': 'font <AA>..<AE>',
+    'B': 'bell <BA>..<BZ>',
+    'C': 'color <CA>..<CS> (there is no <CO>)',
+    'G': 'graphic <GA1>..<GP8>',
+    'K': 'date/time <KD> or <KT>',
+    'N': 'column <N00>..<NFF>',
+    'U': 'european char <U00>..<U7F>',
+}
+
+# shown instead of chars the display does not have
+REPLACEMENT = '?'
+# whitespace control chars the display does not have, sent as a space
+LINEBREAKS = '\r\n\t'
+
+# bytes of a page frame around the message: <IDxx><Ln><Pn><Fx><Mx><Wx><Fx> ... CS<E>
+PAGE_OVERHEAD = 6 + 8 + 16 + 2 + 3
+
+
+class compiledmessage():
+    """A page message split into text and magic strings
+
+    Created by compilemessage(), do not modify it, it is shared by all pages
+    with the same message.
+    """
+    __slots__ = ('source', 'tokens', 'errors', 'warnings', 'text', 'saved')
+
+    def __init__(self, source, tokens, errors, warnings=()):
+        """
+        Parameters
+        ------
+        source: string
+            The message as entered
+        tokens: tuple
+            (kind, value) tuples, kind 'T' is text (value is the text, european
+            chars already translated), the other kinds are the first letter of a
+            magic string (value is the rest, e.g. ('C', 'B') for <CB>)
+        errors: tuple
+            (position in source, message) tuples, the page can not be sent
+        warnings: tuple
+            (position in source, message) tuples of text which looks like a
+            magic string, it is sent as text
+        """
+        self.source = source
+        self.tokens = tokens
+        self.errors = errors
+        self.warnings = warnings
+        self.text, self.saved = encode(optimize(tokens), encode(tokens)[0])
+
+    @property
+    def length(self):
+        """Number of bytes of the message on the line"""
+        return len(self.text)
+
+    def describe(self, warnings=False):
+        """Returns the errors (or the warnings) as text, one line per error (positions count from 1)"""
+        return '\n'.join('Char %d: %s' % (position + 1, message) for position, message in (self.warnings if warnings else self.errors))
+
+
+def tokenize(message):
+    """Split a message into text and magic strings
+
+    Parameters
+    ------
+    message: string
+        The message as entered, with magic strings and european chars
+
+    Return
+    ------
+    tuple:
+        (tokens, errors, warnings), see compiledmessage
+    """
+    tokens = []
+    errors = []
+    warnings = []
+    text = []
+    position = 0
+
+    def addtext(start, end):
+        for offset in range(start, end):
+            char = message[offset]
+            if ord(char) in TTABLE:
+                if text:
+                    tokens.append(('T', ''.join(text)))
+                    text.clear()
+                tokens.append(('U', TTABLE[ord(char)][2:4]))
+            elif 0x20 <= ord(char) <= 0x7F:
+                text.append(char)
+            elif char in LINEBREAKS:
+                if not (char == '\n' and offset > start and message[offset - 1] == '\r'):
+                    warnings.append((offset, 'the display has one line, %r is sent as a space' % char))
+                    text.append(' ')
+            else:
+                errors.append((offset, 'the display has no char %r (U+%04X)' % (char, ord(char))))
+                text.append(REPLACEMENT)
+
+    for match in TAGS.finditer(message):
+        addtext(position, match.start())
+        if text:
+            tokens.append(('T', ''.join(text)))
+            text.clear()
+        tag = match.group(1)
+        tokens.append((tag[0], tag[1:]))
+        position = match.end()
+    addtext(position, len(message))
+    if text:
+        tokens.append(('T', ''.join(text)))
+
+    for match in SUSPECT.finditer(message):
+        if not TAGS.fullmatch(match.group(0)):
+            warnings.append((match.start(), '%s is no magic string and sent as text, expected %s' % (match.group(0), KINDS[match.group(1)])))
+    errors.sort()
+    warnings.sort()
+    return tuple(tokens), tuple(errors), tuple(warnings)
+
+
+def optimize(tokens):
+    """Remove magic strings which do not change what the display shows
+
+    Font (<Ax>) and color (<Cx>) tags which select the current font or
+    color and font, color and column (<Nxx>) tags which are replaced by the
+    next one of their kind before anything is shown are removed. The first
+    font and color tag is always kept, the state of the display at the
+    begin of a page is not known. Tags at the end of the message are kept
+    too, the display carries their state into the next page.
+
+    Parameters
+    ------
+    tokens: tuple
+        see compiledmessage
+
+    Return
+    ------
+    list:
+        the remaining tokens
+    """
+    result = []
+    current = {}  # kind -> value used by the last output
+    pending = {}  # kind -> (index in result, value) of a tag not followed by output yet
+    for kind, value in tokens:
+        if kind in 'ACN':
+            if kind in pending:
+                # replaced before anything was shown
+                result[pending.pop(kind)[0]] = None
+            if kind != 'N' and current.get(kind) == value:
+                continue
+            pending[kind] = (len(result), value)
+        elif kind != 'B':
+            # text, graphics, date/time and european chars are shown
+            current.update((kind, value) for kind, (index, value) in pending.items())
+            pending = {}
+        result.append((kind, value))
+    return [token for token in result if token is not None]
+
+
+def encode(tokens, fallback=None):
+    """Returns the message text of tokens as sent to the display
+
+    Parameters
+    ------
+    tokens: list
+        see compiledmessage
+    fallback: string, default=None
+        Returned instead if text of the tokens would join into a new magic
+        string (e.g. '<' and 'CB>' after the tag between them was removed)
+
+    Return
+    ------
+    tuple:
+        (text, number of bytes less than fallback)
+    """
+    text = ''.join(value if kind == 'T' else '<' + kind + value + '>' for kind, value in tokens)
+    if fallback is not None:
+        if len(TAGS.findall(text)) != sum(1 for kind, value in tokens if kind != 'T'):
+            return fallback, 0
+        return text, len(fallback) - len(text)
+    return text, 0
+
+
+@lru_cache(maxsize=1024)
+def compilemessage(message):
+    """Compile a page message, the result is cached
+
+    Parameters
+    ------
+    message: string
+        The message as entered, with magic strings and european chars
+
+    Return
+    ------
+    :obj: 'compiledmessage'
+        tokens, errors, warnings and the optimized text which is sent
+    """
+    return compiledmessage(message, *tokenize(message))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from . import __version__
+from functools import reduce
+from operator import xor
+import argparse
+import threading
+import logging
+import random
+import select
+import time
+import tty
+import os
+import re
+
+
+# packets which carry binary data of a fixed length after the command
+BINARY_PACKETS = [
+    (re.compile(rb'<G[A-P][1-8]>'), 64), # graphic block
+    (re.compile(rb'<F[ABC][0-3][0-9A-F]>'), 8), # european char
+]
+
+PAGE_HEADER = re.compile(r'<F[A-Sa-s]><M[A-EQ-Ua-eq-u]><W[A-Z]><F[A-Ka-k]>')
+
+
+class simulator():
+    """A virtual display which answers like the real one
+
+    The frames sent to the display are parsed and checked like the display
+    does: frames for other IDs and unknown packets are ignored, frames with
+    a wrong checksum are answered with NACK. Pages, schedules, graphics and
+    settings are kept in memory.
+
+    Use open() to create a pseudo-terminal, the library and the CLI can then
+    use it like a serial port (e.g. --port /dev/pts/3). feed() can be used
+    to talk to the simulator without a terminal.
+    """
+
+    def __init__(self, device=0x01, latency=0.0, baud=None, nackrate=0.0, droprate=0.0, garbagerate=0.0, seed=None):
+        ''' Create the virtual display
+
+        Paramaters
+        ------
+        device: int, default=0x01
+            The ID of the display
+        latency: float, default=0.0
+            Seconds the display needs to process a frame before it replies
+        baud: int, default=None
+            If set, also wait for the time the frame needs on a line with
+            this baud rate (10 bits per byte)
+        nackrate, droprate, garbagerate: float, default=0.0
+            Probability to reply NACK, no reply or garbage to a valid frame
+        seed: int, default=None
+            Seed for the error injection, for reproducible runs
+
+        Return
+        ------
+        :obj: 'simulator'
+            The simulator Object
+        '''
+        self.device = device
+        self.latency = latency
+        self.baud = baud
+        self.nackrate = nackrate
+        self.droprate = droprate
+        self.garbagerate = garbagerate
+        self.random = random.Random(seed)
+
+        self.rxbuf = b''
+        self.master = None
+        self.slave = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.reset()
+        self.stats = {'frames': 0, 'bytes': 0, 'ACK': 0, 'NACK': 0, 'ignored': 0, 'dropped': 0, 'garbage': 0}
+
+    def reset(self):
+        '''Delete all contents, like <D*>'''
+        self.pages = {}       # (line, page) -> packet without <Ln><Pn>
+        self.schedules = {}   # schedule -> (start, end, pages)
+        self.graphics = {}    # slot, e.g. 'A1' -> 64 bytes graphic data
+        self.chars = {}       # font + position -> 8 bytes char data
+        self.defaultPage = None
+
+    def open(self):
+        '''Create the pseudo-terminal
+
+        Return
+        ------
+        string:
+            the path of the terminal to use as serial port
+        '''
+        self.master, self.slave = os.openpty()
+        # no echo and no line editing, like a serial line
+        tty.setraw(self.slave)
+        return os.ttyname(self.slave)
+
+    def start(self):
+        '''Serve the terminal in a background thread (see serve)'''
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''Stop the background thread and close the terminal'''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.close()
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master, self.slave = None, None
+
+    def serve(self):
+        '''Answer the frames written to the terminal until stop() is called'''
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            for reply in self.feed(data):
+                os.write(self.master, reply)
+
+    def feed(self, data):
+        """Process bytes received from the line
+
+        Parameters
+        ------
+        data: bytes
+            The received bytes, frames may be split across calls
+
+        Return
+        ------
+        list:
+            the replies (bytes) of the complete frames, in order
+        """
+        self.rxbuf += data
+        replies = []
+        while True:
+            frame = self.nextframe()
+            if frame is None:
+                break
+            reply = self.receive(frame)
+            if reply is not None:
+                delay = self.latency
+                if self.baud:
+                    delay += len(frame) * 10 / self.baud
+                if delay > 0:
+                    time.sleep(delay)
+                replies.append(reply)
+        return replies
+
+    def nextframe(self):
+        '''Cut the next complete frame from the receive buffer, None if there is none'''
+        start = self.rxbuf.find(b'<ID')
+        if start < 0:
+            # keep a possible beginning of a frame
+            self.rxbuf = self.rxbuf[-2:]
+            return None
+        self.rxbuf = self.rxbuf[start:]
+
+        if self.rxbuf.startswith(b'<ID><'):
+            # ID setting: <ID><NN><E>, decimal, three digits above 99
+            position = self.rxbuf.find(b'<E>', 5)
+            if position < 0:
+                if len(self.rxbuf) > 12:
+                    # no end tag, drop it
+                    self.rxbuf = self.rxbuf[3:]
+                return None
+            frame, self.rxbuf = self.rxbuf[:position + 3], self.rxbuf[position + 3:]
+            return frame
+
+        # <IDxx> data packet, checksum, <E>
+        end = None
+        for command, length in BINARY_PACKETS:
+            match = command.match(self.rxbuf, 6)
+            if match:
+                # binary data may contain '<E>'
+                end = match.end() + length + 2 + 3
+                if len(self.rxbuf) < end:
+                    return None
+                break
+        if end is None:
+            position = self.rxbuf.find(b'<E>', 6)
+            if position < 0:
+                if len(self.rxbuf) > 4096:
+                    # no end tag, drop it
+                    self.rxbuf = self.rxbuf[3:]
+                return None
+            end = position + 3
+        frame, self.rxbuf = self.rxbuf[:end], self.rxbuf[end:]
+        return frame
+
+    def receive(self, frame):
+        """Check a frame and execute its packet
+
+        Return
+        ------
+        bytes:
+            the reply, None if the display does not reply
+        """
+        self.stats['frames'] += 1
+        self.stats['bytes'] += len(frame)
+        logging.info('Simulator received: ' + frame.decode('latin-1'))
+
+        match = re.fullmatch(rb'<ID><([0-9]{2,3})><E>', frame)
+        if match:
+            # the display answers with its new ID, data packets address it in hex
+            self.device = int(match.group(1), 10)
+            return match.group(1)
+
+        match = re.fullmatch(rb'<ID([0-9A-Fa-f]{2})>(.*)([0-9A-Fa-f]{2})<E>', frame, re.DOTALL)
+        if match is None:
+            self.stats['ignored'] += 1
+            return None
+        device = int(match.group(1), 16)
+        if device != self.device and device != 0:
+            self.stats['ignored'] += 1
+            return None
+        packet = match.group(2)
+        if int(match.group(3), 16) != reduce(xor, packet, 0):
+            self.stats['NACK'] += 1
+            return None if device == 0 else b'NACK'
+
+        # error injection
+        if self.random.random() < self.droprate:
+            self.stats['dropped'] += 1
+            return None
+        if self.random.random() < self.nackrate:
+            self.stats['NACK'] += 1
+            return None if device == 0 else b'NACK'
+
+        if not self.execute(packet.decode('latin-1')):
+            self.stats['ignored'] += 1
+            return None
+        # there is no reply to the broadcast ID
+        if device == 0:
+            return None
+        if self.random.random() < self.garbagerate:
+            self.stats['garbage'] += 1
+            return bytes(self.random.randrange(256) for i in range(3))
+        self.stats['ACK'] += 1
+        return b'ACK'
+
+    def execute(self, packet):
+        """Apply a packet to the state of the display
+
+        Return
+        ------
+        bool:
+            false if the packet is not known
+        """
+        match = re.fullmatch(r'<L([1-8])><P([A-Z])>(.*)', packet, re.DOTALL)
+        if match:
+            if not PAGE_HEADER.match(match.group(3)):
+                return False
+            self.pages[(match.group(1), match.group(2))] = match.group(3)
+            return True
+        match = re.fullmatch(r'<T([A-E])>(\d{10})(\d{10})([A-Z]{1,31})', packet)
+        if match:
+            self.schedules[match.group(1)] = (match.group(2), match.group(3), match.group(4))
+            return True
+        match = re.fullmatch(r'<G([A-P][1-8])>(.{64})', packet, re.DOTALL)
+        if match:
+            self.graphics[match.group(1)] = match.group(2).encode('latin-1')
+            return True
+        match = re.fullmatch(r'<SC>(\d{14})', packet)
+        if match:
+            self.clock = match.group(1)
+            return True
+        match = re.fullmatch(r'<DL([1-8])P([A-Z])>', packet)
+        if match:
+            self.pages.pop((match.group(1), match.group(2)), None)
+            return True
+        match = re.fullmatch(r'<DT([A-E])>', packet)
+        if match:
+            self.schedules.pop(match.group(1), None)
+            return True
+        if packet == '<D*>':
+            self.reset()
+            return True
+        match = re.fullmatch(r'<RP([A-Z])>', packet)
+        if match:
+            self.defaultPage = match.group(1)
+            return True
+        match = re.fullmatch(r'<B([A-Z])>', packet)
+        if match:
+            self.brightness = match.group(1)
+            return True
+        if packet == '<DU>':
+            self.chars = {}
+            return True
+        match = re.fullmatch(r'<F([ABC][0-3][0-9A-F])>(.{8})', packet, re.DOTALL)
+        if match:
+            self.chars[match.group(1)] = match.group(2).encode('latin-1')
+            return True
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sixleds simulator - a virtual display on a pseudo-terminal, use it with --port <TERMINAL>')
+    parser.add_argument("--id", default=1, type=int, help="ID of the display")
+    parser.add_argument("--latency", default=0.0, type=float, help="seconds to process a frame")
+    parser.add_argument("--baud", default=0, type=int, help="also wait for the transfer time at this baud rate")
+    parser.add_argument("--nack-rate", default=0.0, type=float, help="probability to reply NACK")
+    parser.add_argument("--drop-rate", default=0.0, type=float, help="probability to not reply")
+    parser.add_argument("--garbage-rate", default=0.0, type=float, help="probability to reply garbage")
+    parser.add_argument("--seed", default=None, type=int)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--version", action="store_true")
+    args = parser.parse_args()
+
+    if(args.version):
+        print(__version__)
+        exit(0)
+
+    if(args.verbose):
+        logging.getLogger().setLevel(logging.INFO)
+
+    sim = simulator(device=args.id, latency=args.latency, baud=args.baud or None,
+        nackrate=args.nack_rate, droprate=args.drop_rate, garbagerate=args.garbage_rate, seed=args.seed)
+    print("Virtual display with ID " + str(args.id) + " on " + sim.open())
+    try:
+        sim.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+        print(sim.stats)
+
+
+if __name__ == "__main__":
+    main()
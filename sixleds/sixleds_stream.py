@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .sixleds_magic import compilemessage
+from time import monotonic
+import logging
+import select
+import socket
+import stat
+import sys
+import os
+
+
+PAGES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def parseupdate(line):
+    """Parse one line of a stream
+
+    A line is the page letter, a space and the message, e.g. 'A <CB>Queue: 12'.
+
+    Parameters
+    ------
+    line: string
+        The line without the line break
+
+    Return
+    ------
+    tuple:
+        (page, message)
+
+    Raises
+    ------
+    ValueError
+        if the line is no page update or the message has errors
+    """
+    page, sep, message = line.partition(' ')
+    if len(page) != 1 or page not in PAGES:
+        raise ValueError('Not a page update: ' + repr(line))
+    if message == '':
+        raise ValueError('Empty message for page ' + page)
+    code = compilemessage(message)
+    if code.errors:
+        raise ValueError('Page ' + page + ': ' + code.describe().replace('\n', ', '))
+    return page, message
+
+
+class ticker():
+    """Feeds page updates from a stream to the display
+
+    Updates are collected for a short window and then pushed together.
+    An update replaces an update of the same page which was not pushed
+    yet, so bursts cost one push and only the last value of a page is
+    sent. Values which the display already shows are skipped by
+    pushchanges. The serial port stays open the whole time.
+    """
+
+    def __init__(self, ld, window=0.2, FX='E', MX='Q', WX='A', FY='E', sendwindow=1):
+        ''' Create the ticker
+
+        Paramaters
+        ------
+        ld: :obj: 'sixleds'
+            The connection to the display
+        window: float, default=0.2
+            Seconds to collect updates after the first one before pushing
+        FX, MX, WX, FY: string
+            The effects of the updated pages (see opage)
+        sendwindow: int, default=1
+            see pushchanges
+
+        Return
+        ------
+        :obj: 'ticker'
+            The ticker Object
+        '''
+        self.ld = ld
+        self.window = window
+        self.effects = (FX, MX, WX, FY)
+        self.sendwindow = sendwindow
+        self.pending = {}     # page -> message, in order of arrival
+        self.deadline = None
+        self.stats = {'received': 0, 'invalid': 0, 'superseded': 0, 'pushes': 0, 'sent': 0}
+
+    def update(self, page, message):
+        '''Queue a page update, it is pushed when the window is over'''
+        self.stats['received'] += 1
+        if page in self.pending:
+            self.stats['superseded'] += 1
+            del self.pending[page]
+        self.pending[page] = message
+        if self.deadline is None:
+            self.deadline = monotonic() + self.window
+
+    def feed(self, line):
+        '''Queue the update of a line, invalid lines are logged and skipped'''
+        line = line.rstrip('\r\n')
+        if line.strip() == '':
+            return
+        try:
+            page, message = parseupdate(line)
+        except ValueError as e:
+            self.stats['invalid'] += 1
+            logging.warning('Stream: ' + str(e))
+            return
+        code = compilemessage(message)
+        if code.warnings:
+            logging.warning('Stream: page ' + page + ': ' + code.describe(warnings=True).replace('\n', ', '))
+        self.update(page, message)
+
+    def flush(self):
+        """Push the queued updates
+
+        Return
+        ------
+        dict
+            packet name -> RESPONSE_* result, see pushchanges
+        """
+        self.deadline = None
+        if not self.pending:
+            return {}
+        pending, self.pending = self.pending, {}
+        for page, message in pending.items():
+            self.ld.updateline(page, message, '1', *self.effects)
+        report = self.ld.pushchanges(window=self.sendwindow)
+        self.stats['pushes'] += 1
+        self.stats['sent'] += len(report)
+        logging.info('Stream: pushed ' + ', '.join(name + ' ' + result for name, result in report.items()))
+        return report
+
+    def timeout(self):
+        '''Returns the seconds until the queued updates are due, None if there are none'''
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - monotonic())
+
+    def serve(self, source):
+        """Read updates until the stream ends, see stream for the sources
+
+        The queued updates are pushed before returning, also on KeyboardInterrupt.
+        """
+        listener, readers = openstream(source)
+        buffers = dict((reader, b'') for reader in readers)
+        try:
+            while buffers or listener is not None:
+                ready, _, _ = select.select(list(buffers) + ([listener] if listener is not None else []), [], [], self.timeout())
+                for reader in ready:
+                    if reader is listener:
+                        connection, address = listener.accept()
+                        logging.info('Stream: client connected')
+                        buffers[connection] = b''
+                        continue
+                    data = reader.recv(4096) if isinstance(reader, socket.socket) else os.read(reader, 4096)
+                    if not data:
+                        # a client or stdin closed the stream
+                        self.feed(buffers.pop(reader).decode('utf-8', 'replace'))
+                        if isinstance(reader, socket.socket):
+                            reader.close()
+                        continue
+                    lines = (buffers[reader] + data).split(b'\n')
+                    buffers[reader] = lines.pop()
+                    for line in lines:
+                        self.feed(line.decode('utf-8', 'replace'))
+                if self.timeout() == 0.0:
+                    self.flush()
+        finally:
+            self.flush()
+            for reader in buffers:
+                if isinstance(reader, socket.socket):
+                    reader.close()
+                elif reader != sys.stdin.fileno():
+                    os.close(reader)
+            closestream(source, listener)
+
+
+def openstream(source):
+    """Open the source of a stream
+
+    Parameters
+    ------
+    source: string
+        '-' for stdin (the stream ends with stdin), 'unix:<PATH>' or
+        'tcp:<HOST>:<PORT>' to listen for clients which send lines, or the
+        path of a FIFO (created if it does not exist, kept open when writers
+        close it)
+
+    Return
+    ------
+    tuple:
+        (listening socket or None, list of file descriptors to read)
+    """
+    if source == '-':
+        return None, [sys.stdin.fileno()]
+    if source.startswith('unix:'):
+        path = os.path.expanduser(source[5:])
+        if os.path.exists(path):
+            os.remove(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+    elif source.startswith('tcp:'):
+        host, sep, port = source[4:].rpartition(':')
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, int(port)))
+    else:
+        path = os.path.expanduser(source)
+        if not os.path.exists(path):
+            os.mkfifo(path)
+        elif not stat.S_ISFIFO(os.stat(path).st_mode):
+            raise OSError('Not a FIFO: ' + path)
+        # opened for writing as well, so there is no end of file when a writer closes it
+        return None, [os.open(path, os.O_RDWR)]
+    listener.listen()
+    return listener, []
+
+
+def closestream(source, listener):
+    '''Close the listening socket of a stream'''
+    if listener is None:
+        return
+    listener.close()
+    if source.startswith('unix:'):
+        os.remove(os.path.expanduser(source[5:]))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from . import RESPONSE_ACK, RESPONSE_INVALID, RESPONSE_SUPERSEDED, RESPONSE_EXPIRED, RESPONSE_CANCELLED
+from itertools import count
+from time import monotonic
+import threading
+import logging
+import heapq
+
+
+# priority classes, lower is sent first
+URGENT     = 0
+NORMAL     = 1
+BACKGROUND = 2
+
+PRIORITIES = {'urgent': URGENT, 'normal': NORMAL, 'background': BACKGROUND}
+
+
+class ticket():
+    """A packet queued in a transmitter"""
+
+    __slots__ = ('name', 'packet', 'priority', 'deadline', 'seq', 'change', 'result', 'report', 'done')
+
+    def __init__(self, name, packet, priority, deadline, seq, change=None):
+        self.name = name
+        self.packet = packet
+        self.priority = priority
+        self.deadline = deadline
+        self.seq = seq
+        self.change = change
+        self.result = None
+        self.report = None    # name -> RESPONSE_* result of the packets of a job
+        self.done = threading.Event()
+
+    def key(self):
+        '''Sort key: priority class, then the earliest deadline, then the order of submission'''
+        return (self.priority, float('inf') if self.deadline is None else self.deadline, self.seq)
+
+    def __lt__(self, other):
+        return self.key() < other.key()
+
+    def finish(self, result):
+        self.result = result
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Wait until the packet was sent or dropped
+
+        Return
+        ------
+        string:
+            the RESPONSE_* result, None if the timeout is over
+        """
+        self.done.wait(timeout)
+        return self.result
+
+
+class transmitter():
+    """Sends the packets of several callers to the display, urgent ones first
+
+    A background thread owns the serial port and sends one packet at a time,
+    always the most urgent queued one, so an urgent packet only waits for
+    the reply of the packet in flight, also while a bulk push is running.
+    A packet which is submitted with the name of a queued one (e.g. 'L1PA'
+    for page A) replaces it, the display would show the old content only
+    for a moment anyway. Packets whose deadline is over before they could
+    be sent are dropped.
+
+    Other threads must hold lock while they change pages or schedules of
+    the sixleds object, and also port while they talk to the display (see
+    exclusive).
+    """
+
+    def __init__(self, ld, retries=1):
+        ''' Create the transmitter, start() starts sending
+
+        Paramaters
+        ------
+        ld: :obj: 'sixleds'
+            The connection to the display
+        retries: int, default=1
+            How often packets which were not acknowledged are resent (see sendmany)
+
+        Return
+        ------
+        :obj: 'transmitter'
+            The transmitter Object
+        '''
+        self.ld = ld
+        self.retries = retries
+        # guards pages, schedules, shadow and config of the sixleds object
+        self.lock = threading.RLock()
+        # held while a packet is sent, the lock is not held meanwhile
+        self.port = threading.RLock()
+        self.condition = threading.Condition()
+        self.heap = []
+        self.queued = {}      # name -> ticket in the heap
+        self.swapping = set() # pages with a spare page the queued swap job writes
+        self.seq = count()
+        self.thread = None
+        self.stopped = False
+        self.drain = True
+
+    def start(self):
+        '''Start the sending thread'''
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, drain=True):
+        """Stop the sending thread
+
+        Parameters
+        ------
+        drain: bool, default=True
+            Send the queued packets first, otherwise they are cancelled
+        """
+        with self.condition:
+            self.stopped = True
+            self.drain = drain
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, name, packet, priority=NORMAL, deadline=None, change=None):
+        """Queue a packet
+
+        Parameters
+        ------
+        name: string
+            Packets with the same name replace each other while queued, None
+            for a packet which is always sent
+        packet: string or bytes
+            The packet (see sixleds.frame)
+        priority: int, default=NORMAL
+            URGENT, NORMAL or BACKGROUND
+        deadline: float, default=None
+            Seconds from now in which the packet has to be sent, it is
+            dropped (RESPONSE_EXPIRED) otherwise
+        change: tuple, default=None
+            The change as returned by collectchanges (or bankchanges for
+            graphics), the result is saved with pushresult (or bankresult)
+            after sending
+
+        Return
+        ------
+        :obj: 'ticket'
+            to wait for the result
+        """
+        with self.condition:
+            if deadline is not None:
+                deadline = monotonic() + deadline
+            old = self.queued.pop(name, None) if name is not None else None
+            if old is not None:
+                # the newer packet keeps the place of the more urgent one
+                priority = min(priority, old.priority)
+                old.finish(RESPONSE_SUPERSEDED)
+                logging.info(name + ' ' + RESPONSE_SUPERSEDED)
+            item = ticket(name, packet, priority, deadline, next(self.seq), change)
+            heapq.heappush(self.heap, item)
+            if name is not None:
+                self.queued[name] = item
+            self.condition.notify()
+        return item
+
+    def cancel(self, name):
+        '''Drop the queued packet with the name, returns false if there is none'''
+        with self.condition:
+            item = self.queued.pop(name, None)
+        if item is None:
+            return False
+        item.finish(RESPONSE_CANCELLED)
+        return True
+
+    def pending(self):
+        '''Returns the number of queued packets'''
+        with self.condition:
+            return sum(1 for item in self.heap if item.result is None)
+
+    def pushchanges(self, priority=BACKGROUND, deadline=None, reset=False, names=None):
+        """Queue the changed pages and schedules (see sixleds.pushchanges)
+
+        Unlike sixleds.pushchanges the display is not turned off during the
+        push, urgent packets sent in between would not be visible otherwise.
+        Pages with a spare page are left to one job named 'swap' (see swap),
+        which picks the slot which is not shown when it runs, writes the
+        pages and switches the display over. A later push replaces the queued
+        job, so the slot of a page is never written by two pushes at once.
+
+        Parameters
+        ------
+        priority, deadline:
+            see submit
+        reset: bool, default=False
+            Queue all pages and schedules
+        names: list, default=None
+            Only queue these changes (e.g. ['L1PA']), all if None
+
+        Return
+        ------
+        list:
+            the tickets of the changes, pages with errors in their message
+            are not sent, their tickets are finished with RESPONSE_INVALID;
+            the report of the swap ticket has the results of its packets
+        """
+        tickets = []
+        with self.lock:
+            changes = [change for change in self.ld.collectchanges(reset) if names is None or change[0] in names]
+            buffered = set(self.ld.pageof(change[0]) for change in changes) & set(self.ld.spares)
+            if buffered:
+                changes = [change for change in changes if self.ld.pageof(change[0]) not in buffered]
+                self.swapping.update(buffered)
+            invalid = self.ld.invalidchanges(changes)
+            if invalid:
+                self.ld.pushresult(invalid, [change for change in changes if change[0] in invalid])
+        for change in changes:
+            name, packet, item, message = change
+            if name in invalid:
+                done = ticket(name, packet, priority, None, next(self.seq))
+                done.finish(RESPONSE_INVALID)
+                tickets.append(done)
+            else:
+                tickets.append(self.submit(name, packet, priority, deadline, change))
+        if buffered:
+            tickets.append(self.submit('swap', self.swap, priority, deadline))
+        return tickets
+
+    def programbank(self, bank, priority=BACKGROUND, deadline=None, force=False):
+        """Queue the graphics which differ from what the display acknowledged last (see sixleds.programbank)
+
+        Parameters
+        ------
+        bank: dict
+            slot (e.g. 'A1') -> encoded graphic, see sixleds_graphic.compilebank
+        priority, deadline:
+            see submit
+        force: bool, default=False
+            Queue all graphics of the bank
+
+        Return
+        ------
+        list:
+            the tickets of the graphics, named 'G' + slot
+        """
+        with self.lock:
+            packets = self.ld.bankchanges(bank, force)
+        return [self.submit(name, packet, priority, deadline, (name, packet)) for name, packet in packets]
+
+    def swap(self):
+        """The job which writes the pages with a spare page queued by pushchanges (see sixleds.swapchanges)
+
+        The slots and the contents are taken when the job runs, so the pages
+        are written to the slots which are not shown at that time.
+
+        Return
+        ------
+        dict
+            packet name -> RESPONSE_* result
+        """
+        with self.lock:
+            pages, self.swapping = self.swapping, set()
+            changes = [change for change in self.ld.collectchanges() if self.ld.pageof(change[0]) in pages]
+            changes, flips = self.ld.backbuffer(changes)
+            invalid = self.ld.invalidchanges(changes)
+        with self.port:
+            report = self.ld.sendmany([(name, packet) for name, packet, item, message in changes if name not in invalid], 1, self.retries)
+        report.update(invalid)
+        with self.lock:
+            self.ld.pushresult(report, changes)
+            schedules, default = self.ld.switchover(report, flips)
+        if schedules or default:
+            with self.port:
+                switches = self.ld.sendmany([(name, packet) for name, packet, item, message in schedules] + default, 1, self.retries)
+            with self.lock:
+                self.ld.pushresult({name: switches[name] for name, packet, item, message in schedules if name in switches}, schedules)
+            report.update(switches)
+        return report
+
+    def updateline(self, page, message, line='1', FX='E', MX='Q', WX='A', FY='E', priority=NORMAL, deadline=None):
+        """Change a page and queue it if it differs from the display (see sixleds.updateline)
+
+        Return
+        ------
+        list:
+            the tickets of the changes, see pushchanges
+        """
+        with self.lock:
+            self.ld.updateline(page, message, line, FX, MX, WX, FY)
+            name = 'L' + line + 'P' + self.ld.slot(page)
+        return self.pushchanges(priority, deadline, names=[name])
+
+    def exclusive(self, func, *args):
+        '''Call a method of the sixleds object when the packet in flight is done, no packet is sent meanwhile'''
+        with self.lock, self.port:
+            return func(*args)
+
+    def next(self):
+        '''Wait for the next packet to send, None if the thread has to stop'''
+        with self.condition:
+            while True:
+                while self.heap and self.heap[0].result is not None:
+                    # superseded or cancelled
+                    heapq.heappop(self.heap)
+                if self.stopped and (not self.drain or not self.heap):
+                    for item in self.heap:
+                        item.finish(RESPONSE_CANCELLED)
+                    self.heap, self.queued = [], {}
+                    return None
+                if self.heap:
+                    item = heapq.heappop(self.heap)
+                    if self.queued.get(item.name) is item:
+                        del self.queued[item.name]
+                    return item
+                self.condition.wait()
+
+    def run(self):
+        '''Send the queued packets until stop() is called'''
+        while True:
+            item = self.next()
+            if item is None:
+                break
+            if item.deadline is not None and monotonic() > item.deadline:
+                logging.info(str(item.name) + ' ' + RESPONSE_EXPIRED)
+                item.finish(RESPONSE_EXPIRED)
+                continue
+            if callable(item.packet):
+                try:
+                    item.report = item.packet()
+                    failed = [result for result in item.report.values() if result != RESPONSE_ACK]
+                    result = failed[0] if failed else RESPONSE_ACK
+                except Exception:
+                    logging.exception('Job ' + str(item.name) + ' failed')
+                    result = RESPONSE_CANCELLED
+                item.finish(result)
+                continue
+            try:
+                with self.port:
+                    report = self.ld.sendmany([(item.name, item.packet)], 1, self.retries)
+                if item.change is not None:
+                    with self.lock:
+                        if item.name.startswith('G'):
+                            self.ld.bankresult(report, [item.change])
+                        else:
+                            self.ld.pushresult(report, [item.change])
+            except Exception:
+                logging.exception('Sending ' + str(item.name) + ' failed')
+                report = {}
+            item.finish(report.get(item.name, RESPONSE_CANCELLED))
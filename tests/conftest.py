@@ -0,0 +1,15 @@
+import os
+import pytest
+import sixleds
+from sixleds.sixleds_simulator import simulator
+
+
+@pytest.fixture
+def display(tmp_path):
+    sim = simulator()
+    port = sim.open()
+    sim.start()
+    ld = sixleds.sixleds(dev=port, conf=os.path.join(str(tmp_path), 'test'), timeout=0.5)
+    yield sim, ld
+    ld.close()
+    sim.stop()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import os
+import pytest
+import sixleds
+from sixleds.sixleds_simulator import simulator
+
+sixleds_async = pytest.importorskip('sixleds.sixleds_async')
+pytest.importorskip('serial_asyncio')
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def sim():
+    sim = simulator()
+    port = sim.open()
+    sim.start()
+    yield sim, port
+    sim.stop()
+
+
+def test_config_written_off_the_loop(sim, tmp_path):
+    sim, port = sim
+    conf = os.path.join(str(tmp_path), 'test')
+    threads = set()
+
+    async def main():
+        ld = await sixleds_async.AsyncSixleds.open(dev=port, conf=conf, device=1)
+        record = ld.store.record
+        def spy(entries):
+            threads.add(threading.current_thread())
+            return record(entries)
+        ld.store.record = spy
+        ld.updateline('B', 'hello')
+        report = await ld.pushchanges()
+        assert await ld.defaultrunpage('B')
+        await ld.close()
+        return report
+
+    assert run(main()) == {'L1PB': sixleds.RESPONSE_ACK}
+    assert threads and threading.main_thread() not in threads
+    state = sixleds.confstore(conf + '-01.conf').load()
+    assert state['defaultPage'] == 'B'
+    assert state['lines']['1']['B']['MM'] == 'hello'
+    assert 'L1PB' in state['shadow']
+
+
+def test_config_compacted(sim, tmp_path):
+    sim, port = sim
+    conf = os.path.join(str(tmp_path), 'test')
+
+    async def main():
+        ld = await sixleds_async.AsyncSixleds.open(dev=port, conf=conf, device=1)
+        for i in range(sixleds.confstore.COMPACT + 10):
+            ld.defaultPage = 'ABC'[i % 3]
+            ld.confrecord([['default', ld.defaultPage]])
+        await ld.close()
+        return ld.defaultPage
+
+    page = run(main())
+    store = sixleds.confstore(conf + '-01.conf')
+    state = store.load()
+    assert state['defaultPage'] == page
+    assert store.entries < sixleds.confstore.COMPACT
+    assert os.path.isfile(conf + '-01.conf')
+
+
+def test_sendmany_with_lost_replies(tmp_path):
+    sim = simulator(droprate=0.1, garbagerate=0.1, seed=1)
+    port = sim.open()
+    sim.start()
+    packets = [('L1P' + page, '<L1><P%s><FE><MQ><WA><FE>page %s' % (page, page)) for page in 'ABCDEFGHIJKLMNOP']
+
+    async def main():
+        ld = await sixleds_async.AsyncSixleds.open(dev=port, conf=os.path.join(str(tmp_path), 'test'), device=1, timeout=0.2)
+        report = await ld.sendmany(packets, window=4, retries=10)
+        await ld.close()
+        return report
+
+    try:
+        report = run(main())
+    finally:
+        sim.stop()
+    assert sim.stats['dropped'] + sim.stats['garbage'] > 0
+    assert set(report.values()) == {sixleds.RESPONSE_ACK}
+    assert all(sim.pages[('1', page)].endswith('page ' + page) for page in 'ABCDEFGHIJKLMNOP')
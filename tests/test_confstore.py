@@ -0,0 +1,119 @@
+import copyreg
+import json
+import os
+import pickle
+from sixleds import confstore, opage, oschedule
+
+
+def state(**changes):
+    return dict({
+        'lines': {'1': {'A': confstore.dumpitem(opage('hello'))}},
+        'schedules': {'A': confstore.dumpitem(oschedule('A', '2601010000', '2612312359'))},
+        'defaultPage': 'A',
+        'shadow': {},
+    }, **changes)
+
+
+def test_load_without_config(tmp_path):
+    assert confstore(str(tmp_path / 'none')).load() is None
+
+
+def test_save_and_load(tmp_path):
+    store = confstore(str(tmp_path / 'conf' / 'display'))
+    store.save(state())
+    assert not os.path.exists(store.journal)
+    loaded = confstore(store.path).load()
+    assert loaded['lines'] == state()['lines']
+    assert loaded['schedules'] == state()['schedules']
+    assert loaded['version'] == confstore.VERSION
+    item = confstore.loaditem(loaded['lines']['1']['A'])
+    assert item.MM == 'hello' and not item.changed
+
+
+def test_record_is_replayed(tmp_path):
+    store = confstore(str(tmp_path / 'display'))
+    store.save(state())
+    assert not store.record([['item', 'L1PB', confstore.dumpitem(opage('world'))], ['default', 'B']])
+    assert not store.record([['shadow', 'L1PB', 'abc'], ['item', 'TB', confstore.dumpitem(oschedule('AB'))]])
+    store.record([['shadow', 'L1PB', None], ['serial', {'baudrate': 19200}], ['buffers', {'1': {'A': 'Z'}}, {'1': {'A': 'Z'}}]])
+
+    store = confstore(store.path)
+    loaded = store.load()
+    assert store.entries == 7
+    assert loaded['lines']['1']['B']['MM'] == 'world'
+    assert loaded['schedules']['B']['PP'] == 'AB'
+    assert loaded['defaultPage'] == 'B'
+    assert loaded['shadow'] == {}
+    assert loaded['serial'] == {'baudrate': 19200}
+    assert loaded['spares'] == loaded['shown'] == {'1': {'A': 'Z'}}
+
+
+def test_record_asks_for_compaction(tmp_path):
+    store = confstore(str(tmp_path / 'display'))
+    assert not store.record([['default', 'A']] * (confstore.COMPACT - 1))
+    assert store.record([['default', 'B']])
+    store.save(state())
+    assert store.entries == 0 and not os.path.exists(store.journal)
+
+
+def test_journal_without_snapshot(tmp_path):
+    store = confstore(str(tmp_path / 'display'))
+    store.record([['item', 'L2PC', confstore.dumpitem(opage('two'))]])
+    loaded = confstore(store.path).load()
+    assert loaded['lines']['2']['C']['MM'] == 'two'
+    assert loaded['defaultPage'] == 'A'
+
+
+def test_truncated_journal_entry(tmp_path):
+    store = confstore(str(tmp_path / 'display'))
+    store.save(state())
+    store.record([['default', 'B']])
+    # a crash in the middle of writing the next entry
+    with open(store.journal, 'a') as f:
+        f.write(json.dumps(['item', 'L1PC', confstore.dumpitem(opage('lost'))])[:20])
+
+    store = confstore(store.path)
+    loaded = store.load()
+    assert loaded['defaultPage'] == 'B'
+    assert 'C' not in loaded['lines']['1']
+    assert store.entries == 1
+
+    # the partial entry was cut off, entries recorded after it are readable
+    store.record([['default', 'C']])
+    store = confstore(store.path)
+    assert store.load()['defaultPage'] == 'C'
+    assert store.entries == 2
+
+
+class legacyobject():
+    '''Pickles like the pages and schedules of older versions, which had a dict'''
+
+    def __init__(self, cls, **attributes):
+        self.cls = cls
+        self.attributes = attributes
+
+    def __reduce__(self):
+        return (copyreg._reconstructor, (self.cls, object, None), self.attributes)
+
+
+def test_legacy_pickle(tmp_path):
+    page = legacyobject(opage, MM='old page', FX='A', MX='B', WX='C', FY='D', changed=False)
+    sched = legacyobject(oschedule, PP='AB', st=oschedule().date('2601010000'), en=oschedule().date('2612312359'), active=False, changed=False)
+    path = str(tmp_path / 'display')
+    with open(path, 'wb') as f:
+        pickle.dump(({'1': {'A': page}}, {'A': sched}, 'A'), f)
+
+    loaded = confstore(path).load()
+    assert loaded['lines']['1']['A'] == {'MM': 'old page', 'FX': 'A', 'MX': 'B', 'WX': 'C', 'FY': 'D'}
+    assert loaded['schedules']['A']['PP'] == 'AB'
+    assert loaded['schedules']['A']['st'] == '2601010000'
+    assert not loaded['schedules']['A']['active']
+    assert loaded['defaultPage'] == 'A' and loaded['shadow'] == {}
+
+
+def test_legacy_objects_get_new_slots():
+    page = pickle.loads(pickle.dumps(legacyobject(opage, MM='old page', changed=False)))
+    assert isinstance(page, opage)
+    assert page.MM == 'old page' and page.FX == 'E'
+    # encoded again with its checksum
+    assert page.wire is None and page.code is None
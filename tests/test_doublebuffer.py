@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import os
+import sixleds
+
+
+def shown(sim):
+    '''Returns the message of the page the simulated display runs'''
+    return sim.pages[('1', sim.defaultPage)].rpartition('>')[2]
+
+
+def test_flip_default_page_other_than_a(display):
+    sim, ld = display
+    ld.updateline('B', 'first')
+    ld.pushchanges(swap=False)
+    assert ld.defaultrunpage('B')
+    assert sim.defaultPage == 'B'
+
+    assert ld.doublebuffer('B', 'Z')
+    for content, slot in (('second', 'Z'), ('third', 'B'), ('fourth', 'Z')):
+        ld.updateline('B', content)
+        report = ld.pushchanges()
+        assert report['RP'] == sixleds.RESPONSE_ACK
+        # the new content is visible after every push, from the other slot
+        assert sim.defaultPage == slot
+        assert shown(sim) == content
+
+
+def test_defaultrunpage_is_saved(display):
+    sim, ld = display
+    assert ld.defaultrunpage('C')
+    assert not ld.defaultrunpage('1')
+    state = sixleds.confstore(ld.config).load()
+    assert state['defaultPage'] == 'C'
+
+
+def test_cli_default_page_is_flipped(display, tmp_path):
+    sim, ld = display
+    conf = os.path.join(str(tmp_path), 'cli')
+    cli = [sys.executable, '-m', 'sixleds.sixleds_cli', '--port', ld.ser.port, '--conf', conf, '--id', '1']
+    ld.close()
+    subprocess.run(cli + ['--set-page', 'B', '--content', 'first'], check=True)
+    subprocess.run(cli + ['--set-default', 'B'], check=True)
+    subprocess.run(cli + ['--set-page', 'B', '--content', 'second', '--spare-page', 'Z'], check=True)
+    assert sim.defaultPage == 'Z'
+    assert shown(sim) == 'second'
+
@@ -0,0 +1,32 @@
+import time
+import pytest
+from sixleds.sixleds_emulator import advance, glyph, linewidth
+
+numpy = pytest.importorskip('numpy')
+from sixleds.sixleds_emulator import emulator  # noqa: E402
+
+
+def test_glyphs_are_proportional():
+    assert advance('i') < advance('m')
+    assert len(glyph('l')) == 3
+    assert len(glyph('W')) == 5
+    assert advance(' ') == 4
+
+
+@pytest.mark.parametrize('message', [
+    'Hello World',
+    'iiii mmmm',
+    '<AB>bold<AC>narrow<AD>Large<AE>jumpy',
+    '<AC>caf<U69> <GA1> 1.11',
+    'left<N30>right',
+])
+def test_linewidth_follows_strip(message):
+    # one column wide, the strip is as wide as its content
+    strip = emulator(width=1, now=time.localtime(0)).strip(message)
+    assert linewidth(message) == strip.shape[1]
+
+
+def test_linewidth_counts_the_widest_clock():
+    strip = emulator(width=1, now=time.localtime(0)).strip('<KD> <KT>')
+    assert linewidth('<KD> <KT>') >= strip.shape[1]
+    assert linewidth('<KD> <KT>') == linewidth('00/00/00 00:00')
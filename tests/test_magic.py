@@ -0,0 +1,33 @@
+from sixleds.sixleds_magic import compilemessage, tokenize
+
+
+def test_line_breaks_are_sent_as_spaces():
+    for text in ('one\ntwo', 'one\r\ntwo', 'one\rtwo', 'one\ttwo'):
+        tokens, errors, warnings = tokenize(text)
+        assert not errors
+        assert len(warnings) == 1 and warnings[0][0] == 3
+        assert compilemessage(text).text == 'one two'
+
+
+def test_line_breaks_next_to_magic_strings():
+    code = compilemessage('<AC>one\n<CB>two\n')
+    assert not code.errors
+    assert code.text == '<AC>one <CB>two '
+
+
+def test_other_control_chars_are_errors():
+    tokens, errors, warnings = tokenize('one\x07two')
+    assert [position for position, message in errors] == [3]
+    assert compilemessage('one\x07two').text == 'one?two'
+
+
+def test_optimize_keeps_trailing_tags():
+    # the state at the end of a page is carried into the next one
+    assert compilemessage('<AC>one<CB>').text == '<AC>one<CB>'
+    assert compilemessage('<AC>one<CB><N10><CC>').text == '<AC>one<N10><CC>'
+
+
+def test_optimize_removes_replaced_tags():
+    code = compilemessage('<AC><AB>one<AB><CA><CB>two')
+    assert code.text == '<AB>one<CB>two'
+    assert code.saved == len('<AC><AB><CA>')
@@ -0,0 +1,9 @@
+import sixleds
+
+def test_probebaud_keeps_the_run_page(display):
+    sim, ld = display
+    ld.updateline('B', 'first')
+    ld.pushchanges(swap=False)
+    sim.defaultPage = 'B'
+    assert ld.probebaud() == sixleds.BAUDRATES[0]
+    assert sim.defaultPage == 'B'
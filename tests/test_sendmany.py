@@ -0,0 +1,106 @@
+import os
+from functools import reduce
+from operator import xor
+import pytest
+import sixleds
+from sixleds import RESPONSE_ACK, RESPONSE_NACK, RESPONSE_TIMEOUT
+from sixleds.sixleds_simulator import simulator
+
+PAGES = 'ABCDEFGHIJKLMNOP'
+
+
+@pytest.fixture
+def faulty(tmp_path):
+    '''Returns a function which connects to a simulator with error injection'''
+    opened = []
+
+    def connect(**faults):
+        sim = simulator(seed=1, **faults)
+        port = sim.open()
+        sim.start()
+        ld = sixleds.sixleds(dev=port, conf=os.path.join(str(tmp_path), 'test'), timeout=0.2)
+        opened.append((sim, ld))
+        return sim, ld
+    yield connect
+    for sim, ld in opened:
+        ld.close()
+        sim.stop()
+
+
+def packets():
+    return [('L1P' + page, '<L1><P%s><FE><MQ><WA><FE>page %s' % (page, page)) for page in PAGES]
+
+
+def stored(sim, name):
+    '''True if the simulator holds the page sent as name'''
+    return sim.pages.get(('1', name[-1]), '').endswith('page ' + name[-1])
+
+
+def frame(packet):
+    return b'<ID01>' + packet + b'%02X<E>' % reduce(xor, packet, 0)
+
+
+def test_parseresponse_matches_the_earliest_reply(display):
+    sim, ld = display
+    assert ld.parseresponse('ACKNACKACK') == (RESPONSE_ACK, 'ACK', 'NACKACK')
+    assert ld.parseresponse('NACKACK') == (RESPONSE_NACK, 'NACK', 'ACK')
+    assert ld.parseresponse('NAC') == (None, 'NAC', '')
+    assert ld.parseresponse('05ACK', '05') == (RESPONSE_ACK, '05', 'ACK')
+
+
+def test_feed_split_and_pipelined_frames():
+    sim = simulator()
+    first, second, third = (frame(packet.encode()) for name, packet in packets()[:3])
+    assert sim.feed(first[:5]) == []
+    assert sim.feed(first[5:] + second[:-1]) == [b'ACK']
+    assert sim.feed(second[-1:] + third[:-5] + b'00<E>' + first) == [b'ACK', b'NACK', b'ACK']
+    assert sim.stats['ACK'] == 3 and sim.stats['NACK'] == 1
+
+
+@pytest.mark.parametrize('window', [1, 4])
+def test_sendmany_without_faults(faulty, window):
+    sim, ld = faulty()
+    report = ld.sendmany(packets(), window=window)
+    assert report == dict((name, RESPONSE_ACK) for name, packet in packets())
+    assert sim.stats['frames'] == len(PAGES)
+    assert all(stored(sim, name) for name in report)
+
+
+@pytest.mark.parametrize('window', [1, 4])
+def test_sendmany_resends_nacked_packets(faulty, window):
+    sim, ld = faulty(nackrate=0.3)
+    report = ld.sendmany(packets(), window=window, retries=10)
+    assert set(report.values()) == {RESPONSE_ACK}
+    assert sim.stats['NACK'] > 0
+    # every NACK is matched to its own packet, which is sent once more
+    assert sim.stats['frames'] == len(PAGES) + sim.stats['NACK']
+    assert all(stored(sim, name) for name in report)
+
+
+@pytest.mark.parametrize('window', [1, 4])
+@pytest.mark.parametrize('faults', [{'droprate': 0.1}, {'garbagerate': 0.1}, {'nackrate': 0.1, 'droprate': 0.1, 'garbagerate': 0.1}])
+def test_sendmany_confirms_only_stored_packets(faulty, window, faults):
+    sim, ld = faulty(**faults)
+    report = ld.sendmany(packets(), window=window, retries=10)
+    assert sim.stats['dropped'] + sim.stats['garbage'] > 0
+    assert set(report.values()) == {RESPONSE_ACK}
+    assert all(stored(sim, name) for name in report)
+
+
+def test_sendmany_gives_up_after_retries(faulty):
+    sim, ld = faulty(droprate=1.0)
+    report = ld.sendmany(packets()[:3], window=2, retries=2)
+    assert report == {'L1PA': RESPONSE_TIMEOUT, 'L1PB': RESPONSE_TIMEOUT, 'L1PC': RESPONSE_TIMEOUT}
+    assert sim.stats['frames'] == 3 * 3
+
+
+def test_sendmany_reports_progress(faulty):
+    sim, ld = faulty(nackrate=0.3)
+    calls = []
+    report = ld.sendmany(packets(), window=4, retries=10, progress=lambda *args: calls.append(args))
+    assert len(calls) == sim.stats['frames']
+    assert [(name, result) for name, result, done, total in calls if result == RESPONSE_NACK]
+    # the first attempt counts all packets, the resends only the failed ones
+    assert calls[len(PAGES) - 1][2:] == (len(PAGES), len(PAGES))
+    assert calls[-1][2] == calls[-1][3] < len(PAGES)
+    assert calls[-1][1] == report[calls[-1][0]] == RESPONSE_ACK
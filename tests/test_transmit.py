@@ -0,0 +1,53 @@
+import time
+import sixleds
+from sixleds import sixleds_transmit
+
+
+def message(sim, slot):
+    return sim.pages[('1', slot)].rpartition('>')[2]
+
+
+def test_swaps_queued_one_after_another(display):
+    sim, ld = display
+    ld.updateline('B', 'first')
+    ld.pushchanges(swap=False)
+    assert ld.defaultrunpage('B')
+    assert ld.doublebuffer('B', 'Z')
+    sim.latency = 0.05
+
+    tx = sixleds_transmit.transmitter(ld)
+    tx.start()
+    try:
+        first = tx.updateline('B', 'second')
+        # the first swap is in flight, the second one must take the other slot
+        time.sleep(0.02)
+        second = tx.updateline('B', 'third')
+        assert first[-1].wait(5) == sixleds.RESPONSE_ACK
+        assert second[-1].wait(5) == sixleds.RESPONSE_ACK
+    finally:
+        tx.stop()
+    assert message(sim, 'Z') == 'second'
+    assert message(sim, 'B') == 'third'
+    assert sim.defaultPage == 'B'
+    assert second[-1].report['RP'] == sixleds.RESPONSE_ACK
+
+
+def test_swap_superseded_while_queued(display):
+    sim, ld = display
+    ld.updateline('B', 'first')
+    ld.pushchanges(swap=False)
+    assert ld.defaultrunpage('B')
+    assert ld.doublebuffer('B', 'Z')
+
+    tx = sixleds_transmit.transmitter(ld)
+    first = tx.updateline('B', 'second')
+    second = tx.updateline('B', 'third')
+    tx.start()
+    try:
+        assert first[-1].wait(5) == sixleds.RESPONSE_SUPERSEDED
+        assert second[-1].wait(5) == sixleds.RESPONSE_ACK
+    finally:
+        tx.stop()
+    assert message(sim, 'Z') == 'third'
+    assert message(sim, 'B') == 'first'
+    assert sim.defaultPage == 'Z'